@@ -0,0 +1,303 @@
+import argparse
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import zipfile
+from collections import Counter, defaultdict
+from functools import partial
+from androguard.core import api_specific_resources
+from androguard.core.bytecodes.axml import AXMLPrinter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Common"))
+from pipeline_metrics import PipelineMetrics
+from job_scheduler import JobScheduler
+from inventory_store import STORE_PATH, InventoryStore
+from perms_analysis import PermissionAnalyzer, extract_version_number
+
+# Static API-usage scan of classes*.dex: only the DEX index tables (strings, types, protos and
+# method ids) are read, so an app costs a few table walks instead of a full androguard analysis.
+# Every framework method an app references is looked up in androguard's API -> permission mapping
+# and compared with the permissions the manifest declares.
+
+DEX_MAGIC = b"dex\n"
+CLASSES_DEX = re.compile(r"^classes\d*\.dex$")
+MANIFEST = "AndroidManifest.xml"
+ANDROID_NS = "{http://schemas.android.com/apk/res/android}"
+HEADER = struct.Struct("<56x2I2I2I8x2I")  # string_ids, type_ids, proto_ids, (field_ids skipped), method_ids: (size, off)
+SERVER_PREFIX = "Lcom/android/server/"
+# Enforced through group ids and the filesystem rather than by an API check, so DEX references
+# can't tell whether they are used
+NON_API_PERMISSIONS = {"android.permission.INTERNET", "android.permission.READ_EXTERNAL_STORAGE",
+                       "android.permission.WRITE_EXTERNAL_STORAGE"}
+# Methods androguard's mapping misses or maps to an unrelated permission (e.g. getDeviceId(int) to
+# ACCESS_NETWORK_STATE), with the permission the SDK documents. Only permissions the mapping
+# already judges, so these can clear "unused" verdicts but never add new ones.
+DOCUMENTED_PERMISSIONS = {
+    "Landroid/telephony/TelephonyManager;-getDeviceId": ["android.permission.READ_PHONE_STATE"],
+    "Landroid/telephony/TelephonyManager;-getImei": ["android.permission.READ_PHONE_STATE"],
+    "Landroid/telephony/TelephonyManager;-getSubscriberId": ["android.permission.READ_PHONE_STATE"],
+    "Landroid/telephony/TelephonyManager;-getSimSerialNumber": ["android.permission.READ_PHONE_STATE"],
+    "Landroid/telephony/TelephonyManager;-getLine1Number": ["android.permission.READ_PHONE_STATE"],
+    "Landroid/net/wifi/WifiManager;-getScanResults": ["android.permission.ACCESS_WIFI_STATE"],
+}
+DEFAULT_API_LEVEL = 29  # Falls back to the highest mapping androguard ships below it
+REPORT_NAME = "dex_api_usage.json"
+# Rough peak RSS per byte of DEX until job_history.json has real samples
+DEX_RSS_FACTOR = 3
+
+_mappings = {}
+
+def method_key(ref):
+    """
+    "Lcls;-name" of a "Lcls;-name-(params)ret" method reference.
+    """
+    return ref[:ref.rindex("-")]
+
+def load_api_mapping(api_level):
+    """
+    Returns ({"Lcls;-name": {permissions}}, classes in the mapping, permissions that can be judged,
+    level used), cached per process. The mapping often lists only some overloads of a method, so
+    the permissions of all overloads are merged and references are matched without their proto.
+    """
+    if api_level not in _mappings:
+        root = os.path.join(os.path.dirname(api_specific_resources.__file__), "api_permission_mappings")
+        levels = sorted(int(m.group(1)) for m in map(re.compile(r"^permissions_(\d+)\.json$").match, os.listdir(root)) if m)
+        level = max([level for level in levels if level <= api_level] or levels[:1])
+        mapping = defaultdict(set)
+        for key, perms in api_specific_resources.load_permission_mappings(level).items():
+            # System server internals can't be referenced from an app, only the client APIs calling them
+            if not key.startswith(SERVER_PREFIX):
+                mapping[method_key(key)].update(perms)
+        mapped_permissions = {perm for perms in mapping.values() for perm in perms} - NON_API_PERMISSIONS
+        for key, perms in DOCUMENTED_PERMISSIONS.items():
+            mapping[key].update(perm for perm in perms if perm in mapped_permissions)
+        mapping = dict(mapping)
+        classes = {key.split(";-", 1)[0] + ";" for key in mapping}
+        _mappings[api_level] = (mapping, classes, mapped_permissions, level)
+    return _mappings[api_level]
+
+def read_uleb128(data, offset):
+    result = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, offset
+        shift += 7
+
+class DexIndex:
+    """
+    Lazy view of the index tables of one DEX buffer. Strings are only decoded when asked for.
+    """
+    def __init__(self, data):
+        if data[:4] != DEX_MAGIC:
+            raise ValueError("Not a DEX file")
+        self.data = data
+        (strings_size, strings_off, types_size, types_off, protos_size, protos_off,
+         methods_size, methods_off) = HEADER.unpack_from(data)
+        self.string_offsets = struct.unpack_from(f"<{strings_size}I", data, strings_off)
+        self.type_strings = struct.unpack_from(f"<{types_size}I", data, types_off)
+        self.protos_off = protos_off
+        self.methods_size = methods_size
+        self.methods_off = methods_off
+        self.strings = {}
+
+    def string(self, index):
+        value = self.strings.get(index)
+        if value is None:
+            # string_data_item: uleb128 UTF-16 length, then MUTF-8 bytes up to a NUL
+            _, start = read_uleb128(self.data, self.string_offsets[index])
+            end = self.data.find(b"\0", start)
+            value = self.strings[index] = bytes(self.data[start:end]).decode("utf-8", "replace")
+        return value
+
+    def type_name(self, type_index):
+        return self.string(self.type_strings[type_index])
+
+    def proto(self, proto_index):
+        """
+        Returns "(params)return" in the space-separated form of the androguard mappings.
+        """
+        _, return_type, params_off = struct.unpack_from("<3I", self.data, self.protos_off + proto_index * 12)
+        params = []
+        if params_off:
+            count = struct.unpack_from("<I", self.data, params_off)[0]
+            params = [self.type_name(t) for t in struct.unpack_from(f"<{count}H", self.data, params_off + 4)]
+        return f"({' '.join(params)}){self.type_name(return_type)}"
+
+    def method_refs(self, classes=None):
+        """
+        Yields "Lcls;-name-(params)ret" for every method id, defined or referenced, optionally only
+        for methods of the given classes. Names and protos of other classes are never decoded.
+        """
+        class_names = {}
+        end = self.methods_off + self.methods_size * 8
+        for class_index, proto_index, name_index in struct.iter_unpack("<HHI", self.data[self.methods_off:end]):
+            class_name = class_names.get(class_index)
+            if class_name is None:
+                class_name = class_names[class_index] = self.type_name(class_index)
+            if classes is None or class_name in classes:
+                yield f"{class_name}-{self.string(name_index)}-{self.proto(proto_index)}"
+
+def iter_app_dex(app_path):
+    """
+    Yields (name, buffer) for each classes*.dex of an APK or an apps_binaries/<app> folder, one at
+    a time. Extracted DEX files are memory-mapped.
+    """
+    if os.path.isdir(app_path):
+        for name in sorted(os.listdir(app_path)):
+            if CLASSES_DEX.match(name):
+                with open(os.path.join(app_path, name), "rb") as f:
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                        yield name, data
+        return
+    with zipfile.ZipFile(app_path) as zf:
+        for name in sorted(n for n in zf.namelist() if CLASSES_DEX.match(n)):
+            yield name, zf.read(name)
+
+def read_manifest(app_path):
+    if os.path.isdir(app_path):
+        manifest = os.path.join(app_path, MANIFEST)
+        if not os.path.exists(manifest):
+            return None
+        with open(manifest, "rb") as f:
+            return f.read()
+    with zipfile.ZipFile(app_path) as zf:
+        return zf.read(MANIFEST) if MANIFEST in zf.namelist() else None
+
+def declared_permissions(manifest):
+    """
+    Package name and uses-permission entries of a binary AndroidManifest.xml.
+    """
+    xml = AXMLPrinter(manifest).get_xml_obj()
+    permissions = set()
+    for tag in ("uses-permission", "uses-permission-sdk-23"):
+        permissions.update(node.get(ANDROID_NS + "name") for node in xml.iter(tag) if node.get(ANDROID_NS + "name"))
+    return xml.get("package"), sorted(permissions)
+
+def scan_app(app_path, api_level=DEFAULT_API_LEVEL):
+    """
+    Returns the declared permissions, the permissions required by referenced framework APIs, and
+    the declared ones that no referenced API needs. Only permissions that appear in the mapping
+    can be judged; the others (content providers, intents, vendor permissions) are left out.
+    """
+    mapping, classes, mapped_permissions, level = load_api_mapping(api_level)
+
+    manifest = read_manifest(app_path)
+    package, declared = declared_permissions(manifest) if manifest else (None, [])
+    api_calls = defaultdict(set)
+    undeclared = set()
+    dex_files = 0
+    for _, data in iter_app_dex(app_path):
+        dex_files += 1
+        for ref in DexIndex(data).method_refs(classes):
+            perms = mapping.get(method_key(ref))
+            if not perms:
+                continue
+            for perm in perms:
+                api_calls[perm].add(ref)
+            # A mapping entry lists alternatives (e.g. coarse or fine location), any one of them is enough
+            if not perms & set(declared):
+                undeclared.update(perms)
+
+    used = set(api_calls)
+    return {
+        "package_name": package,
+        "dex_files": dex_files,
+        "api_level": level,
+        "declared": declared,
+        "used": {perm: sorted(refs) for perm, refs in sorted(api_calls.items())},
+        # Without DEX code (e.g. odex'd system apps) there are no calls to compare with
+        "unused": sorted(p for p in declared if p in mapped_permissions and p not in used) if dex_files else [],
+        "undeclared": sorted(undeclared),
+    }
+
+def app_size(app_path):
+    if os.path.isdir(app_path):
+        return sum(os.path.getsize(os.path.join(app_path, n)) for n in os.listdir(app_path) if CLASSES_DEX.match(n))
+    return os.path.getsize(app_path)
+
+def find_apps(firmware_path):
+    """
+    One entry per app: the apps_binaries/<app> folder when its DEX files were already extracted,
+    otherwise the APK under apps/.
+    """
+    apps = {}
+    apps_dir = os.path.join(firmware_path, "apps")
+    if os.path.isdir(apps_dir):
+        for name in os.listdir(apps_dir):
+            if name.endswith(".apk"):
+                apps[name[:-4]] = os.path.join(apps_dir, name)
+    binaries_dir = os.path.join(firmware_path, "apps_binaries")
+    if os.path.isdir(binaries_dir):
+        for name in os.listdir(binaries_dir):
+            folder = os.path.join(binaries_dir, name)
+            if os.path.isdir(folder) and any(CLASSES_DEX.match(n) for n in os.listdir(folder)):
+                apps[name] = folder
+    return [apps[name] for name in sorted(apps)]
+
+def dangerous_permissions(permissions):
+    levels = PermissionAnalyzer.DVM_PERMISSIONS["MANIFEST_PERMISSION"]
+    return [p for p in permissions if levels.get(p.rsplit(".", 1)[-1], ("",))[0] == "dangerous"]
+
+def scan_firmware(firmware_path, scheduler, metrics=None, store=None):
+    """
+    Scans every app of a firmware folder and writes REPORT_NAME into it (and the inventory store).
+    """
+    firmware = os.path.basename(os.path.normpath(firmware_path))
+    apps = {}
+    for app_path, result, error, duration in scheduler.run(find_apps(firmware_path)):
+        name = os.path.basename(app_path)
+        apps[name] = {"error": error} if error else result
+        if metrics is not None:
+            metrics.item("dex_api", name, duration, firmware, bytes_read=app_size(app_path), error=error)
+
+    with open(os.path.join(firmware_path, REPORT_NAME), "w") as f:
+        json.dump(apps, f, indent=2)
+    if store is not None:
+        store.replace_api_usage(firmware, apps)
+    return apps
+
+def display_over_privileged(firmware, apps, top=20):
+    flagged = sorted(((name, info) for name, info in apps.items() if info.get("unused")),
+                     key=lambda item: (len(dangerous_permissions(item[1]["unused"])), len(item[1]["unused"])), reverse=True)
+    scanned = sum(1 for info in apps.values() if info.get("dex_files"))
+    print(f"\n{firmware}: {len(apps)} apps, {scanned} with DEX code, {len(flagged)} over-privileged")
+    unused_counts = Counter(perm for _, info in flagged for perm in info["unused"])
+    for perm, count in unused_counts.most_common(10):
+        print(f"  {perm}: declared but unused by {count} apps")
+    for name, info in flagged[:top]:
+        dangerous = dangerous_permissions(info["unused"])
+        print(f"  - {name}: {len(info['unused'])} unused ({len(dangerous)} dangerous): {', '.join(info['unused'])}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Flag apps declaring permissions their DEX code never uses")
+    parser.add_argument("base_path", nargs="?", default=".", help="Folder with the firmware version folders")
+    parser.add_argument("--firmware", action="append", help="Only these firmware folders")
+    parser.add_argument("--api-level", type=int, default=DEFAULT_API_LEVEL, help="API level of the permission mapping")
+    parser.add_argument("--top", type=int, default=20, help="Over-privileged apps listed per firmware")
+    parser.add_argument("--store", default=STORE_PATH, help="Inventory store path ('' to skip)")
+    args = parser.parse_args()
+
+    folders = args.firmware or [item for item in os.listdir(args.base_path)
+                                if item.startswith("q1_v") and os.path.isdir(os.path.join(args.base_path, item))]
+    folders.sort(key=lambda folder: extract_version_number(folder) or 0)
+    level = load_api_mapping(args.api_level)[-1]
+    print(f"Using the API level {level} permission mapping")
+
+    metrics = PipelineMetrics("dex_api_scanner.py")
+    store = InventoryStore(args.store) if args.store else None
+    scheduler = JobScheduler(partial(scan_app, api_level=args.api_level), "dex_scan", DEX_RSS_FACTOR, size_of=app_size)
+    for folder in folders:
+        with metrics.stage("dex_api", folder):
+            apps = scan_firmware(os.path.join(args.base_path, folder), scheduler, metrics, store)
+        display_over_privileged(folder, apps, args.top)
+    if store is not None:
+        store.close()
+
+if __name__ == "__main__":
+    main()
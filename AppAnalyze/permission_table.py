@@ -0,0 +1,177 @@
+import argparse
+import hashlib
+import json
+import os
+import zipfile
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from androguard.core.bytecodes.axml import AXMLPrinter
+
+# Per-firmware permission classification built from the <permission> declarations of the firmware's
+# own framework-res.apk and system APKs, so OEM permissions (com.oculus.*, com.meta.*) and newer AOSP
+# ones get their real protection level instead of falling into "others". The table is cached as
+# JSON in the firmware folder and rebuilt only when the APKs in apps/ change.
+
+TABLE_NAME = "permission_table.json"
+FRAMEWORK_APK = "framework-res.apk"
+MANIFEST = "AndroidManifest.xml"
+ANDROID_NS = "{http://schemas.android.com/apk/res/android}"
+MAX_WORKERS = os.cpu_count() or 4
+CHUNK_SIZE = 16
+
+# protectionLevel: the low 4 bits are the base level, the rest are flags
+PROTECTION_BASE_MASK = 0xF
+PROTECTION_LEVELS = {0: "normal", 1: "dangerous", 2: "signature", 3: "signatureOrSystem", 4: "internal"}
+PROTECTION_FLAGS = {
+    "privileged": 0x10, "development": 0x20, "appop": 0x40, "pre23": 0x80, "installer": 0x100,
+    "verifier": 0x200, "preinstalled": 0x400, "setup": 0x800, "instant": 0x1000, "runtimeOnly": 0x2000,
+    "oem": 0x4000, "vendorPrivileged": 0x8000, "textClassifier": 0x10000, "wellbeing": 0x20000,
+    "documenter": 0x40000, "configurator": 0x80000, "incidentReportApprover": 0x100000,
+    "appPredictor": 0x200000, "companion": 0x800000, "retailDemo": 0x1000000, "recents": 0x2000000,
+    "role": 0x4000000, "knownSigner": 0x8000000,
+}
+PROTECTION_NAMES = {name: level for level, name in PROTECTION_LEVELS.items()}
+PROTECTION_NAMES.update(PROTECTION_FLAGS)
+PROTECTION_NAMES["system"] = PROTECTION_FLAGS["privileged"]
+
+_tables = {}
+
+def parse_protection_level(value):
+    """
+    protectionLevel as an int, from the compiled value ("0x00000012", "18") or source names
+    ("signature|privileged"). Missing means normal.
+    """
+    if not value:
+        return 0
+    try:
+        return int(value, 0)
+    except ValueError:
+        return sum(PROTECTION_NAMES.get(name.strip(), 0) for name in value.split("|"))
+
+def protection_bucket(level):
+    """
+    Maps a protectionLevel to the PermissionAnalyzer categories. signature|privileged is what
+    signatureOrSystem became, and internal permissions are granted like signature ones.
+    """
+    base = PROTECTION_LEVELS.get(level & PROTECTION_BASE_MASK, "others")
+    if base == "signature" and level & PROTECTION_FLAGS["privileged"]:
+        return "signatureOrSystem"
+    if base == "internal":
+        return "signatureOrSystem" if level & PROTECTION_FLAGS["privileged"] else "signature"
+    return base
+
+def protection_flags(level):
+    return [name for name, flag in PROTECTION_FLAGS.items() if level & flag]
+
+def manifest_permissions(apk_path):
+    """
+    Worker: returns (apk name, package, [(permission, protectionLevel, group)]) of the <permission>
+    elements of one APK's manifest.
+    """
+    try:
+        with zipfile.ZipFile(apk_path) as zf:
+            manifest = zf.read(MANIFEST)
+        xml = AXMLPrinter(manifest).get_xml_obj()
+    except Exception as e:
+        print(f"Cannot read the manifest of {apk_path}: {e}")
+        return os.path.basename(apk_path), None, []
+    permissions = []
+    for node in xml.iter("permission"):
+        name = node.get(ANDROID_NS + "name")
+        if name:
+            permissions.append((name, parse_protection_level(node.get(ANDROID_NS + "protectionLevel")),
+                                node.get(ANDROID_NS + "permissionGroup")))
+    return os.path.basename(apk_path), xml.get("package"), permissions
+
+def apps_fingerprint(apk_paths):
+    digest = hashlib.sha256()
+    for path in apk_paths:
+        st = os.stat(path)
+        digest.update(f"{os.path.basename(path)}\0{st.st_size}\0{st.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+def list_apks(firmware_path):
+    """
+    APKs of the firmware, framework-res.apk first: like the package manager, the first definition
+    of a permission wins.
+    """
+    apps_dir = os.path.join(firmware_path, "apps")
+    if not os.path.isdir(apps_dir):
+        return []
+    names = sorted((name for name in os.listdir(apps_dir) if name.endswith(".apk")),
+                   key=lambda name: (not name.endswith(FRAMEWORK_APK), name))
+    return [os.path.join(apps_dir, name) for name in names]
+
+def build_permission_table(firmware_path, max_workers=MAX_WORKERS):
+    """
+    Reads the <permission> declarations of every APK in firmware_path/apps and writes TABLE_NAME.
+    Returns the table: {"fingerprint", "permissions": {name: {bucket, protection_level, flags,
+    group, package, apk}}}.
+    """
+    apk_paths = list_apks(firmware_path)
+    if not any(path.endswith(FRAMEWORK_APK) for path in apk_paths):
+        print(f"No {FRAMEWORK_APK} in {firmware_path}/apps, only the other system APKs are used")
+
+    permissions = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        for apk, package, declared in pool.map(manifest_permissions, apk_paths, chunksize=CHUNK_SIZE):
+            for name, level, group in declared:
+                if name not in permissions:
+                    permissions[name] = {"bucket": protection_bucket(level), "protection_level": level,
+                                         "flags": protection_flags(level), "group": group,
+                                         "package": package, "apk": apk}
+
+    table = {"fingerprint": apps_fingerprint(apk_paths), "permissions": permissions}
+    table_path = os.path.join(firmware_path, TABLE_NAME)
+    with open(table_path + ".tmp", "w") as f:
+        json.dump(table, f, indent=2, sort_keys=True)
+    os.replace(table_path + ".tmp", table_path)
+    print(f"Built {table_path}: {len(permissions)} permissions from {len(apk_paths)} APKs")
+    return table
+
+def load_permission_table(firmware_path, rebuild=False, max_workers=MAX_WORKERS):
+    """
+    Returns the cached table of a firmware folder, rebuilding it when the APKs changed.
+    """
+    table_path = os.path.join(firmware_path, TABLE_NAME)
+    if not rebuild and os.path.exists(table_path):
+        with open(table_path) as f:
+            table = json.load(f)
+        if table.get("fingerprint") == apps_fingerprint(list_apks(firmware_path)):
+            return table
+    return build_permission_table(firmware_path, max_workers)
+
+def classification(table):
+    """
+    {permission name: PermissionAnalyzer category} for O(1) lookups.
+    """
+    return {name: entry["bucket"] for name, entry in table["permissions"].items()}
+
+def read_classification(table_path):
+    """
+    classification() of a cached table file, loaded once per process (for pool workers).
+    """
+    if table_path not in _tables:
+        with open(table_path) as f:
+            _tables[table_path] = classification(json.load(f))
+    return _tables[table_path]
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the permission table of firmware folders")
+    parser.add_argument("folders", nargs="+", help="Firmware folders with an apps/ directory")
+    parser.add_argument("--rebuild", action="store_true", help="Ignore the cached table")
+    args = parser.parse_args()
+
+    for folder in args.folders:
+        table = load_permission_table(folder, args.rebuild)
+        buckets = Counter(entry["bucket"] for entry in table["permissions"].values())
+        namespaces = Counter(name.rsplit(".", 1)[0] for name in table["permissions"])
+        print(f"\n{os.path.basename(os.path.normpath(folder))}: {len(table['permissions'])} permissions")
+        for bucket, count in buckets.most_common():
+            print(f"  {bucket}: {count}")
+        print("  Top namespaces:")
+        for namespace, count in namespaces.most_common(10):
+            print(f"    {namespace}: {count}")
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,34 @@
 from androguard.core.bytecodes import apk
+import argparse
 import os
+import sys
 import json
 import re
+import time
 from datetime import datetime
 from collections import Counter, defaultdict
+from functools import partial
 import matplotlib.pyplot as plt
 import numpy as np
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Common"))
+from pipeline_metrics import PipelineMetrics
+from job_scheduler import JobScheduler
+from permission_table import TABLE_NAME, classification, load_permission_table, read_classification
+from inventory_store import STORE_PATH, InventoryStore
+
+# Rough androguard peak RSS per byte of APK until job_history.json has real samples
+APK_RSS_FACTOR = 8
+
+# Prefixes dropped from permission names in the per-app lists
+PERMISSION_PREFIXES = ("android.permission", "com.oculus.permission")
+
 class PermissionAnalyzer:
-    def __init__(self):
+    def __init__(self, metrics=None, firmware=None, permission_table=None):
+        self.metrics = metrics
+        self.firmware = firmware
+        # {permission: category} of this firmware (permission_table.classification), DVM_PERMISSIONS otherwise
+        self.permission_table = permission_table
         self.reset_permissions()
         self.directory_stats = {
             "total_apps": 0,
@@ -27,41 +47,63 @@ class PermissionAnalyzer:
             "signatureOrSystem": [],
             "others": []
         }
+        # Full permission name -> category, for the inventory store
+        self.categories = {}
 
-    def analyze_directory(self, directory="."):
+    def analyze_directory(self, directory=".", scheduler=None):
         """Analyze all APK files in a directory"""
-        results = {"apps": {}, "directory_summary": None}
         apk_files = [f for f in os.listdir(directory) if f.endswith('.apk')]
         
         if not apk_files:
             print("No APK files found in the specified directory.")
-            return results
+            return {"apps": {}, "directory_summary": None}
             
-        self.directory_stats["total_apps"] = len(apk_files)
         print(f"Found {len(apk_files)} APK files to analyze.")
-        
-        for apk_file in apk_files:
-            print(f"\nAnalyzing {apk_file}...")
-            apk_path = os.path.join(directory, apk_file)
-            try:
-                self.reset_permissions()
-                app_info = self.analyze_apk(apk_path)
-                if app_info:
-                    results["apps"][apk_file] = app_info
-                    self.directory_stats["successful_analyses"] += 1
-                    if app_info["permissions"]["dangerous"]:
-                        self.directory_stats["apps_with_dangerous_perms"] += 1
-                        self.directory_stats["all_dangerous_perms"].update(
-                            app_info["permissions"]["dangerous"]
-                        )
-            except Exception as e:
-                print(f"Error analyzing {apk_file}: {str(e)}")
-                results["apps"][apk_file] = {"error": str(e)}
+        return self.analyze_files([os.path.join(directory, f) for f in apk_files], scheduler)
+
+    def analyze_files(self, apk_paths, scheduler=None):
+        """Analyze APK files as they are produced, e.g. by apk_harvester.harvest_apks,
+        or in parallel with a job_scheduler.JobScheduler running analyze_apk_job"""
+        results = {"apps": {}, "directory_summary": None}
+        outcomes = self.iter_analyses(apk_paths) if scheduler is None else scheduler.run(apk_paths)
+
+        for apk_path, app_info, error, duration in outcomes:
+            apk_file = os.path.basename(apk_path)
+            self.directory_stats["total_apps"] += 1
+            if error is not None:
+                if self.metrics is None:
+                    print(f"Error analyzing {apk_file}: {error}")
+                results["apps"][apk_file] = {"error": error}
                 self.directory_stats["failed_analyses"] += 1
+            elif app_info:
+                results["apps"][apk_file] = app_info
+                self.directory_stats["successful_analyses"] += 1
+                if app_info["permissions"]["dangerous"]:
+                    self.directory_stats["apps_with_dangerous_perms"] += 1
+                    self.directory_stats["all_dangerous_perms"].update(
+                        app_info["permissions"]["dangerous"]
+                    )
+            if self.metrics is not None:
+                self.metrics.item("permissions", apk_file, duration, self.firmware,
+                                  bytes_read=os.path.getsize(apk_path), error=error)
 
         results["directory_summary"] = self.get_directory_summary()
         return results
 
+    def iter_analyses(self, apk_paths):
+        """Analyze APK files one after the other, yielding (path, app_info, error, duration)"""
+        for apk_path in apk_paths:
+            if self.metrics is None:
+                print(f"\nAnalyzing {os.path.basename(apk_path)}...")
+            start = time.perf_counter()
+            app_info, error = None, None
+            try:
+                self.reset_permissions()
+                app_info = self.analyze_apk(apk_path)
+            except Exception as e:
+                error = str(e)
+            yield apk_path, app_info, error, time.perf_counter() - start
+
     def analyze_apk(self, apk_path):
         """Analyze a single APK file"""
         a = apk.APK(apk_path)
@@ -76,28 +118,30 @@ class PermissionAnalyzer:
         
         app_info["permissions"] = self.permissions.copy()
         app_info["permission_summary"] = self.get_permission_summary()
+        app_info["categories"] = dict(self.categories)
         
         return app_info
 
     def analyze_permissions(self, permissions):
         """Categorize permissions"""
         for perm in permissions:
-            if perm.startswith("android.permission"):   
-                permSuffix = perm[len("android.permission") + 1:]
-                if permSuffix in self.DVM_PERMISSIONS["MANIFEST_PERMISSION"]:
-                    permItem = self.DVM_PERMISSIONS["MANIFEST_PERMISSION"][permSuffix]
-                    self.permissions[permItem[0]].append(permSuffix)     
-                else:
-                    self.permissions["others"].append(perm)
-            elif perm.startswith("com.oculus.permission"):
-                permSuffix = perm[len("com.oculus.permission") + 1:]
+            category, name = self.categorize(perm)
+            self.permissions[category].append(name)
+            self.categories[perm] = category
+
+    def categorize(self, perm):
+        """Returns (category, name listed in that category) of a permission"""
+        if self.permission_table is not None and perm in self.permission_table:
+            prefix = next((p for p in PERMISSION_PREFIXES if perm.startswith(p + ".")), None)
+            return self.permission_table[perm], perm[len(prefix) + 1:] if prefix else perm
+        for prefix in PERMISSION_PREFIXES:
+            if perm.startswith(prefix):
+                permSuffix = perm[len(prefix) + 1:]
                 if permSuffix in self.DVM_PERMISSIONS["MANIFEST_PERMISSION"]:
                     permItem = self.DVM_PERMISSIONS["MANIFEST_PERMISSION"][permSuffix]
-                    self.permissions[permItem[0]].append(permSuffix)
-                else:
-                    self.permissions["others"].append(perm)
-            else:
-                self.permissions["others"].append(perm)
+                    return permItem[0], permSuffix
+                return "others", perm
+        return "others", perm
 
     def get_permission_summary(self):
         """Get summary of permission counts by category"""
@@ -730,6 +774,12 @@ class PermissionAnalyzer:
             },
     }
 
+def analyze_apk_job(apk_path, table_path=None):
+    """JobScheduler worker: analyze one APK with a fresh analyzer, using the firmware's
+    permission table when given"""
+    permission_table = read_classification(table_path) if table_path else None
+    return PermissionAnalyzer(permission_table=permission_table).analyze_apk(apk_path)
+
 def extract_version_number(folder_name):
     """Extract version number from folder name"""
     match = re.search(r'q1_v(\d+)', folder_name)
@@ -773,13 +823,15 @@ def display_permission_stats_per_app(version_results):
             print(f"  {ptype.title():<20}: Mean = {mean_val:.2f}, Median = {median_val:.2f}")
 
 
-def analyze_versions(base_path="."):
+def analyze_versions(base_path=".", store_path=STORE_PATH):
     # Get firmware version folders
     items = os.listdir(base_path)
     version_folders = [item for item in items 
                       if item.startswith('q1_v') and os.path.isdir(os.path.join(base_path, item))]
     
     version_results = defaultdict(dict)
+    metrics = PipelineMetrics("perms_analysis.py")
+    store = InventoryStore(store_path) if store_path else None
     
     # Sort folders by version number
     version_folders.sort(key=extract_version_number)
@@ -793,13 +845,28 @@ def analyze_versions(base_path="."):
             print(f"\nAnalyzing firmware version {version_num}...")
             apps_path = os.path.join(base_path, folder, "apps")
             if os.path.exists(apps_path):
+                # Classify with the permissions this firmware itself declares
+                with metrics.stage("permission_table", folder):
+                    permission_table = classification(load_permission_table(os.path.join(base_path, folder)))
+                table_path = os.path.join(base_path, folder, TABLE_NAME)
+                scheduler = JobScheduler(partial(analyze_apk_job, table_path=table_path), "androguard_apk", APK_RSS_FACTOR)
                 # Create a fresh analyzer for each version to avoid accumulation
-                analyzer = PermissionAnalyzer()
-                results = analyzer.analyze_directory(apps_path)
+                analyzer = PermissionAnalyzer(metrics, folder, permission_table)
+                with metrics.stage("permissions", folder):
+                    results = analyzer.analyze_directory(apps_path, scheduler)
                 version_results[version_num] = results
+                if store is not None:
+                    # APKs that failed to analyze only have an "error" entry
+                    rows = [(apk_file, app_info["package_name"], perm, category)
+                            for apk_file, app_info in results["apps"].items() if "error" not in app_info
+                            for perm, category in app_info.get("categories", {}).items()]
+                    store.replace_app_permissions(folder, rows)
             else:
                 print(f"Warning: No apps directory found for version {version_num}")
     
+    if store is not None:
+        store.close()
+
     # Create visualization
     plot_permissions_trend(version_results)
     display_overall_statistics(version_results)
@@ -976,4 +1043,8 @@ def plot_permissions_trend(version_results):
             print("      No other permissions found")
 
 if __name__ == "__main__":
-    analyze_versions()
+    parser = argparse.ArgumentParser(description="Permission analysis of the APKs of every firmware version")
+    parser.add_argument("base_path", nargs="?", default=".", help="Folder with the firmware version folders")
+    parser.add_argument("--store", default=STORE_PATH, help="Inventory store path ('' to skip)")
+    args = parser.parse_args()
+    analyze_versions(args.base_path, args.store)
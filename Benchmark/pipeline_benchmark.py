@@ -0,0 +1,397 @@
+import argparse
+import glob
+import json
+import os
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from importlib.machinery import SourceFileLoader
+from importlib.util import module_from_spec, spec_from_loader
+from urllib.parse import quote
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+for component in ("Common", "Scraper", "Extractor", "BinaryAnalyze", "AppAnalyze", "KernelAnalyze"):
+    sys.path.insert(0, os.path.join(REPO_DIR, component))
+from synthetic_firmware import FORMATS, FS_TYPES, generate
+
+# Runs the whole pipeline on synthetic firmware (synthetic_firmware.py) or on a folder of firmware
+# ZIPs: extract (served over a local HTTP server to the streaming extractor of scraper.py --extract),
+# APKs, binaries, APK binaries, checksec, permissions, DEX API scan, kernel config and kernel image
+# analysis. Each stage runs in its own interpreter over all firmware folders, so its
+# peak RSS (its own and that of its worker processes) is measured separately. Throughput is the
+# stage's input bytes over its wall time. Results are compared with a saved baseline and any stage
+# slower or bigger than the tolerance allows fails the run.
+
+WORK_DIR = " "
+BASELINE_PATH = "benchmark_baseline.json"
+TOLERANCE = 0.2  # Allowed relative drop in throughput / growth in peak RSS
+STAGES = ["extract", "apks", "binaries", "apk_binaries", "checksec", "permissions", "dex_api",
+          "kernel_config", "kernel_image"]
+PARTITIONS = ("system", "vendor", "product", "odm")
+MAX_WORKERS = os.cpu_count() or 4
+
+APK_HARVESTER = os.path.join(REPO_DIR, "Extractor", "apk_harvester.py")
+# binaries_extractor.sh is a Python script, its folder map is read from it rather than copied
+BINARIES_EXTRACTOR = os.path.join(REPO_DIR, "Extractor", "binaries_extractor.sh")
+
+def binaries_extractor():
+    """
+    Imports binaries_extractor.sh, which is a Python script despite its extension.
+    """
+    if "binaries_extractor" not in sys.modules:
+        loader = SourceFileLoader("binaries_extractor", BINARIES_EXTRACTOR)
+        module = module_from_spec(spec_from_loader("binaries_extractor", loader))
+        loader.exec_module(module)
+        sys.modules["binaries_extractor"] = module
+    return sys.modules["binaries_extractor"]
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    """
+    Static file handler that answers Range requests like firmware mirrors do, so the extract
+    stage reads the central directory first and extracts members while downloading.
+    """
+    def log_message(self, format, *args):
+        pass
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return None
+        f = open(path, "rb")
+        size = os.fstat(f.fileno()).st_size
+        start, end = 0, size - 1
+        match = re.fullmatch(r"bytes=(\d*)-(\d*)", self.headers.get("Range", ""))
+        if match and (match[1] or match[2]):
+            if match[1]:
+                start = int(match[1])
+                end = min(int(match[2]), end) if match[2] else end
+            else:
+                start = max(size - int(match[2]), 0)
+            if start > end:
+                f.close()
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return None
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "application/zip")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Last-Modified", self.date_time_string(int(os.fstat(f.fileno()).st_mtime)))
+        self.end_headers()
+        f.seek(start)
+        self.remaining = end - start + 1
+        return f
+
+    def copyfile(self, source, outputfile):
+        while self.remaining:
+            data = source.read(min(self.remaining, 1024 * 1024))
+            if not data:
+                break
+            outputfile.write(data)
+            self.remaining -= len(data)
+
+def tree_size(paths):
+    """
+    Total size of files and directory trees, holes of sparse images excluded.
+    """
+    total = 0
+    for path in paths:
+        if os.path.isfile(path):
+            total += min(os.path.getsize(path), os.stat(path).st_blocks * 512)
+        for root, _, files in os.walk(path):
+            total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total
+
+def partition_images(folder):
+    return [path for path in (os.path.join(folder, f"{p}.img") for p in PARTITIONS) if os.path.isfile(path)]
+
+def app_files(folder):
+    return sorted(glob.glob(os.path.join(folder, "apps", "*.apk")))
+
+def stage_extract(zips_dir, firmware_root, payload_extractor=None):
+    """
+    firmware_extractor.sh steps 1 and 2 as scraper.py --extract runs them: every ZIP of zips_dir is
+    downloaded from a local HTTP server by StreamingExtractor, which extracts and converts the OTA
+    members while the ZIP is still downloading.
+    """
+    from stream_pipeline import EXTRACTED_MARKER, StreamingExtractor
+
+    zips = sorted(glob.glob(os.path.join(zips_dir, "*.zip")))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(RangeRequestHandler, directory=zips_dir))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        urls = [f"http://127.0.0.1:{server.server_port}/{quote(os.path.basename(path))}" for path in zips]
+        StreamingExtractor(firmware_root, payload_extractor=payload_extractor).download_all(urls)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    for zip_path in zips:
+        folder = os.path.join(firmware_root, os.path.basename(zip_path)[:-len(".zip")])
+        if not os.path.isfile(os.path.join(folder, EXTRACTED_MARKER)):
+            raise RuntimeError(f"Extraction of {zip_path} failed, see the log above")
+        if os.path.isfile(os.path.join(folder, "payload.bin")) and not payload_extractor:
+            raise RuntimeError(f"{zip_path} has a payload.bin, use --payload-extractor")
+    return tree_size(zips), len(zips)
+
+def stage_apks(folders):
+    """
+    firmware_extractor.sh step 3: apk_harvester.py over the firmware folders.
+    """
+    size = sum(tree_size(partition_images(folder)) for folder in folders)
+    subprocess.run([sys.executable, APK_HARVESTER] + folders, check=True, stdout=sys.stderr)
+    return size, sum(len(app_files(folder)) for folder in folders)
+
+def copy_image_binaries(folder, image_type):
+    """
+    binaries_extractor.sh without mount or root: copies the image's binary folders into
+    binary/binary_<image_type>/. Returns (files, bytes).
+    """
+    from fs_image import open_image
+
+    folders_to_copy = binaries_extractor().FOLDERS_TO_COPY
+    image_file = os.path.join(folder, f"{image_type}.img")
+    if not os.path.isfile(image_file):
+        return 0, 0
+    files = copied = 0
+    with open_image(image_file) as image:
+        for src_folder, dest_name in folders_to_copy[image_type].items():
+            if image.lookup(src_folder) is None:
+                continue
+            dest_folder = os.path.join(folder, "binary", f"binary_{image_type}", dest_name)
+            for path, ino in image.walk(src_folder):
+                dest = os.path.join(dest_folder, os.path.relpath(path, src_folder))
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                image.extract(ino, dest)
+                files += 1
+                copied += os.path.getsize(dest)
+    return files, copied
+
+def stage_binaries(folders):
+    jobs = [(folder, image_type) for folder in folders for image_type in binaries_extractor().IMAGE_TYPES]
+    with ProcessPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        results = list(pool.map(copy_image_binaries, *zip(*jobs)))
+    return sum(size for _, size in results), sum(files for files, _ in results)
+
+def stage_apk_binaries(folders):
+    from apk_binaries_extractor import extract_firmware_apks
+
+    for folder in folders:
+        extract_firmware_apks(folder)
+    return tree_size(p for folder in folders for p in app_files(folder)), sum(len(app_files(f)) for f in folders)
+
+def stage_checksec(folders):
+    from binary_analyzer import analyze_firmware, iter_files
+
+    files = [path for folder in folders for path in iter_files(os.path.join(folder, "binary"))]
+    with ProcessPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        for folder in folders:
+            analyze_firmware(folder, pool)
+    return tree_size(files), len(files)
+
+def stage_permissions(folders):
+    """
+    perms_analysis.py analyze_versions without the plots: permission table, then every APK
+    under the memory-aware scheduler.
+    """
+    from job_scheduler import JobScheduler
+    from perms_analysis import APK_RSS_FACTOR, PermissionAnalyzer, analyze_apk_job
+    from permission_table import TABLE_NAME, classification, load_permission_table
+
+    for folder in folders:
+        table = classification(load_permission_table(folder, rebuild=True))
+        scheduler = JobScheduler(partial(analyze_apk_job, table_path=os.path.join(folder, TABLE_NAME)),
+                                 "androguard_apk", APK_RSS_FACTOR)
+        PermissionAnalyzer(firmware=os.path.basename(folder), permission_table=table).analyze_directory(
+            os.path.join(folder, "apps"), scheduler)
+    return tree_size(p for folder in folders for p in app_files(folder)), sum(len(app_files(f)) for f in folders)
+
+def stage_dex_api(folders):
+    from dex_api_scanner import DEFAULT_API_LEVEL, DEX_RSS_FACTOR, app_size, find_apps, scan_app, scan_firmware
+    from job_scheduler import JobScheduler
+
+    scheduler = JobScheduler(partial(scan_app, api_level=DEFAULT_API_LEVEL), "dex_scan", DEX_RSS_FACTOR,
+                             size_of=app_size)
+    apps = [app for folder in folders for app in find_apps(folder)]
+    for folder in folders:
+        scan_firmware(folder, scheduler)
+    return sum(app_size(app) for app in apps), len(apps)
+
+def stage_kernel_config(folders):
+    from boot_image import process_firmware
+
+    for folder in folders:
+        process_firmware(folder)
+    boot_images = [os.path.join(folder, name) for folder in folders for name in ("boot.img", "vendor_boot.img")]
+    return tree_size(boot_images), sum(os.path.isfile(path) for path in boot_images)
+
+def stage_kernel_image(folders, cache_path):
+    from kernel_image_analyze import analyze_kernels, find_kernels
+
+    if os.path.exists(cache_path):
+        os.remove(cache_path)
+    kernels = find_kernels(folders)
+    analyze_kernels(folders, cache_path)
+    return tree_size(kernels.values()), len(kernels)
+
+def run_stage(stage, work_dir, payload_extractor=None):
+    """
+    Runs one stage over every firmware folder of work_dir in this process and returns its
+    measurements. Peak RSS covers this process and, separately, its largest worker.
+    """
+    firmware_root = os.path.join(work_dir, "firmware")
+    folders = sorted(path for path in glob.glob(os.path.join(firmware_root, "*")) if os.path.isdir(path))
+    start = time.perf_counter()
+    if stage == "extract":
+        shutil.rmtree(firmware_root, ignore_errors=True)
+        os.makedirs(firmware_root)
+        size, items = stage_extract(os.path.join(work_dir, "zips"), firmware_root, payload_extractor)
+    elif stage == "kernel_image":
+        size, items = stage_kernel_image(folders, os.path.join(work_dir, "kernel_image_cache.json"))
+    else:
+        size, items = globals()[f"stage_{stage}"](folders)
+    duration = time.perf_counter() - start
+    # ru_maxrss is in KiB on Linux
+    return {"stage": stage, "duration": round(duration, 3), "items": items, "bytes": size,
+            "mb_per_s": round(size / duration / 1e6, 2) if duration else None,
+            "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "peak_worker_rss_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1)}
+
+def measure_stage(stage, work_dir, payload_extractor=None):
+    """
+    Runs a stage in a fresh interpreter (stage log in work_dir/logs) and returns its measurements,
+    or {"stage", "error"} if it failed.
+    """
+    os.makedirs(os.path.join(work_dir, "logs"), exist_ok=True)
+    command = [sys.executable, os.path.abspath(__file__), work_dir, "--run-stage", stage]
+    if payload_extractor:
+        command += ["--payload-extractor", payload_extractor]
+    env = dict(os.environ, PIPELINE_METRICS=os.path.join(work_dir, "pipeline_metrics.jsonl"),
+               JOB_HISTORY=os.path.join(work_dir, "job_history.json"))
+    with open(os.path.join(work_dir, "logs", f"{stage}.log"), "w") as log:
+        proc = subprocess.run(command, cwd=work_dir, env=env, stdout=subprocess.PIPE, stderr=log, text=True)
+        log.write(proc.stdout)
+    lines = proc.stdout.strip().splitlines()
+    if proc.returncode or not lines:
+        return {"stage": stage, "error": f"exit status {proc.returncode}, see logs/{stage}.log"}
+    return json.loads(lines[-1])
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """
+    Returns the regressions of results against baseline["stages"] as human-readable strings.
+    """
+    regressions = []
+    for result in results:
+        reference = baseline.get("stages", {}).get(result["stage"])
+        if "error" in result:
+            regressions.append(f"{result['stage']}: {result['error']}")
+            continue
+        if not reference:
+            continue
+        if reference.get("mb_per_s") and result["mb_per_s"] < reference["mb_per_s"] * (1 - tolerance):
+            regressions.append(f"{result['stage']}: {result['mb_per_s']} MB/s, baseline {reference['mb_per_s']} MB/s")
+        for key in ("peak_rss_mb", "peak_worker_rss_mb"):
+            if reference.get(key) and result[key] > reference[key] * (1 + tolerance):
+                regressions.append(f"{result['stage']}: {key} {result[key]}, baseline {reference[key]}")
+    return regressions
+
+def print_results(results, baseline):
+    stages = baseline.get("stages", {})
+    print(f"\n{'Stage':<14}{'Time (s)':>10}{'Items':>8}{'MB in':>10}{'MB/s':>10}{'Base MB/s':>11}"
+          f"{'RSS MB':>9}{'Worker MB':>11}")
+    print("=" * 83)
+    for result in results:
+        if "error" in result:
+            print(f"{result['stage']:<14}FAILED: {result['error']}")
+            continue
+        base = stages.get(result["stage"], {}).get("mb_per_s")
+        print(f"{result['stage']:<14}{result['duration']:>10.2f}{result['items']:>8}{result['bytes'] / 1e6:>10.1f}"
+              f"{result['mb_per_s']:>10.2f}{base if base is not None else '-':>11}"
+              f"{result['peak_rss_mb']:>9.1f}{result['peak_worker_rss_mb']:>11.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the firmware pipeline on synthetic firmware")
+    parser.add_argument("work_dir", nargs="?", default=WORK_DIR, help="Scratch directory (zips/, firmware/, logs/)")
+    parser.add_argument("--zips", help="Benchmark these firmware ZIPs instead of generating synthetic ones")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES, help="Stages to run, in pipeline order")
+    parser.add_argument("--payload-extractor", help="OTA payload extractor command, as in firmware_extractor.sh")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline JSON to compare with")
+    parser.add_argument("--save-baseline", action="store_true", help="Write this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="Allowed relative regression")
+    parser.add_argument("--output", help="Also write this run's results as JSON")
+    generator = parser.add_argument_group("synthetic firmware")
+    generator.add_argument("--versions", type=int, default=3)
+    generator.add_argument("--format", choices=FORMATS, default="datbr")
+    generator.add_argument("--fs", choices=FS_TYPES, default="ext4")
+    generator.add_argument("--binaries", type=int, default=200)
+    generator.add_argument("--apps", type=int, default=20)
+    generator.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--run-stage", choices=STAGES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    work_dir = os.path.abspath(args.work_dir)
+
+    if args.run_stage:
+        print(json.dumps(run_stage(args.run_stage, work_dir, args.payload_extractor)))
+        return
+
+    zips_dir = os.path.join(work_dir, "zips")
+    shutil.rmtree(zips_dir, ignore_errors=True)
+    if args.zips:
+        os.makedirs(zips_dir)
+        for zip_path in sorted(glob.glob(os.path.join(args.zips, "*.zip"))):
+            os.symlink(os.path.abspath(zip_path), os.path.join(zips_dir, os.path.basename(zip_path)))
+        corpus = {"zips": os.path.abspath(args.zips)}
+    else:
+        corpus = {"versions": args.versions, "format": args.format, "fs": args.fs, "binaries": args.binaries,
+                  "apps": args.apps, "seed": args.seed}
+        start = time.perf_counter()
+        generate(zips_dir, args.versions, args.format, args.fs, args.binaries, args.apps, seed=args.seed)
+        print(f"Generated {args.versions} firmware versions in {time.perf_counter() - start:.1f}s")
+
+    results = []
+    for stage in STAGES:
+        if stage in args.stages:
+            print(f"Running {stage}...")
+            results.append(measure_stage(stage, work_dir, args.payload_extractor))
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("corpus") != corpus:
+            print(f"Warning: {args.baseline} was recorded on a different corpus: {baseline.get('corpus')}")
+    print_results(results, baseline)
+
+    run = {"corpus": corpus, "cpus": os.cpu_count(), "stages": {r["stage"]: r for r in results}}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(run, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(run, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+        return
+
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"\n{len(regressions)} regressions (tolerance {args.tolerance:.0%}):")
+        for regression in regressions:
+            print(f"  - {regression}")
+        sys.exit(1)
+    print("\nNo regressions" if baseline else "\nNo baseline to compare with, use --save-baseline")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,700 @@
+import argparse
+import collections
+import gzip
+import hashlib
+import lzma
+import os
+import random
+import shutil
+import struct
+import subprocess
+import tempfile
+import zipfile
+import brotli
+
+# Builds synthetic firmware ZIPs shaped like the Oculus/Pico OTAs, so the whole pipeline can run
+# without real firmware or root: ext4 (mke2fs -d) or EROFS (mkfs.erofs, plain or LZ4HC-compressed
+# like shipped images) system/vendor images holding
+# aarch64 ELF binaries and APKs (binary manifest, classes.dex, native libs), a boot.img v0 whose
+# gzipped arm64 kernel carries an IKCONFIG and a kallsyms table, packaged either as
+# *.new.dat.br + *.transfer.list or as an A/B payload.bin. Everything is derived from --seed, so
+# the same arguments always give the same firmware contents; successive versions change a share of
+# the binaries, apps and kernel options like real updates do.
+
+OUTPUT_DIR = " "
+DEVICE = "q1"
+BLOCK_SIZE = 4096
+ZIP_DATE = "01-01-2024"
+FS_TYPES = ("ext4", "erofs", "erofs-lz4hc")
+# mkfs.erofs compression of each EROFS type, erofs-lz4hc exercises the mount fallback of the harvester
+EROFS_COMPRESSION = {"erofs": None, "erofs-lz4hc": "lz4hc"}
+FORMATS = ("datbr", "payload")
+PAYLOAD_CHUNK = 2 * 1024 * 1024  # Bytes per REPLACE_XZ operation, like delta_generator's default
+CHANGED_SHARE = 0.15  # Share of binaries and apps rebuilt from one version to the next
+NEW_SHARE = 0.05
+
+EM_AARCH64 = 183
+ET_EXEC, ET_DYN = 2, 3
+PT_LOAD, PT_DYNAMIC, PT_GNU_STACK, PT_GNU_RELRO = 1, 2, 0x6474E551, 0x6474E552
+SHT_PROGBITS, SHT_STRTAB, SHT_DYNSYM, SHT_DYNAMIC = 1, 3, 11, 6
+DT_NEEDED, DT_STRTAB, DT_SYMTAB, DT_STRSZ, DT_SYMENT, DT_SONAME = 1, 5, 6, 10, 11, 14
+DT_RUNPATH, DT_FLAGS, DT_FLAGS_1 = 29, 30, 0x6FFFFFFB
+DF_BIND_NOW, DF_1_NOW, DF_1_PIE = 0x8, 0x1, 0x08000000
+STT_FUNC, STB_GLOBAL = 2, 1
+SCS_PUSH_INSN = struct.pack("<I", 0xF800865E)
+RUNPATH = "/data/local/tmp"
+
+SHARED_LIBS = ["libc.so", "libm.so", "libdl.so", "liblog.so", "libutils.so", "libcutils.so",
+               "libbinder.so", "libbase.so", "libc++.so", "libz.so", "libcrypto.so", "libssl.so"]
+LIBC_IMPORTS = ["malloc", "free", "memcpy", "memset", "strlen", "strcpy", "strncpy", "snprintf",
+                "sprintf", "read", "write", "open", "close", "ioctl", "pthread_create", "__android_log_print"]
+
+ANDROID_NS = "http://schemas.android.com/apk/res/android"
+PROTECTION_NORMAL, PROTECTION_DANGEROUS, PROTECTION_SIGNATURE, PROTECTION_PRIVILEGED = 0x0, 0x1, 0x2, 0x12
+
+# (permission, protectionLevel) declared by the synthetic framework-res.apk and OEM service
+FRAMEWORK_PERMISSIONS = [
+    ("android.permission.INTERNET", PROTECTION_NORMAL),
+    ("android.permission.ACCESS_NETWORK_STATE", PROTECTION_NORMAL),
+    ("android.permission.ACCESS_WIFI_STATE", PROTECTION_NORMAL),
+    ("android.permission.BLUETOOTH", PROTECTION_NORMAL),
+    ("android.permission.WAKE_LOCK", PROTECTION_NORMAL),
+    ("android.permission.CAMERA", PROTECTION_DANGEROUS),
+    ("android.permission.RECORD_AUDIO", PROTECTION_DANGEROUS),
+    ("android.permission.ACCESS_FINE_LOCATION", PROTECTION_DANGEROUS),
+    ("android.permission.ACCESS_COARSE_LOCATION", PROTECTION_DANGEROUS),
+    ("android.permission.READ_PHONE_STATE", PROTECTION_DANGEROUS),
+    ("android.permission.READ_EXTERNAL_STORAGE", PROTECTION_DANGEROUS),
+    ("android.permission.WRITE_SETTINGS", PROTECTION_SIGNATURE | 0x40),
+    ("android.permission.WRITE_SECURE_SETTINGS", PROTECTION_PRIVILEGED),
+    ("android.permission.INSTALL_PACKAGES", PROTECTION_PRIVILEGED),
+    ("android.permission.MANAGE_USERS", PROTECTION_PRIVILEGED),
+    ("android.permission.READ_LOGS", PROTECTION_PRIVILEGED),
+]
+OEM_PERMISSIONS = [
+    ("com.oculus.permission.HAND_TRACKING", PROTECTION_DANGEROUS),
+    ("com.oculus.permission.EYE_TRACKING", PROTECTION_DANGEROUS),
+    ("com.oculus.permission.ACCESS_MR_SENSOR_DATA", PROTECTION_SIGNATURE),
+    ("com.oculus.permission.DEVICE_CONFIG_PUSH_TO_CLIENT", PROTECTION_PRIVILEGED),
+]
+
+# Framework methods guarded by a permission, and the permission the SDK documents for them. Not all
+# are in androguard's API mapping: getDeviceId() only through its getDeviceId(int) overload and
+# dex_api_scanner.DOCUMENTED_PERMISSIONS, and Camera.open() not at all, so CAMERA is never judged.
+API_CALLS = [
+    ("Landroid/location/LocationManager;", "getLastKnownLocation", ["Ljava/lang/String;"],
+     "Landroid/location/Location;", "android.permission.ACCESS_FINE_LOCATION"),
+    ("Landroid/hardware/Camera;", "open", [], "Landroid/hardware/Camera;", "android.permission.CAMERA"),
+    ("Landroid/net/wifi/WifiManager;", "getScanResults", [], "Ljava/util/List;",
+     "android.permission.ACCESS_WIFI_STATE"),
+    ("Landroid/net/ConnectivityManager;", "getActiveNetworkInfo", [], "Landroid/net/NetworkInfo;",
+     "android.permission.ACCESS_NETWORK_STATE"),
+    ("Landroid/telephony/TelephonyManager;", "getDeviceId", [], "Ljava/lang/String;",
+     "android.permission.READ_PHONE_STATE"),
+    ("Landroid/os/PowerManager$WakeLock;", "acquire", [], "V", "android.permission.WAKE_LOCK"),
+]
+
+KERNEL_BASE = 0xFFFFFF8008080000
+KERNEL_RELEASE = "4.19.157-perf"
+# Kernel options turned on from the given version on, with the symbols they add to kallsyms
+KERNEL_OPTIONS = [
+    ("CONFIG_STACKPROTECTOR", 1, ["__stack_chk_fail", "__stack_chk_guard"]),
+    ("CONFIG_STRICT_KERNEL_RWX", 1, ["mark_rodata_ro"]),
+    ("CONFIG_ARM64_PAN", 1, ["cpu_enable_pan"]),
+    ("CONFIG_RELOCATABLE", 1, ["__rela_start"]),
+    ("CONFIG_RANDOMIZE_BASE", 1, ["kaslr_early_init"]),
+    ("CONFIG_UNMAP_KERNEL_AT_EL0", 1, ["tramp_vectors"]),
+    ("CONFIG_HARDENED_USERCOPY", 2, ["__check_object_size", "usercopy_abort"]),
+    ("CONFIG_SLAB_FREELIST_RANDOM", 2, ["cache_random_seq_create"]),
+    ("CONFIG_VMAP_STACK", 2, ["handle_bad_stack", "overflow_stack"]),
+    ("CONFIG_CFI_CLANG", 3, ["__cfi_check", "__cfi_slowpath"]),
+    ("CONFIG_SHADOW_CALL_STACK", 3, ["scs_alloc", "scs_release"]),
+    ("CONFIG_DEBUG_LIST", 4, ["__list_add_valid"]),
+]
+KERNEL_BASE_OPTIONS = ["CONFIG_ARM64=y", "CONFIG_64BIT=y", "CONFIG_MMU=y", "CONFIG_SMP=y", "CONFIG_IKCONFIG=y",
+                       "CONFIG_IKCONFIG_PROC=y", "CONFIG_MODULES=y", "CONFIG_SECURITY_SELINUX=y"]
+
+def align(buf, alignment):
+    buf.extend(b"\0" * (-len(buf) % alignment))
+
+def string_table(names):
+    """
+    ELF string table: returns (bytes, {name: offset}).
+    """
+    table = bytearray(b"\0")
+    offsets = {}
+    for name in names:
+        if name not in offsets:
+            offsets[name] = len(table)
+            table += name.encode() + b"\0"
+    return bytes(table), offsets
+
+def build_elf(rng, size, soname=None, needed=(), imports=(), exports=(), hardened=True, scs=False, cfi=False):
+    """
+    Minimal dynamically linked aarch64 ELF (PIE executable, or shared library when soname is set)
+    of about size bytes: one PT_LOAD, a dynamic section with DT_NEEDED, dynsym imports/exports and
+    section headers. hardened toggles PIE, NX stack, full RELRO, canary and FORTIFY imports (and
+    a RUNPATH when off), scs adds shadow call stack prologues and cfi the CFI slowpath import.
+    """
+    imports = list(imports)
+    if hardened:
+        imports += ["__stack_chk_fail"] + [f"__{name}_chk" for name in ("memcpy", "strcpy", "snprintf")
+                                           if name in imports]
+    if cfi:
+        imports.append("__cfi_slowpath")
+    symbols = [(name, False) for name in imports] + [(name, True) for name in exports]
+    strings = list(needed) + ([soname] if soname else []) + [RUNPATH] + [name for name, _ in symbols]
+    dynstr, offsets = string_table(strings)
+    shstrtab, shnames = string_table([".text", ".dynstr", ".dynsym", ".dynamic", ".shstrtab"])
+
+    phnum = 4 if hardened else 3
+    text_offset = 64 + 56 * phnum
+    text_offset += -text_offset % 16
+    text = bytearray(rng.randbytes(max(size - text_offset - len(dynstr) - 512, 256)))
+    align(text, 4)
+    if scs:
+        for offset in range(0, len(text) - 4, 256):
+            text[offset:offset + 4] = SCS_PUSH_INSN
+
+    out = bytearray(text_offset) + text
+    dynstr_offset = len(out)
+    out += dynstr
+    align(out, 8)
+    dynsym_offset = len(out)
+    out += bytes(24)
+    for index, (name, exported) in enumerate(symbols):
+        value, shndx = (text_offset + 16 * index, 1) if exported else (0, 0)
+        out += struct.pack("<IBBHQQ", offsets[name], (STB_GLOBAL << 4) | STT_FUNC, 0, shndx, value,
+                           16 if exported else 0)
+    dynsym_size = len(out) - dynsym_offset
+
+    dynamic = [(DT_NEEDED, offsets[name]) for name in needed]
+    if soname:
+        dynamic.append((DT_SONAME, offsets[soname]))
+    dynamic += [(DT_STRTAB, dynstr_offset), (DT_SYMTAB, dynsym_offset), (DT_STRSZ, len(dynstr)),
+                (DT_SYMENT, 24)]
+    if hardened:
+        dynamic += [(DT_FLAGS, DF_BIND_NOW), (DT_FLAGS_1, DF_1_NOW | (0 if soname else DF_1_PIE))]
+    else:
+        dynamic.append((DT_RUNPATH, offsets[RUNPATH]))
+    dynamic.append((0, 0))
+    dynamic_offset = len(out)
+    out += b"".join(struct.pack("<qQ", tag, value) for tag, value in dynamic)
+    dynamic_size = len(out) - dynamic_offset
+    shstrtab_offset = len(out)
+    out += shstrtab
+    align(out, 8)
+
+    sections = [
+        (0, 0, 0, 0, 0, 0, 0, 0),
+        (shnames[".text"], SHT_PROGBITS, 0x6, text_offset, len(text), 0, 16, 0),
+        (shnames[".dynstr"], SHT_STRTAB, 0x2, dynstr_offset, len(dynstr), 0, 1, 0),
+        (shnames[".dynsym"], SHT_DYNSYM, 0x2, dynsym_offset, dynsym_size, 2, 8, 24),
+        (shnames[".dynamic"], SHT_DYNAMIC, 0x3, dynamic_offset, dynamic_size, 2, 8, 16),
+        (shnames[".shstrtab"], SHT_STRTAB, 0, shstrtab_offset, len(shstrtab), 0, 1, 0),
+    ]
+    shoff = len(out)
+    for name, sh_type, flags, offset, sh_size, link, addralign, entsize in sections:
+        out += struct.pack("<IIQQQQIIQQ", name, sh_type, flags, offset, offset, sh_size, link, 0,
+                           addralign, entsize)
+
+    # Everything is in one segment mapped at vaddr == file offset
+    phdrs = [(PT_LOAD, 0x5 if hardened else 0x7, 0, len(out), 0x1000),
+             (PT_DYNAMIC, 0x6, dynamic_offset, dynamic_size, 8),
+             (PT_GNU_STACK, 0x6 if hardened else 0x7, 0, 0, 16)]
+    if hardened:
+        phdrs.append((PT_GNU_RELRO, 0x4, dynamic_offset, dynamic_size, 1))
+    for index, (p_type, flags, offset, p_size, p_align) in enumerate(phdrs):
+        struct.pack_into("<IIQQQQQQ", out, 64 + 56 * index, p_type, flags, offset, offset, offset,
+                         p_size, p_size, p_align)
+
+    e_type = ET_DYN if hardened or soname else ET_EXEC
+    struct.pack_into("<4sBBBB8xHHIQQQIHHHHHH", out, 0, b"\x7fELF", 2, 1, 1, 0, e_type, EM_AARCH64, 1,
+                     text_offset, 64, shoff, 0, 64, 56, len(phdrs), 64, len(sections), len(sections) - 1)
+    return bytes(out)
+
+def uleb128(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        out.append(byte | (0x80 if value else 0))
+        if not value:
+            return bytes(out)
+
+def build_dex(methods):
+    """
+    DEX file with only the string, type, proto and method-id tables filled in, which is all a
+    reference scan reads. methods: (class descriptor, name, [parameter types], return type).
+    """
+    strings = sorted({s for cls, name, params, ret in methods for s in (cls, name, ret, *params)} | {"V"})
+    string_ids = {s: i for i, s in enumerate(strings)}
+    types = sorted({t for cls, _, params, ret in methods for t in (cls, ret, *params)})
+    type_ids = {t: i for i, t in enumerate(types)}
+    protos = sorted({(ret, tuple(params)) for _, _, params, ret in methods})
+    proto_ids = {p: i for i, p in enumerate(protos)}
+
+    strings_offset = 0x70
+    types_offset = strings_offset + 4 * len(strings)
+    protos_offset = types_offset + 4 * len(types)
+    methods_offset = protos_offset + 12 * len(protos)
+    data_offset = methods_offset + 8 * len(methods)
+
+    data = bytearray()
+    type_lists = {}
+    for _, params in protos:
+        if params and params not in type_lists:
+            data.extend(b"\0" * (-(data_offset + len(data)) % 4))
+            type_lists[params] = data_offset + len(data)
+            data += struct.pack("<I", len(params)) + b"".join(struct.pack("<H", type_ids[t]) for t in params)
+    string_offsets = []
+    for s in strings:
+        string_offsets.append(data_offset + len(data))
+        data += uleb128(len(s)) + s.encode() + b"\0"
+
+    body = b"".join(struct.pack("<I", offset) for offset in string_offsets)
+    body += b"".join(struct.pack("<I", string_ids[t]) for t in types)
+    body += b"".join(struct.pack("<III", string_ids["V"], type_ids[ret], type_lists.get(params, 0))
+                     for ret, params in protos)
+    body += b"".join(struct.pack("<HHI", type_ids[cls], proto_ids[(ret, tuple(params))], string_ids[name])
+                     for cls, name, params, ret in methods)
+
+    header = bytearray(0x70)
+    header[:8] = b"dex\n035\0"
+    struct.pack_into("<III", header, 32, 0x70 + len(body) + len(data), 0x70, 0x12345678)
+    struct.pack_into("<8I", header, 56, len(strings), strings_offset, len(types), types_offset,
+                     len(protos), protos_offset, 0, 0)
+    struct.pack_into("<II", header, 88, len(methods), methods_offset)
+    return bytes(header) + body + bytes(data)
+
+def axml_string_pool(strings):
+    offsets, data = [], bytearray()
+    for s in strings:
+        encoded = s.encode()
+        offsets.append(len(data))
+        data += bytes([len(s), len(encoded)]) + encoded + b"\0"
+    align(data, 4)
+    start = 28 + 4 * len(strings)
+    return (struct.pack("<HHIIIIII", 0x1, 28, start + len(data), len(strings), 0, 0x100, start, 0)
+            + b"".join(struct.pack("<I", offset) for offset in offsets) + bytes(data))
+
+def build_manifest(package, uses=(), declares=()):
+    """
+    Binary AndroidManifest.xml with <uses-permission> and <permission android:protectionLevel>
+    elements. declares: (name, protectionLevel).
+    """
+    strings = ["android", ANDROID_NS, "name", "package", "protectionLevel", "manifest", "uses-permission",
+               "permission", package] + list(uses) + [name for name, _ in declares]
+    index = {}
+    for s in strings:
+        index.setdefault(s, len(index))
+    strings = list(index)
+
+    def node(chunk_type, body):
+        return struct.pack("<HHIII", chunk_type, 16, 16 + len(body), 1, 0xFFFFFFFF) + body
+
+    def string_attr(ns, name, value):
+        return struct.pack("<iiiHBBI", ns, index[name], index[value], 8, 0, 0x03, index[value])
+
+    def int_attr(ns, name, value):
+        return struct.pack("<iiiHBBI", ns, index[name], -1, 8, 0, 0x11, value)
+
+    def element(name, attrs):
+        start = node(0x102, struct.pack("<iiHHHHHH", -1, index[name], 20, 20, len(attrs), 0, 0, 0) + b"".join(attrs))
+        return start + node(0x103, struct.pack("<ii", -1, index[name]))
+
+    ns = index[ANDROID_NS]
+    namespace = struct.pack("<ii", index["android"], ns)
+    manifest = element("manifest", [string_attr(-1, "package", package)])
+    children = b"".join(element("uses-permission", [string_attr(ns, "name", p)]) for p in uses)
+    children += b"".join(element("permission", [string_attr(ns, "name", p), int_attr(ns, "protectionLevel", level)])
+                         for p, level in declares)
+    # Children go between the manifest start and end tags
+    end_size = 24
+    chunks = (axml_string_pool(strings) + node(0x100, namespace) + manifest[:-end_size] + children
+              + manifest[-end_size:] + node(0x101, namespace))
+    return struct.pack("<HHI", 0x3, 8, 8 + len(chunks)) + chunks
+
+def build_apk(path, package, uses=(), declares=(), methods=(), native_libs=()):
+    """
+    Writes an APK with a binary manifest, classes.dex and lib/arm64-v8a/<name> native libraries.
+    """
+    dex_methods = list(methods) or [("Ljava/lang/Object;", "<init>", [], "V")]
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("AndroidManifest.xml", build_manifest(package, uses, declares))
+        zf.writestr("classes.dex", build_dex(dex_methods))
+        for name, data in native_libs:
+            zf.writestr(f"lib/arm64-v8a/{name}", data)
+
+def kallsyms_blob(symbols, base=KERNEL_BASE):
+    """
+    kallsyms tables as linked into a 4.19 arm64 kernel with CONFIG_KALLSYMS_BASE_RELATIVE: offsets,
+    relative base, num_syms, token-compressed names, markers, token table and token index.
+    symbols: sorted (address, type, name).
+    """
+    names = [(kind + name).encode() for _, kind, name in symbols]
+    tokens = [None] * 256
+    for byte in {c for name in names for c in name}:
+        tokens[byte] = bytes([byte])
+    pairs = collections.Counter(name[i:i + 2] for name in names for i in range(len(name) - 1))
+    free = [i for i in range(256) if tokens[i] is None]
+    for (pair, _), slot in zip(pairs.most_common(len(free)), free):
+        tokens[slot] = pair
+    tokens = [token or b"\x01" for token in tokens]
+    lookup = {token: i for i, token in enumerate(tokens) if len(token) == 2}
+
+    blob = bytearray(b"".join(struct.pack("<I", address - base) for address, _, _ in symbols))
+    align(blob, 8)
+    blob += struct.pack("<Q", base) + struct.pack("<I", len(symbols))
+    align(blob, 8)
+    markers, encoded_names = [], bytearray()
+    for i, name in enumerate(names):
+        if i % 256 == 0:
+            markers.append(len(encoded_names))
+        encoded, pos = bytearray(), 0
+        while pos < len(name):
+            if name[pos:pos + 2] in lookup:
+                encoded.append(lookup[name[pos:pos + 2]])
+                pos += 2
+            else:
+                encoded.append(name[pos])
+                pos += 1
+        encoded_names += bytes([len(encoded)]) + encoded
+    blob += encoded_names
+    align(blob, 8)
+    blob += b"".join(struct.pack("<I", marker) for marker in markers)
+    align(blob, 8)
+    token_offsets, token_table = [], bytearray()
+    for token in tokens:
+        token_offsets.append(len(token_table))
+        token_table += token + b"\0"
+    blob += token_table
+    align(blob, 8)
+    blob += b"".join(struct.pack("<H", offset) for offset in token_offsets)
+    return bytes(blob)
+
+def kernel_options(version):
+    return [(option, symbols) for option, since, symbols in KERNEL_OPTIONS if version >= since]
+
+def build_kernel(rng, version, code_size=4 * 1024 * 1024, nsyms=20000):
+    """
+    gzipped arm64 Image: Image header, code (with SCS prologues when enabled), the IKCONFIG
+    blob, the kallsyms tables and the linux_banner.
+    """
+    enabled = kernel_options(version)
+    config = "\n".join(["#", "# Automatically generated file; DO NOT EDIT.",
+                        f"# Linux/arm64 {KERNEL_RELEASE} Kernel Configuration", "#"] + KERNEL_BASE_OPTIONS + [f"{option}=y" for option, _ in enabled]
+                       + [f"# {option} is not set" for option, since, _ in KERNEL_OPTIONS if version < since]) + "\n"
+    names = sorted({f"func_{rng.getrandbits(32):08x}_{i}" for i in range(nsyms)}
+                   | {symbol for _, symbols in enabled for symbol in symbols}
+                   | {"start_kernel", "_text", "_etext", "printk"})
+    symbols = [(KERNEL_BASE + 16 * i, "t" if i % 3 == 0 else "T", name) for i, name in enumerate(names)]
+
+    image = bytearray(struct.pack("<II6Q4sI", 0x91005A4D, 0x14000000, 0x80000, 0, 0xA, 0, 0, 0, b"ARM\x64", 0x40))
+    code = bytearray(rng.randbytes(code_size))
+    if any(option == "CONFIG_SHADOW_CALL_STACK" for option, _ in enabled):
+        for offset in range(0, code_size, 1024):
+            code[offset:offset + 4] = SCS_PUSH_INSN
+    image += code
+    image += b"IKCFG_ST" + gzip.compress(config.encode(), mtime=0) + b"IKCFG_ED"
+    align(image, 8)
+    image += kallsyms_blob(symbols)
+    image += (f"\0Linux version {KERNEL_RELEASE} (build@synthetic) (clang version 11.0.2) "
+              f"#1 SMP PREEMPT v{version}\n\0").encode()
+    return gzip.compress(bytes(image), compresslevel=6, mtime=0)
+
+def build_boot_image(kernel, ramdisk, page_size=BLOCK_SIZE):
+    """
+    boot.img with header v0: header page, kernel and ramdisk each padded to the page size.
+    """
+    header = bytearray(page_size)
+    struct.pack_into("<8s10I", header, 0, b"ANDROID!", len(kernel), 0x80008000, len(ramdisk), 0x81000000,
+                     0, 0x80F00000, 0x80000100, page_size, 0, 0)
+    cmdline = b"console=ttyMSM0,115200n8 androidboot.hardware=synthetic"
+    header[64:64 + len(cmdline)] = cmdline
+    body = bytearray(header)
+    for section in (kernel, ramdisk):
+        body += section
+        align(body, page_size)
+    return bytes(body)
+
+def make_image(staging, image_path, fs_type, label):
+    """
+    Builds a read-only partition image from a staging directory without root.
+    """
+    if fs_type in EROFS_COMPRESSION:
+        if not shutil.which("mkfs.erofs"):
+            raise RuntimeError("mkfs.erofs not found (erofs-utils)")
+        compression = EROFS_COMPRESSION[fs_type]
+        subprocess.run(["mkfs.erofs", "-T0", "--all-root"] + ([f"-z{compression}"] if compression else []) +
+                       [image_path, staging], check=True, stdout=subprocess.DEVNULL)
+        return
+    used = sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(staging) for name in files)
+    blocks = used * 5 // 4 // BLOCK_SIZE + 4096
+    with open(image_path, "wb") as f:
+        f.truncate(blocks * BLOCK_SIZE)
+    subprocess.run(["mke2fs", "-q", "-F", "-t", "ext4", "-b", str(BLOCK_SIZE), "-L", label, "-O", "^has_journal",
+                    "-E", "root_owner=0:0", "-d", staging, image_path, str(blocks)], check=True)
+
+def block_ranges(blocks):
+    """
+    Sorted block numbers to [start, end) ranges.
+    """
+    ranges = []
+    for block in blocks:
+        if ranges and ranges[-1][1] == block:
+            ranges[-1][1] += 1
+        else:
+            ranges.append([block, block + 1])
+    return ranges
+
+def range_string(ranges):
+    values = [str(v) for r in ranges for v in r]
+    return ",".join([str(len(values))] + values)
+
+def write_dat_br(image_path, output_dir, partition):
+    """
+    Writes <partition>.new.dat.br and a v4 <partition>.transfer.list: non-zero blocks as 'new',
+    the rest as 'zero', the whole partition 'erase'd first like a full OTA.
+    """
+    total = os.path.getsize(image_path) // BLOCK_SIZE
+    zero_block = bytes(BLOCK_SIZE)
+    data_blocks = []
+    compressor = brotli.Compressor(quality=5)
+    with open(image_path, "rb") as src, open(os.path.join(output_dir, f"{partition}.new.dat.br"), "wb") as out:
+        for block in range(total):
+            data = src.read(BLOCK_SIZE)
+            if data != zero_block:
+                data_blocks.append(block)
+                out.write(compressor.process(data))
+        out.write(compressor.finish())
+    new = block_ranges(data_blocks)
+    zero = block_ranges(sorted(set(range(total)) - set(data_blocks)))
+    lines = ["4", str(len(data_blocks)), "0", "0", f"erase {range_string([[0, total]])}"]
+    if zero:
+        lines.append(f"zero {range_string(zero)}")
+    lines.append(f"new {range_string(new)}")
+    with open(os.path.join(output_dir, f"{partition}.transfer.list"), "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+def pb_field(number, value):
+    """
+    One protobuf field: ints as varints, bytes/str as length-delimited.
+    """
+    if isinstance(value, int):
+        return uleb128(number << 3) + uleb128(value)
+    if isinstance(value, str):
+        value = value.encode()
+    return uleb128(number << 3 | 2) + uleb128(len(value)) + value
+
+def write_payload(images, payload_path):
+    """
+    Writes an A/B OTA payload.bin (CrAU v2, DeltaArchiveManifest) carrying full images with
+    REPLACE_XZ operations, and ZERO operations for all-zero chunks. images: {partition: path}.
+    """
+    REPLACE_XZ, ZERO = 8, 6
+    blobs = []
+    data_offset = 0
+    partitions = b""
+    for partition, image_path in images.items():
+        size = os.path.getsize(image_path)
+        operations = b""
+        digest = hashlib.sha256()
+        with open(image_path, "rb") as f:
+            start = 0
+            while start < size:
+                chunk = f.read(PAYLOAD_CHUNK)
+                digest.update(chunk)
+                padded = chunk + bytes(-len(chunk) % BLOCK_SIZE)
+                extent = pb_field(1, start // BLOCK_SIZE) + pb_field(2, len(padded) // BLOCK_SIZE)
+                if chunk.count(0) == len(chunk):
+                    operations += pb_field(8, pb_field(1, ZERO) + pb_field(6, extent))
+                else:
+                    blob = lzma.compress(padded, format=lzma.FORMAT_XZ, check=lzma.CHECK_CRC64, preset=1)
+                    op = (pb_field(1, REPLACE_XZ) + pb_field(2, data_offset) + pb_field(3, len(blob))
+                          + pb_field(6, extent) + pb_field(8, hashlib.sha256(blob).digest()))
+                    operations += pb_field(8, op)
+                    blobs.append(blob)
+                    data_offset += len(blob)
+                start += len(chunk)
+        info = pb_field(1, size) + pb_field(2, digest.digest())
+        partitions += pb_field(13, pb_field(1, partition) + pb_field(7, info) + operations)
+    manifest = pb_field(3, BLOCK_SIZE) + pb_field(12, 0) + partitions
+    with open(payload_path, "wb") as out:
+        out.write(b"CrAU" + struct.pack(">QQI", 2, len(manifest), 0) + manifest)
+        for blob in blobs:
+            out.write(blob)
+
+class FirmwareModel:
+    """
+    The binaries and apps of a device, evolved from one version to the next.
+    """
+    def __init__(self, seed, binaries, apps, binary_size):
+        self.rng = random.Random(seed)
+        self.binary_size = binary_size
+        self.binaries = {}
+        self.apps = {}
+        self.counter = 0
+        for _ in range(binaries):
+            self.add_binary()
+        for _ in range(apps):
+            self.add_app()
+
+    def add_binary(self):
+        rng = self.rng
+        self.counter += 1
+        partition = rng.choice(["system", "system", "vendor"])
+        is_lib = rng.random() < 0.6
+        name = f"lib{partition[0]}{self.counter:04d}.so" if is_lib else f"{partition[0]}d{self.counter:04d}"
+        folder = "lib64" if is_lib else "bin"
+        path = f"system/{folder}/{name}" if partition == "system" else f"{folder}/{name}"
+        self.binaries[path] = self.binary_spec(partition, name if is_lib else None, hardened=rng.random() < 0.7)
+
+    def binary_spec(self, partition, soname, hardened):
+        rng = self.rng
+        return {"partition": partition, "soname": soname, "hardened": hardened,
+                "scs": hardened and rng.random() < 0.3, "cfi": hardened and rng.random() < 0.4,
+                "seed": rng.getrandbits(32), "size": int(self.binary_size * rng.uniform(0.25, 2.0)),
+                "needed": rng.sample(SHARED_LIBS, rng.randint(1, 4)),
+                "imports": rng.sample(LIBC_IMPORTS, rng.randint(3, 10))}
+
+    def add_app(self):
+        rng = self.rng
+        self.counter += 1
+        name = f"App{self.counter:04d}"
+        calls = rng.sample(API_CALLS, rng.randint(0, 3))
+        declared = {permission for *_, permission in calls if rng.random() < 0.8}
+        pool = [name for name, _ in FRAMEWORK_PERMISSIONS + OEM_PERMISSIONS]
+        declared |= set(rng.sample(pool, rng.randint(0, 5)))
+        self.apps[name] = {"partition": rng.choice(["system", "system", "vendor"]),
+                           "priv": rng.random() < 0.3, "package": f"com.synthetic.{name.lower()}",
+                           "uses": sorted(declared), "calls": calls,
+                           "native": rng.random() < 0.4, "seed": rng.getrandbits(32)}
+
+    def next_version(self):
+        """
+        Rebuilds CHANGED_SHARE of the binaries (some gaining hardening), adds new ones, and
+        reworks a share of the apps.
+        """
+        rng = self.rng
+        for path in rng.sample(sorted(self.binaries), int(len(self.binaries) * CHANGED_SHARE)):
+            spec = self.binaries[path]
+            spec.update(seed=rng.getrandbits(32), hardened=spec["hardened"] or rng.random() < 0.5)
+            spec["scs"] = spec["hardened"] and (spec["scs"] or rng.random() < 0.3)
+            spec["cfi"] = spec["hardened"] and (spec["cfi"] or rng.random() < 0.3)
+        for _ in range(max(1, int(len(self.binaries) * NEW_SHARE))):
+            self.add_binary()
+        for name in rng.sample(sorted(self.apps), int(len(self.apps) * CHANGED_SHARE)):
+            app = self.apps[name]
+            extra = rng.choice(FRAMEWORK_PERMISSIONS + OEM_PERMISSIONS)[0]
+            app.update(uses=sorted(set(app["uses"]) | {extra}), seed=rng.getrandbits(32))
+        for _ in range(max(1, int(len(self.apps) * NEW_SHARE))):
+            self.add_app()
+
+    def populate(self, staging):
+        """
+        Writes the files of the current version under staging/<partition>/.
+        """
+        for path, spec in self.binaries.items():
+            dest = os.path.join(staging, spec["partition"], path)
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            with open(dest, "wb") as f:
+                f.write(build_elf(random.Random(spec["seed"]), spec["size"], spec["soname"], spec["needed"],
+                                  spec["imports"], ["JNI_OnLoad"] if spec["soname"] else [],
+                                  spec["hardened"], spec["scs"], spec["cfi"]))
+        for name, app in self.apps.items():
+            folder = "priv-app" if app["priv"] else "app"
+            app_dir = os.path.join(staging, app["partition"], "system" if app["partition"] == "system" else "",
+                                   folder, name)
+            os.makedirs(app_dir, exist_ok=True)
+            rng = random.Random(app["seed"])
+            methods = [(cls, method, params, ret) for cls, method, params, ret, _ in app["calls"]]
+            methods += [(f"Lcom/synthetic/{name.lower()}/C{i};", f"m{i}", [], "V") for i in range(rng.randint(5, 50))]
+            native = []
+            if app["native"]:
+                native.append((f"lib{name.lower()}.so", build_elf(rng, self.binary_size // 2, f"lib{name.lower()}.so",
+                                                                  ["libc.so", "liblog.so"], ["strcpy", "malloc"],
+                                                                  ["JNI_OnLoad"], rng.random() < 0.5)))
+            build_apk(os.path.join(app_dir, f"{name}.apk"), app["package"], app["uses"], methods=methods,
+                      native_libs=native)
+
+        framework = os.path.join(staging, "system", "system", "framework")
+        os.makedirs(framework, exist_ok=True)
+        build_apk(os.path.join(framework, "framework-res.apk"), "android", declares=FRAMEWORK_PERMISSIONS)
+        oem = os.path.join(staging, "system", "system", "priv-app", "OculusSystemService")
+        os.makedirs(oem, exist_ok=True)
+        build_apk(os.path.join(oem, "OculusSystemService.apk"), "com.oculus.systemservice",
+                  declares=OEM_PERMISSIONS)
+        for partition in ("system", "vendor"):
+            os.makedirs(os.path.join(staging, partition), exist_ok=True)
+        with open(os.path.join(staging, "system", "system", "build.prop"), "w") as f:
+            f.write("ro.product.device=synthetic\n")
+
+def generate_firmware(model, version, output_dir, fmt="datbr", fs_type="ext4", device=DEVICE, date=ZIP_DATE):
+    """
+    Builds the images of the model's current version and packs them into
+    <device>_v<version>_<date>.zip. Returns the ZIP path.
+    """
+    zip_path = os.path.join(output_dir, f"{device}_v{version}_{date}.zip")
+    with tempfile.TemporaryDirectory(dir=output_dir) as work:
+        staging = os.path.join(work, "staging")
+        model.populate(staging)
+        images = {}
+        for partition in ("system", "vendor"):
+            images[partition] = os.path.join(work, f"{partition}.img")
+            make_image(os.path.join(staging, partition), images[partition], fs_type, partition)
+        images["boot"] = os.path.join(work, "boot.img")
+        with open(images["boot"], "wb") as f:
+            f.write(build_boot_image(build_kernel(random.Random(model.rng.getrandbits(32)), version),
+                                     gzip.compress(b"070701" + bytes(1024), mtime=0)))
+
+        members = []
+        if fmt == "payload":
+            write_payload(images, os.path.join(work, "payload.bin"))
+            members.append("payload.bin")
+        else:
+            for partition in ("system", "vendor"):
+                write_dat_br(images[partition], work, partition)
+                members += [f"{partition}.new.dat.br", f"{partition}.transfer.list"]
+            members.append("boot.img")
+
+        with zipfile.ZipFile(zip_path + ".tmp", "w", zipfile.ZIP_STORED) as zf:
+            for member in members:
+                zf.write(os.path.join(work, member), member)
+            zf.writestr("META-INF/com/android/metadata", f"post-build={device}/v{version}\nota-type=AB\n")
+    os.replace(zip_path + ".tmp", zip_path)
+    print(f"Generated {zip_path} ({os.path.getsize(zip_path)} bytes, {fmt}, {fs_type})")
+    return zip_path
+
+def generate(output_dir, versions=3, fmt="datbr", fs_type="ext4", binaries=200, apps=20,
+             binary_size=64 * 1024, seed=0, device=DEVICE):
+    """
+    Generates versions 1..versions of one device. Returns the ZIP paths.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    model = FirmwareModel(seed, binaries, apps, binary_size)
+    zips = []
+    for version in range(1, versions + 1):
+        if version > 1:
+            model.next_version()
+        zips.append(generate_firmware(model, version, output_dir, fmt, fs_type, device))
+    return zips
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic firmware ZIPs")
+    parser.add_argument("output", nargs="?", default=OUTPUT_DIR, help="Directory for the ZIPs")
+    parser.add_argument("--versions", type=int, default=3, help="Number of successive versions")
+    parser.add_argument("--format", choices=FORMATS, default="datbr",
+                        help="*.new.dat.br + transfer.list, or payload.bin")
+    parser.add_argument("--fs", choices=FS_TYPES, default="ext4", help="Partition filesystem")
+    parser.add_argument("--binaries", type=int, default=200, help="ELF binaries in the first version")
+    parser.add_argument("--apps", type=int, default=20, help="APKs in the first version")
+    parser.add_argument("--binary-size", type=int, default=64 * 1024, help="Average ELF size in bytes")
+    parser.add_argument("--device", default=DEVICE, help="Device prefix of the ZIP names")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    generate(args.output, args.versions, args.format, args.fs, args.binaries, args.apps,
+             args.binary_size, args.seed, args.device)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import csv
+import glob
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from elf_hardening import analyze_file, checksec_row
+
+# Set PATHS
+ROOT_DIR = " "
+FIRMWARE_GLOB = "q1_v*"
+MAX_WORKERS = os.cpu_count() or 4
+CHUNK_SIZE = 64  # Files handed to a worker at once, keeps IPC overhead low for small binaries
+
+def iter_files(binary_folder):
+    """
+    Regular files except CSV reports, like find -type f: symlinks such as toybox applets are skipped.
+    """
+    for root, _, files in os.walk(binary_folder):
+        for name in files:
+            path = os.path.join(root, name)
+            if not name.endswith(".csv") and not os.path.islink(path):
+                yield path
+
+def analyze_firmware(firmware_folder, pool):
+    """
+    Writes <firmware>_checksec_report.csv with the same rows as binary_analyzer.sh, ELF files only.
+    """
+    firmware_name = os.path.basename(firmware_folder)
+    binary_folder = os.path.join(firmware_folder, "binary")
+    if not os.path.isdir(binary_folder):
+        print(f"Skipping {firmware_name} - No binary folder found.")
+        return
+
+    output_file = os.path.join(binary_folder, f"{firmware_name}_checksec_report.csv")
+    analyzed = errors = 0
+    with open(output_file, "w", newline="") as f:
+        writer = csv.writer(f)
+        for path, result in pool.map(analyze_file, iter_files(binary_folder), chunksize=CHUNK_SIZE):
+            if result is None:
+                continue
+            if result == "ERROR_PROCESSING":
+                writer.writerow([path, result])
+                print(f"Error processing: {path}")
+                errors += 1
+                continue
+            writer.writerow([path] + checksec_row(result, path))
+            analyzed += 1
+
+    print(f"CSV report saved: {output_file} ({analyzed} ELF files, {errors} errors)")
+
+def main():
+    firmware_folders = sys.argv[1:] or sorted(glob.glob(os.path.join(ROOT_DIR, FIRMWARE_GLOB)))
+    with ProcessPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        for firmware_folder in firmware_folders:
+            if os.path.isdir(firmware_folder):
+                analyze_firmware(firmware_folder, pool)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+import argparse
+import glob
+import hashlib
+import os
+import re
+import sqlite3
+import stat
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from elf_hardening import ELF_MAGIC, ElfError, analyze_elf
+from hardening_cache import CACHE_PATH, HardeningCache
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Common"))
+from inventory_store import STORE_PATH, InventoryStore
+
+# Set PATHS
+ROOT_DIR = " "
+DB_PATH = "binary_hardening.db"
+
+# Sub-folders of a firmware folder holding extracted binaries
+SCAN_FOLDERS = ["binary", "apps_binaries"]
+MAX_WORKERS = os.cpu_count() or 4
+CHUNK_SIZE = 64
+BATCH_SIZE = 5000
+HASH_CHUNK = 8 * 1024 * 1024
+
+RESULT_COLUMNS = ["relro", "canary", "nx", "pie", "selfrando", "cfi", "safestack", "scs",
+                  "rpath", "runpath", "symbols", "fortify", "fortified", "fortifiable"]
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS hardening (
+    device TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    firmware TEXT NOT NULL,
+    path TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    size INTEGER,
+    {", ".join(f"{column} {'TEXT' if column in ('relro', 'pie') else 'INTEGER'}" for column in RESULT_COLUMNS)},
+    error TEXT,
+    PRIMARY KEY (device, version, path, sha256)
+);
+CREATE INDEX IF NOT EXISTS hardening_sha256 ON hardening (sha256);
+CREATE INDEX IF NOT EXISTS hardening_firmware ON hardening (firmware);
+"""
+
+# Change-detection tables shared by the incremental indexes (dependency_index.py, similarity_index.py)
+CHANGE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS firmware_folders (  -- absolute folder each firmware was last indexed from
+    firmware TEXT PRIMARY KEY,
+    folder TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS binaries (
+    firmware TEXT NOT NULL,
+    device TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    PRIMARY KEY (firmware, path)
+);
+CREATE INDEX IF NOT EXISTS binaries_sha256 ON binaries (sha256);
+CREATE TABLE IF NOT EXISTS other_files (  -- non-ELF files, so an update does not read them again
+    firmware TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    PRIMARY KEY (firmware, path)
+);
+"""
+
+FIRMWARE_NAME = re.compile(r"^([A-Za-z0-9]+?)_v(\d+)")
+
+def parse_firmware_name(name):
+    """
+    Returns (device, version) for folder names like q1_v12_01-31-2020, QPro_v50_... or pico4_v5_...
+    """
+    match = FIRMWARE_NAME.match(name)
+    if not match:
+        return name.lower(), -1
+    return match.group(1).lower(), int(match.group(2))
+
+def find_firmware_folders(root_dir):
+    return sorted(folder for folder in glob.glob(os.path.join(root_dir, "*"))
+                  if any(os.path.isdir(os.path.join(folder, sub)) for sub in SCAN_FOLDERS))
+
+def iter_firmware_stats(firmware_folder):
+    """
+    Yields (path, lstat result) of the regular files under the scanned sub-folders. Symlinks
+    (toybox applets, absolute links like linker64 -> /apex/...) are skipped, as with find -type f,
+    and files that cannot be stat'ed are ignored.
+    """
+    for sub in SCAN_FOLDERS:
+        for root, _, files in os.walk(os.path.join(firmware_folder, sub)):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    st = os.lstat(path)
+                except OSError:
+                    continue
+                if stat.S_ISREG(st.st_mode):
+                    yield path, st
+
+def changed_firmware_files(conn, folder, firmware):
+    """
+    Compares the regular files of a firmware folder with the CHANGE_SCHEMA tables of an incremental
+    index, records the folder and deletes the rows of removed and changed files.
+    Returns ({path: (rel_path, size, mtime_ns)} to index, removed, unchanged).
+    """
+    conn.execute("INSERT OR REPLACE INTO firmware_folders VALUES (?, ?)", (firmware, os.path.abspath(folder)))
+    known = {path: (size, mtime_ns) for table in ("binaries", "other_files") for path, size, mtime_ns in
+             conn.execute(f"SELECT path, size, mtime_ns FROM {table} WHERE firmware = ?", (firmware,))}
+    changed = {}
+    seen = set()
+    for path, st in iter_firmware_stats(folder):
+        rel_path = os.path.relpath(path, folder)
+        seen.add(rel_path)
+        if known.get(rel_path) != (st.st_size, st.st_mtime_ns):
+            changed[path] = (rel_path, st.st_size, st.st_mtime_ns)
+
+    removed = [rel_path for rel_path in known if rel_path not in seen]
+    stale = removed + [rel_path for rel_path, _, _ in changed.values() if rel_path in known]
+    for table in ("binaries", "other_files"):
+        conn.executemany(f"DELETE FROM {table} WHERE firmware = ? AND path = ?",
+                         [(firmware, rel_path) for rel_path in stale])
+    return changed, len(removed), len(seen) - len(changed)
+
+def record_binary(conn, firmware, device, version, rel_path, size, mtime_ns, sha256):
+    conn.execute("INSERT OR REPLACE INTO binaries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                 (firmware, device, version, rel_path, size, mtime_ns, sha256))
+
+def record_other_file(conn, firmware, rel_path, size, mtime_ns):
+    conn.execute("INSERT OR REPLACE INTO other_files VALUES (?, ?, ?, ?)", (firmware, rel_path, size, mtime_ns))
+
+def firmware_folder(conn, firmware):
+    """
+    The absolute folder a firmware was indexed from, or None if it was indexed before it was recorded.
+    """
+    row = conn.execute("SELECT folder FROM firmware_folders WHERE firmware = ?", (firmware,)).fetchone()
+    return row[0] if row else None
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# Read-only cache handle of each worker process, see init_worker
+worker_cache = None
+
+def init_worker(cache_path):
+    global worker_cache
+    if cache_path:
+        worker_cache = HardeningCache(cache_path, readonly=True)
+
+def scan_file(path):
+    """
+    Worker: returns (size, sha256, result, error) for ELF files and None for anything else, or
+    (None, None, None, error) when the file can't be read, so it is not mistaken for a non-ELF file.
+    The verdict comes from the cache when this content was analyzed before, e.g. in another firmware.
+    """
+    try:
+        with open(path, "rb") as f:
+            if f.read(4) != ELF_MAGIC:
+                return None
+        size = os.path.getsize(path)
+        sha256 = sha256_file(path)
+    except OSError as e:
+        return None, None, None, str(e)
+    if worker_cache is not None:
+        cached = worker_cache.verdict(sha256)
+        if cached is not None:
+            return size, sha256, *cached
+    try:
+        return size, sha256, analyze_elf(path), None
+    except (ElfError, OSError, ValueError) as e:
+        return size, sha256, None, str(e)
+
+def scan_task(task):
+    index, path, size, mtime_ns = task
+    return index, path, size, mtime_ns, scan_file(path)
+
+def open_db(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.executescript(SCHEMA)
+    return conn
+
+def result_row(device, version, firmware, rel_path, size, sha256, result, error):
+    values = [result[column] if result else None for column in RESULT_COLUMNS]
+    return (device, version, firmware, rel_path, sha256, size, *values, error)
+
+def insert_rows(conn, rows):
+    placeholders = ", ".join("?" * (7 + len(RESULT_COLUMNS)))
+    conn.executemany(f"INSERT OR REPLACE INTO hardening VALUES ({placeholders})", rows)
+
+def scan_firmwares(firmware_folders, db_path=DB_PATH, max_workers=MAX_WORKERS, cache_path=CACHE_PATH,
+                   store_path=STORE_PATH):
+    """
+    Scans all firmware folders with one shared process pool and stores one row per ELF file.
+    Rows of a rescanned firmware are replaced. With a cache, files whose path, size and mtime are
+    unchanged are neither read nor analyzed, and known content hashes skip the analysis. The rows
+    are then copied to the inventory store.
+    """
+    conn = open_db(db_path)
+    cache = HardeningCache(cache_path) if cache_path else None
+    tasks = []
+    for folder in firmware_folders:
+        folder = os.path.abspath(folder)
+        firmware = os.path.basename(folder)
+        conn.execute("DELETE FROM hardening WHERE firmware = ?", (firmware,))
+        tasks.append((folder, firmware, *parse_firmware_name(firmware)))
+
+    rows = []
+    misses = []
+    cached = 0
+    for index, (folder, firmware, device, version) in enumerate(tasks):
+        known = cache.load_files(os.path.join(folder, "")) if cache else {}
+        for path, st in iter_firmware_stats(folder):
+            entry = known.get(path)
+            if entry and entry[:2] == (st.st_size, st.st_mtime_ns):
+                sha256 = entry[2]
+                if sha256 is None:
+                    continue  # Known non-ELF file
+                verdict = cache.verdict(sha256)
+                if verdict is not None:
+                    rows.append(result_row(device, version, firmware, os.path.relpath(path, folder), st.st_size, sha256, *verdict))
+                    cached += 1
+                    continue
+            misses.append((index, path, st.st_size, st.st_mtime_ns))
+    print(f"{cached} ELF files unchanged since the last scan, {len(misses)} files to check")
+
+    count = cached
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker, initargs=(cache_path,)) as pool:
+        for index, path, size, mtime_ns, scanned in pool.map(scan_task, misses, chunksize=CHUNK_SIZE):
+            if scanned is not None and scanned[1] is None:
+                # Not cached, so the next scan reads it again
+                print(f"Cannot read {path}: {scanned[3]}")
+                continue
+            if cache:
+                cache.record_file(path, size, mtime_ns, scanned[1] if scanned else None)
+            if scanned is None:
+                continue
+            size, sha256, result, error = scanned
+            if cache:
+                cache.record_verdict(sha256, result, error)
+            folder, firmware, device, version = tasks[index]
+            rows.append(result_row(device, version, firmware, os.path.relpath(path, folder), size, sha256, result, error))
+            count += 1
+            if len(rows) >= BATCH_SIZE:
+                insert_rows(conn, rows)
+                conn.commit()
+                if cache:
+                    cache.flush()
+                rows = []
+                print(f"Scanned {count} ELF files")
+    insert_rows(conn, rows)
+    conn.commit()
+    conn.close()
+    if cache:
+        cache.close()
+    print(f"Stored {count} ELF files from {len(tasks)} firmwares in {db_path}")
+    if store_path:
+        with InventoryStore(store_path) as store:
+            store.import_hardening(db_path, [firmware for _, firmware, _, _ in tasks])
+    return count
+
+def main():
+    parser = argparse.ArgumentParser(description="Scan extracted firmware binaries into a SQLite hardening table")
+    parser.add_argument("folders", nargs="*", help="Firmware folders (default: every folder under ROOT_DIR)")
+    parser.add_argument("--db", default=DB_PATH, help="SQLite database path")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS)
+    parser.add_argument("--cache", default=CACHE_PATH, help="Hardening verdict cache path")
+    parser.add_argument("--no-cache", action="store_true", help="Analyze every binary again")
+    parser.add_argument("--store", default=STORE_PATH, help="Inventory store path ('' to skip)")
+    args = parser.parse_args()
+
+    folders = args.folders or find_firmware_folders(ROOT_DIR)
+    scan_firmwares(folders, args.db, args.workers, None if args.no_cache else args.cache, args.store)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+import argparse
+import os
+import sqlite3
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from binary_scanner import (CHANGE_SCHEMA, ROOT_DIR, changed_firmware_files, find_firmware_folders, parse_firmware_name,
+                            record_binary, record_other_file, sha256_file)
+from elf_hardening import ELF_MAGIC, ElfError, ElfFile, SHT_DYNSYM, STB_LOCAL
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Common"))
+from inventory_store import STORE_PATH, InventoryStore
+
+# Persistent DT_NEEDED graph and dynamic symbol index across all extracted firmwares. Symbol and
+# dependency rows are stored once per distinct content hash, binaries only point to a hash.
+
+INDEX_PATH = "binary_index.db"
+MAX_WORKERS = os.cpu_count() or 4
+CHUNK_SIZE = 32
+
+SCHEMA = CHANGE_SCHEMA + """
+CREATE TABLE IF NOT EXISTS contents (
+    sha256 TEXT PRIMARY KEY,
+    soname TEXT
+);
+CREATE TABLE IF NOT EXISTS needed (
+    sha256 TEXT NOT NULL,
+    library TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS needed_library ON needed (library);
+CREATE INDEX IF NOT EXISTS needed_sha256 ON needed (sha256);
+CREATE TABLE IF NOT EXISTS names (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS symbols (
+    name_id INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    kind TEXT NOT NULL  -- 'I' imported, 'E' exported
+);
+CREATE INDEX IF NOT EXISTS symbols_name ON symbols (name_id, kind);
+CREATE INDEX IF NOT EXISTS symbols_sha256 ON symbols (sha256);
+"""
+
+def parse_dependencies(path):
+    """
+    Worker: returns (path, sha256, soname, needed, imports, exports, None), or None for non-ELF
+    files. Unreadable or malformed ELF files give (path, None, None, None, None, None, error).
+    """
+    try:
+        with open(path, "rb") as f:
+            if f.read(4) != ELF_MAGIC:
+                return None
+        sha256 = sha256_file(path)
+        with ElfFile(path) as elf:
+            imports, exports = set(), set()
+            for name, bind, defined in elf.symbols(SHT_DYNSYM):
+                if bind == STB_LOCAL:
+                    continue
+                (exports if defined else imports).add(name)
+            return path, sha256, elf.soname, elf.needed, sorted(imports), sorted(exports), None
+    except (ElfError, OSError, ValueError) as e:
+        return path, None, None, None, None, None, str(e)
+
+def open_index(index_path=INDEX_PATH):
+    conn = sqlite3.connect(index_path)
+    conn.executescript(SCHEMA)
+    return conn
+
+def name_ids(conn, names):
+    conn.executemany("INSERT OR IGNORE INTO names (name) VALUES (?)", ((name,) for name in names))
+    ids = {}
+    names = list(names)
+    for start in range(0, len(names), 500):
+        batch = names[start:start + 500]
+        query = f"SELECT name, id FROM names WHERE name IN ({', '.join('?' * len(batch))})"
+        ids.update(conn.execute(query, batch))
+    return ids
+
+def store_content(conn, sha256, soname, needed, imports, exports):
+    conn.execute("INSERT INTO contents VALUES (?, ?)", (sha256, soname))
+    conn.executemany("INSERT INTO needed VALUES (?, ?)", ((sha256, library) for library in needed))
+    ids = name_ids(conn, imports + exports)
+    conn.executemany("INSERT INTO symbols VALUES (?, ?, ?)",
+                     [(ids[name], sha256, "I") for name in imports] + [(ids[name], sha256, "E") for name in exports])
+
+def update_index(firmware_folders, index_path=INDEX_PATH, max_workers=MAX_WORKERS, store_path=STORE_PATH):
+    """
+    Indexes new or changed ELF files of the given firmware folders. Unchanged files (same size and
+    mtime), ELF or not, are skipped, and content already indexed from another firmware is not parsed
+    again. The DT_NEEDED entries are then copied to the inventory store.
+    """
+    conn = open_index(index_path)
+    known_contents = {row[0] for row in conn.execute("SELECT sha256 FROM contents")}
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        for folder in firmware_folders:
+            folder = os.path.abspath(folder)
+            firmware = os.path.basename(folder)
+            device, version = parse_firmware_name(firmware)
+            changed, removed, unchanged = changed_firmware_files(conn, folder, firmware)
+
+            added = failed = 0
+            for path, parsed in zip(changed, pool.map(parse_dependencies, changed, chunksize=CHUNK_SIZE)):
+                rel_path, size, mtime_ns = changed[path]
+                if parsed is None:
+                    record_other_file(conn, firmware, rel_path, size, mtime_ns)
+                    continue
+                _, sha256, soname, needed, imports, exports, error = parsed
+                if error is not None:
+                    # Not recorded, so the next update parses it again
+                    print(f"Failed to parse {path}: {error}")
+                    failed += 1
+                    continue
+                if sha256 not in known_contents:
+                    store_content(conn, sha256, soname, needed, imports, exports)
+                    known_contents.add(sha256)
+                record_binary(conn, firmware, device, version, rel_path, size, mtime_ns, sha256)
+                added += 1
+            conn.commit()
+            print(f"{firmware}: {added} binaries indexed, {failed} failed, {removed} removed, "
+                  f"{unchanged} unchanged files skipped")
+    conn.close()
+    if store_path:
+        with InventoryStore(store_path) as store:
+            store.import_needed(index_path)
+
+def filter_clause(device=None, version=None):
+    clauses, params = [], []
+    if device:
+        clauses.append("b.device = ?")
+        params.append(device.lower())
+    if version is not None:
+        clauses.append("b.version = ?")
+        params.append(version)
+    return "".join(f" AND {clause}" for clause in clauses), params
+
+def binaries_needing(conn, library, device=None, version=None):
+    """
+    Returns (firmware, path) of every binary with DT_NEEDED library.
+    """
+    extra, params = filter_clause(device, version)
+    return conn.execute(
+        "SELECT b.firmware, b.path FROM needed n JOIN binaries b ON b.sha256 = n.sha256 "
+        f"WHERE n.library = ?{extra} ORDER BY b.firmware, b.path", [library] + params).fetchall()
+
+def binaries_with_symbol(conn, symbol, kind="I", device=None, version=None):
+    """
+    Returns (firmware, path) of every binary importing (kind 'I') or exporting ('E') symbol.
+    """
+    extra, params = filter_clause(device, version)
+    return conn.execute(
+        "SELECT b.firmware, b.path FROM names s JOIN symbols y ON y.name_id = s.id "
+        "JOIN binaries b ON b.sha256 = y.sha256 "
+        f"WHERE s.name = ? AND y.kind = ?{extra} ORDER BY b.firmware, b.path", [symbol, kind] + params).fetchall()
+
+def main():
+    parser = argparse.ArgumentParser(description="DT_NEEDED graph and dynamic symbol index")
+    parser.add_argument("--index", default=INDEX_PATH, help="SQLite index path")
+    parser.add_argument("--store", default=STORE_PATH, help="Inventory store path ('' to skip)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    update = commands.add_parser("update", help="Index new or changed binaries")
+    update.add_argument("folders", nargs="*", help="Firmware folders (default: every folder under ROOT_DIR)")
+    for name, help_text in [("needs", "Binaries linking a library"), ("imports", "Binaries importing a symbol"),
+                            ("exports", "Binaries exporting a symbol")]:
+        query = commands.add_parser(name, help=help_text)
+        query.add_argument("name")
+        query.add_argument("--device")
+        query.add_argument("--version", type=int)
+    args = parser.parse_args()
+
+    if args.command == "update":
+        update_index(args.folders or find_firmware_folders(ROOT_DIR), args.index, store_path=args.store)
+        return
+
+    conn = open_index(args.index)
+    if args.command == "needs":
+        rows = binaries_needing(conn, args.name, args.device, args.version)
+    else:
+        rows = binaries_with_symbol(conn, args.name, "I" if args.command == "imports" else "E", args.device, args.version)
+    for firmware, path in rows:
+        print(f"{firmware}\t{path}")
+    print(f"{len(rows)} binaries")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+import mmap
+import os
+import struct
+
+# In-process replacement for `checksec --file=... --extended`: parses the ELF headers, program
+# headers, dynamic section and symbol tables of a memory-mapped file and derives the same verdicts.
+
+# Bump whenever a verdict computed below changes, cached results of older versions are ignored
+ANALYZER_VERSION = 1
+
+ELF_MAGIC = b"\x7fELF"
+
+ET_EXEC, ET_DYN, ET_REL = 2, 3, 1
+EM_AARCH64 = 183
+
+PT_LOAD, PT_DYNAMIC, PT_GNU_STACK, PT_GNU_RELRO = 1, 2, 0x6474E551, 0x6474E552
+PF_X = 1
+
+SHT_SYMTAB, SHT_DYNSYM = 2, 11
+SHN_UNDEF = 0
+
+DT_NULL, DT_NEEDED, DT_HASH, DT_STRTAB, DT_SYMTAB, DT_SONAME, DT_RPATH = 0, 1, 4, 5, 6, 14, 15
+DT_DEBUG, DT_BIND_NOW, DT_FLAGS, DT_RUNPATH, DT_FLAGS_1 = 21, 24, 30, 29, 0x6FFFFFFB
+DF_BIND_NOW = 0x8
+DF_1_NOW, DF_1_PIE = 0x1, 0x08000000
+
+STB_LOCAL = 0
+
+# `str x30, [x18], #8`, the shadow call stack push emitted by -fsanitize=shadow-call-stack on arm64
+SCS_PUSH_INSN = struct.pack("<I", 0xF800865E)
+
+CANARY_SYMBOLS = {"__stack_chk_fail", "__stack_chk_guard", "__intel_security_cookie"}
+CFI_SYMBOLS = {"__cfi_check", "__cfi_slowpath", "__cfi_slowpath_diag"}
+SAFESTACK_SYMBOL = "__safestack_init"
+
+# libc functions that have a FORTIFY_SOURCE checked variant (glibc and bionic)
+FORTIFIABLE = {
+    "memcpy", "memmove", "mempcpy", "memset", "memchr", "memrchr", "strcpy", "stpcpy", "strncpy",
+    "stpncpy", "strcat", "strncat", "strlcpy", "strlcat", "strlen", "strchr", "strrchr",
+    "sprintf", "vsprintf", "snprintf", "vsnprintf", "printf", "vprintf", "fprintf", "vfprintf",
+    "read", "pread", "pread64", "write", "pwrite", "pwrite64", "readlink", "readlinkat", "getcwd",
+    "fgets", "fread", "fwrite", "gets", "open", "open64", "openat", "openat64", "umask", "poll",
+    "ppoll", "ppoll64", "recv", "recvfrom", "sendto", "realpath", "confstr", "getgroups",
+    "gethostname", "getlogin_r", "ttyname_r", "wcscpy", "wcsncpy", "wmemcpy", "wmemmove", "wmemset",
+    "FD_SET", "FD_CLR", "FD_ISSET", "longjmp", "syslog", "vsyslog",
+}
+# bionic names its checked open variants __open_2 instead of __open_chk
+FORTIFIED_ALIASES = {"__open_2": "open", "__open64_2": "open64", "__openat_2": "openat", "__openat64_2": "openat64"}
+
+class ElfError(ValueError):
+    pass
+
+class ElfFile:
+    """
+    Minimal read-only ELF parser over a memory-mapped file (32/64-bit, little/big endian).
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._parse_header()
+        except (struct.error, IndexError) as e:
+            self.close()
+            raise ElfError(f"Malformed ELF header: {e}")
+
+    def close(self):
+        self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _parse_header(self):
+        data = self.data
+        if data[:4] != ELF_MAGIC:
+            raise ElfError("Not an ELF file")
+        self.is_64 = data[4] == 2
+        self.endian = "<" if data[5] == 1 else ">"
+        e = self.endian
+        self.e_type, self.e_machine = struct.unpack_from(e + "HH", data, 16)
+        if self.is_64:
+            phoff, shoff = struct.unpack_from(e + "QQ", data, 32)
+            _, phentsize, phnum, shentsize, shnum, shstrndx = struct.unpack_from(e + "6H", data, 52)
+            self._phdr_fmt, self._shdr_fmt, self._dyn_fmt = e + "IIQQQQQQ", e + "IIQQQQIIQQ", e + "qQ"
+            self._sym_fmt = e + "IBBHQQ"
+        else:
+            phoff, shoff = struct.unpack_from(e + "II", data, 28)
+            _, phentsize, phnum, shentsize, shnum, shstrndx = struct.unpack_from(e + "6H", data, 40)
+            self._phdr_fmt, self._shdr_fmt, self._dyn_fmt = e + "8I", e + "10I", e + "iI"
+            self._sym_fmt = e + "IIIBBH"
+
+        self.segments = []
+        for i in range(phnum):
+            fields = struct.unpack_from(self._phdr_fmt, data, phoff + i * phentsize)
+            if self.is_64:
+                p_type, p_flags, p_offset, p_vaddr, _, p_filesz, p_memsz, _ = fields
+            else:
+                p_type, p_offset, p_vaddr, _, p_filesz, p_memsz, p_flags, _ = fields
+            self.segments.append((p_type, p_flags, p_offset, p_vaddr, p_filesz, p_memsz))
+
+        self.sections = {}
+        if shoff and shnum and shoff + shnum * shentsize <= len(data):
+            raw = [struct.unpack_from(self._shdr_fmt, data, shoff + i * shentsize) for i in range(shnum)]
+            names_offset = raw[shstrndx][4] if shstrndx < shnum else None
+            self._section_list = []
+            for sh in raw:
+                name = self._cstring(names_offset + sh[0]) if names_offset is not None else ""
+                # (type, offset, size, link, entsize)
+                section = (sh[1], sh[4], sh[5], sh[6], sh[9])
+                self._section_list.append(section)
+                self.sections.setdefault(name, section)
+        else:
+            self._section_list = []
+
+        self.dynamic = self._parse_dynamic()
+
+    def _cstring(self, offset):
+        end = self.data.find(b"\0", offset)
+        return self.data[offset:end if end >= 0 else len(self.data)].decode("utf-8", errors="replace")
+
+    def vaddr_to_offset(self, vaddr):
+        for p_type, _, p_offset, p_vaddr, p_filesz, _ in self.segments:
+            if p_type == PT_LOAD and p_vaddr <= vaddr < p_vaddr + p_filesz:
+                return vaddr - p_vaddr + p_offset
+        return None
+
+    def _parse_dynamic(self):
+        """
+        Returns the dynamic section as a list of (tag, value) pairs.
+        """
+        entries = []
+        for p_type, _, p_offset, _, p_filesz, _ in self.segments:
+            if p_type != PT_DYNAMIC:
+                continue
+            size = struct.calcsize(self._dyn_fmt)
+            for off in range(p_offset, min(p_offset + p_filesz, len(self.data) - size + 1), size):
+                tag, value = struct.unpack_from(self._dyn_fmt, self.data, off)
+                if tag == DT_NULL:
+                    break
+                entries.append((tag, value))
+        return entries
+
+    def dynamic_value(self, tag):
+        return next((value for t, value in self.dynamic if t == tag), None)
+
+    def dynamic_strings(self, tag):
+        """
+        Returns the strings referenced by a string-valued dynamic tag (DT_NEEDED, DT_RPATH, ...).
+        """
+        strtab = self.dynamic_value(DT_STRTAB)
+        base = self.vaddr_to_offset(strtab) if strtab is not None else None
+        if base is None:
+            return []
+        return [self._cstring(base + value) for t, value in self.dynamic if t == tag]
+
+    @property
+    def needed(self):
+        return self.dynamic_strings(DT_NEEDED)
+
+    @property
+    def soname(self):
+        names = self.dynamic_strings(DT_SONAME)
+        return names[0] if names else None
+
+    def has_section(self, name):
+        return name in self.sections
+
+    def symbols(self, table_type=SHT_DYNSYM):
+        """
+        Yields (name, bind, defined) for every symbol of the .dynsym (or .symtab) table.
+        """
+        size = struct.calcsize(self._sym_fmt)
+        for sh_type, offset, length, link, _ in self._section_list:
+            if sh_type != table_type or link >= len(self._section_list):
+                continue
+            strtab_offset = self._section_list[link][1]
+            for off in range(offset + size, min(offset + length, len(self.data) - size + 1), size):
+                fields = struct.unpack_from(self._sym_fmt, self.data, off)
+                if self.is_64:
+                    st_name, st_info, _, st_shndx = fields[:4]
+                else:
+                    st_name, _, _, st_info, _, st_shndx = fields
+                if st_name:
+                    yield self._cstring(strtab_offset + st_name), st_info >> 4, st_shndx != SHN_UNDEF
+
+    def symbol_count(self, table_type=SHT_SYMTAB):
+        size = struct.calcsize(self._sym_fmt)
+        return sum(length // size for sh_type, _, length, _, _ in self._section_list if sh_type == table_type)
+
+    def executable_contains(self, needle, alignment=1):
+        """
+        Returns True if needle occurs (at the given alignment) inside an executable PT_LOAD segment.
+        """
+        for p_type, p_flags, p_offset, _, p_filesz, _ in self.segments:
+            if p_type != PT_LOAD or not p_flags & PF_X:
+                continue
+            end = min(p_offset + p_filesz, len(self.data))
+            pos = self.data.find(needle, p_offset, end)
+            while pos >= 0:
+                if (pos - p_offset) % alignment == 0:
+                    return True
+                pos = self.data.find(needle, pos + 1, end)
+        return False
+
+def is_elf(path):
+    """
+    Magic-byte sniffing, cheaper than opening and mapping the whole file.
+    """
+    try:
+        with open(path, "rb") as f:
+            return f.read(4) == ELF_MAGIC
+    except OSError:
+        return False
+
+def analyze_elf(path):
+    """
+    Computes the hardening properties of an ELF file. Returns a dict, see checksec_row for the
+    checksec-compatible rendering.
+    """
+    with ElfFile(path) as elf:
+        segment_types = {segment[0] for segment in elf.segments}
+        flags = elf.dynamic_value(DT_FLAGS) or 0
+        flags_1 = elf.dynamic_value(DT_FLAGS_1) or 0
+        tags = {tag for tag, _ in elf.dynamic}
+
+        if PT_GNU_RELRO in segment_types:
+            bind_now = DT_BIND_NOW in tags or flags & DF_BIND_NOW or flags_1 & DF_1_NOW
+            relro = "full" if bind_now or not elf.has_section(".got.plt") else "partial"
+        else:
+            relro = "no"
+
+        gnu_stack = [segment for segment in elf.segments if segment[0] == PT_GNU_STACK]
+        nx = bool(gnu_stack) and not gnu_stack[0][1] & PF_X
+
+        if elf.e_type == ET_EXEC:
+            pie = "no"
+        elif elf.e_type == ET_DYN:
+            pie = "yes" if DT_DEBUG in tags or flags_1 & DF_1_PIE else "dso"
+        elif elf.e_type == ET_REL:
+            pie = "rel"
+        else:
+            pie = "unknown"
+
+        symbol_names = set()
+        imported = set()
+        for table in (SHT_DYNSYM, SHT_SYMTAB):
+            for name, bind, defined in elf.symbols(table):
+                symbol_names.add(name)
+                if not defined and bind != STB_LOCAL:
+                    imported.add(name)
+
+        fortified = set()
+        fortifiable = set()
+        for name in imported:
+            base = FORTIFIED_ALIASES.get(name)
+            if base is None and name.startswith("__") and name.endswith("_chk"):
+                base = name[2:-4]
+            if base is not None:
+                fortified.add(base)
+                fortifiable.add(base)
+            elif name in FORTIFIABLE:
+                fortifiable.add(name)
+
+        return {
+            "relro": relro,
+            "canary": bool(symbol_names & CANARY_SYMBOLS),
+            "nx": nx,
+            "pie": pie,
+            "selfrando": elf.has_section(".txtrp"),
+            "cfi": bool(symbol_names & CFI_SYMBOLS) or any(".cfi" in name for name in symbol_names),
+            "safestack": SAFESTACK_SYMBOL in symbol_names,
+            "scs": elf.e_machine == EM_AARCH64 and elf.executable_contains(SCS_PUSH_INSN, alignment=4),
+            "rpath": bool(elf.dynamic_strings(DT_RPATH)),
+            "runpath": bool(elf.dynamic_strings(DT_RUNPATH)),
+            "symbols": elf.symbol_count(SHT_SYMTAB),
+            "fortify": bool(fortified),
+            "fortified": len(fortified),
+            "fortifiable": len(fortifiable),
+        }
+
+CHECKSEC_COLUMNS = ["RELRO", "Stack Canary", "NX", "PIE", "SELFRANDO", "Clang CFI", "SafeStack",
+                    "RPATH", "RUNPATH", "Symbols", "FORTIFY", "Fortified", "Fortifiable", "Filename"]
+
+def checksec_row(result, path):
+    """
+    Renders an analyze_elf result with the exact wording of `checksec --extended --format=csv`.
+    """
+    return [
+        {"full": "Full RELRO", "partial": "Partial RELRO", "no": "No RELRO"}[result["relro"]],
+        "Canary found" if result["canary"] else "No canary found",
+        "NX enabled" if result["nx"] else "NX disabled",
+        {"yes": "PIE enabled", "no": "No PIE", "dso": "DSO", "rel": "REL"}.get(result["pie"], "Not an ELF file"),
+        "Selfrando enabled" if result["selfrando"] else "No Selfrando",
+        "Clang CFI found" if result["cfi"] else "No Clang CFI found",
+        "SafeStack found" if result["safestack"] else "No SafeStack found",
+        "RPATH" if result["rpath"] else "No RPATH",
+        "RUNPATH" if result["runpath"] else "No RUNPATH",
+        f"{result['symbols']} Symbols" if result["symbols"] else "No Symbols",
+        "Yes" if result["fortify"] else "No",
+        str(result["fortified"]),
+        str(result["fortifiable"]),
+        path,
+    ]
+
+def analyze_file(path):
+    """
+    Pool-friendly wrapper: returns (path, result) for ELF files, (path, None) for anything else
+    and (path, "ERROR_PROCESSING") when the ELF cannot be parsed.
+    """
+    if not is_elf(path) or os.path.getsize(path) < 52:
+        return path, None
+    try:
+        return path, analyze_elf(path)
+    except (ElfError, struct.error, OSError, ValueError):
+        return path, "ERROR_PROCESSING"
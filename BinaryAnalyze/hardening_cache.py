@@ -0,0 +1,76 @@
+import json
+import sqlite3
+from elf_hardening import ANALYZER_VERSION
+
+# Persistent cache from binary content hash to hardening verdict. A (path, size, mtime) table lets
+# unchanged files skip even the hashing; verdicts are stamped with the analyzer version so a
+# change to elf_hardening invalidates them.
+
+CACHE_PATH = "hardening_cache.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT  -- NULL for files known not to be ELF
+);
+CREATE TABLE IF NOT EXISTS verdicts (
+    sha256 TEXT NOT NULL,
+    analyzer_version INTEGER NOT NULL,
+    result TEXT,
+    error TEXT,
+    PRIMARY KEY (sha256, analyzer_version)
+);
+"""
+
+class HardeningCache:
+    def __init__(self, path=CACHE_PATH, analyzer_version=None, readonly=False):
+        self.analyzer_version = ANALYZER_VERSION if analyzer_version is None else analyzer_version
+        if readonly:
+            self.conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        else:
+            self.conn = sqlite3.connect(path)
+            self.conn.execute("PRAGMA journal_mode=WAL")  # Workers read while the scanner writes
+            self.conn.executescript(SCHEMA)
+        self.pending_files = []
+        self.pending_verdicts = []
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+    def load_files(self, prefix):
+        """
+        Returns {path: (size, mtime_ns, sha256)} for every cached file below a folder prefix.
+        """
+        rows = self.conn.execute(
+            "SELECT path, size, mtime_ns, sha256 FROM files WHERE path >= ? AND path < ?",
+            (prefix, prefix + "\uffff"))
+        return {path: (size, mtime_ns, sha256) for path, size, mtime_ns, sha256 in rows}
+
+    def verdict(self, sha256):
+        """
+        Returns (result, error) cached for a content hash, or None on a miss.
+        """
+        row = self.conn.execute(
+            "SELECT result, error FROM verdicts WHERE sha256 = ? AND analyzer_version = ?",
+            (sha256, self.analyzer_version)).fetchone()
+        if row is None:
+            return None
+        return (json.loads(row[0]) if row[0] else None), row[1]
+
+    def record_file(self, path, size, mtime_ns, sha256):
+        self.pending_files.append((path, size, mtime_ns, sha256))
+
+    def record_verdict(self, sha256, result, error):
+        self.pending_verdicts.append((sha256, self.analyzer_version, json.dumps(result) if result else None, error))
+
+    def flush(self):
+        if self.pending_files:
+            self.conn.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)", self.pending_files)
+        if self.pending_verdicts:
+            self.conn.executemany("INSERT OR REPLACE INTO verdicts VALUES (?, ?, ?, ?)", self.pending_verdicts)
+        self.conn.commit()
+        self.pending_files = []
+        self.pending_verdicts = []
@@ -0,0 +1,136 @@
+import argparse
+import glob
+import os
+import sqlite3
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from binary_scanner import DB_PATH, parse_firmware_name
+
+# Per device/version hardening shares and per-binary regressions between consecutive versions
+
+METRICS = ["full_relro", "canary", "nx", "pie", "cfi", "scs", "fortify", "safestack"]
+
+CHECKSEC_CSV_COLUMNS = ["path", "relro", "canary", "nx", "pie", "selfrando", "cfi", "safestack",
+                        "rpath", "runpath", "symbols", "fortify", "fortified", "fortifiable", "filename"]
+
+def load_db(db_path=DB_PATH):
+    """
+    Loads the hardening table written by binary_scanner.py.
+    """
+    with sqlite3.connect(db_path) as conn:
+        df = pd.read_sql_query(
+            "SELECT device, version, firmware, path, sha256, relro, canary, nx, pie, cfi, scs, fortify, safestack "
+            "FROM hardening WHERE error IS NULL", conn)
+    for column in ["canary", "nx", "cfi", "scs", "fortify", "safestack"]:
+        df[column] = df[column].astype(bool)
+    return df
+
+def load_checksec_csvs(root_dir):
+    """
+    Loads the legacy <firmware>/binary/<firmware>_checksec_report.csv files into the same shape.
+    """
+    frames = []
+    for csv_file in sorted(glob.glob(os.path.join(root_dir, "*", "binary", "*_checksec_report.csv"))):
+        firmware = os.path.basename(os.path.dirname(os.path.dirname(csv_file)))
+        frame = pd.read_csv(csv_file, header=None, names=CHECKSEC_CSV_COLUMNS, dtype=str)
+        frame = frame[frame["relro"] != "ERROR_PROCESSING"].dropna(subset=["relro"])
+        device, version = parse_firmware_name(firmware)
+        frames.append(pd.DataFrame({
+            "device": device,
+            "version": version,
+            "firmware": firmware,
+            "path": frame["path"].str.split(f"/{firmware}/", n=1).str[-1],
+            "sha256": None,
+            "relro": frame["relro"].map({"Full RELRO": "full", "Partial RELRO": "partial"}).fillna("no"),
+            "canary": frame["canary"] == "Canary found",
+            "nx": frame["nx"] == "NX enabled",
+            "pie": frame["pie"].map({"PIE enabled": "yes", "No PIE": "no", "DSO": "dso", "REL": "rel"}),
+            "cfi": frame["cfi"] == "Clang CFI found",
+            "scs": False,  # checksec has no shadow call stack check
+            "fortify": frame["fortify"] == "Yes",
+            "safestack": frame["safestack"] == "SafeStack found",
+        }))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=["device", "version", "firmware", "path"])
+
+def add_metric_columns(df):
+    """
+    Adds one float column per metric (1.0 / 0.0). PIE only applies to executables and is NaN
+    for shared libraries, so the mean over a group is the share among executables.
+    """
+    df = df.copy()
+    df["full_relro"] = (df["relro"] == "full").astype(float)
+    df["pie"] = np.where(df["pie"].isin(["yes", "no"]), (df["pie"] == "yes").astype(float), np.nan)
+    for column in ["canary", "nx", "cfi", "scs", "fortify", "safestack"]:
+        df[column] = df[column].astype(float)
+    return df
+
+def hardening_shares(df):
+    """
+    Returns the percentage of binaries with each mitigation per (device, version).
+    """
+    df = add_metric_columns(df)
+    shares = df.groupby(["device", "version"])[METRICS].mean().mul(100).round(2)
+    shares.insert(0, "binaries", df.groupby(["device", "version"]).size())
+    return shares.reset_index()
+
+def find_regressions(df):
+    """
+    Returns the binaries that lost a mitigation compared to the previous version of the same
+    device in which they were present.
+    """
+    df = add_metric_columns(df).sort_values(["device", "path", "version"])
+    previous = df.groupby(["device", "path"])[METRICS + ["version"]].shift(1)
+    lost = (previous[METRICS] == 1.0) & (df[METRICS] == 0.0)
+    mask = lost.any(axis=1)
+    regressions = df.loc[mask, ["device", "path", "version"]].copy()
+    regressions.insert(2, "previous_version", previous.loc[mask, "version"].astype(int))
+    regressions["lost"] = lost[mask].dot(lost.columns + ",").str.rstrip(",").values
+    return regressions.reset_index(drop=True)
+
+def plot_shares(shares, output="binary_hardening_trend.png"):
+    devices = sorted(shares["device"].unique())
+    fig, axes = plt.subplots(len(devices), 1, figsize=(12, 4 * len(devices)), squeeze=False)
+    for ax, device in zip(axes[:, 0], devices):
+        data = shares[shares["device"] == device]
+        for metric in METRICS:
+            ax.plot(data["version"], data[metric], marker="o", label=metric)
+        ax.set_title(f"{device.upper()} userspace hardening")
+        ax.set_xlabel("Version Number")
+        ax.set_ylabel("% of binaries")
+        ax.set_ylim(0, 105)
+        ax.grid(True, alpha=0.3)
+        ax.legend(loc="lower right", ncol=4)
+    plt.tight_layout()
+    plt.savefig(output)
+    plt.close()
+    print(f"\nHardening trend saved as '{output}'")
+
+def main():
+    parser = argparse.ArgumentParser(description="Userspace hardening trends across firmware versions")
+    parser.add_argument("--db", default=DB_PATH, help="SQLite database written by binary_scanner.py")
+    parser.add_argument("--csv-root", help="Read the legacy *_checksec_report.csv files below this folder instead")
+    parser.add_argument("--output", default="binary_hardening", help="Prefix of the generated CSV/PNG files")
+    args = parser.parse_args()
+
+    df = load_checksec_csvs(args.csv_root) if args.csv_root else load_db(args.db)
+    if df.empty:
+        print("No hardening results found!")
+        return
+
+    shares = hardening_shares(df)
+    regressions = find_regressions(df)
+    shares.to_csv(f"{args.output}_shares.csv", index=False)
+    regressions.to_csv(f"{args.output}_regressions.csv", index=False)
+
+    print("\nHARDENING SHARES (% of binaries):")
+    print("=" * 50)
+    print(shares.to_string(index=False))
+    print(f"\nREGRESSIONS: {len(regressions)} binaries lost a mitigation")
+    print("=" * 50)
+    if not regressions.empty:
+        print(regressions.groupby(["device", "version"]).size().to_string())
+    plot_shares(shares, f"{args.output}_trend.png")
+
+if __name__ == "__main__":
+    main()
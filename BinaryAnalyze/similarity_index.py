@@ -0,0 +1,231 @@
+import argparse
+import hashlib
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+import tlsh
+from binary_scanner import (CHANGE_SCHEMA, HASH_CHUNK, ROOT_DIR, changed_firmware_files, find_firmware_folders,
+                            firmware_folder, parse_firmware_name, record_binary, record_other_file)
+from elf_hardening import ELF_MAGIC
+
+# TLSH similarity index of every ELF under binary/ and apps_binaries/. Digests are bucketed by
+# bands of their body (locality-sensitive hashing), so a nearest-neighbour query only computes
+# TLSH distances to the binaries sharing at least one band instead of to the whole index.
+
+SIMILARITY_PATH = "binary_similarity.db"
+MAX_WORKERS = os.cpu_count() or 4
+CHUNK_SIZE = 32
+
+# A TLSH digest is "T1", 3 header bytes and a 32 byte body of 128 2-bit bucket codes. Each band
+# is 3 hex characters of the body (6 buckets), 21 bands in total.
+TLSH_BODY_START = 8
+BAND_WIDTH = 3
+BANDS = 21
+CHANGED_DISTANCE = 30  # TLSH distance above which a binary counts as materially changed
+
+SCHEMA = CHANGE_SCHEMA + """
+CREATE TABLE IF NOT EXISTS digests (
+    sha256 TEXT PRIMARY KEY,
+    tlsh TEXT  -- NULL when the file is too small or uniform for TLSH
+);
+CREATE TABLE IF NOT EXISTS bands (
+    band INTEGER NOT NULL,
+    bucket TEXT NOT NULL,
+    sha256 TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS bands_bucket ON bands (band, bucket);
+"""
+
+def tlsh_bands(digest):
+    body = digest[TLSH_BODY_START:]
+    return [(band, body[band * BAND_WIDTH:(band + 1) * BAND_WIDTH]) for band in range(BANDS)]
+
+def digest_file(path):
+    """
+    Worker: returns (path, sha256, tlsh digest or None, None), or None for non-ELF files.
+    Unreadable files give (path, None, None, error).
+    """
+    try:
+        with open(path, "rb") as f:
+            if f.read(4) != ELF_MAGIC:
+                return None
+            f.seek(0)
+            sha256 = hashlib.sha256()
+            fuzzy = tlsh.Tlsh()
+            for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+                sha256.update(chunk)
+                fuzzy.update(chunk)
+    except OSError as e:
+        return path, None, None, str(e)
+    try:
+        fuzzy.final()
+        digest = fuzzy.hexdigest()
+    except ValueError:
+        digest = None
+    return path, sha256.hexdigest(), digest if digest and digest != "TNULL" else None, None
+
+def open_index(index_path=SIMILARITY_PATH):
+    conn = sqlite3.connect(index_path)
+    conn.executescript(SCHEMA)
+    return conn
+
+def update_index(firmware_folders, index_path=SIMILARITY_PATH, max_workers=MAX_WORKERS):
+    """
+    Adds new or changed ELF files of the given firmware folders. Unchanged files (same size and
+    mtime), ELF or not, are skipped, and a content already indexed from another firmware is not
+    hashed into the band tables again.
+    """
+    conn = open_index(index_path)
+    known_contents = {row[0] for row in conn.execute("SELECT sha256 FROM digests")}
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        for folder in firmware_folders:
+            folder = os.path.abspath(folder)
+            firmware = os.path.basename(folder)
+            device, version = parse_firmware_name(firmware)
+            changed, removed, unchanged = changed_firmware_files(conn, folder, firmware)
+
+            added = failed = 0
+            for path, digested in zip(changed, pool.map(digest_file, changed, chunksize=CHUNK_SIZE)):
+                rel_path, size, mtime_ns = changed[path]
+                if digested is None:
+                    record_other_file(conn, firmware, rel_path, size, mtime_ns)
+                    continue
+                _, sha256, digest, error = digested
+                if error is not None:
+                    # Not recorded, so the next update reads it again
+                    print(f"Cannot read {path}: {error}")
+                    failed += 1
+                    continue
+                if sha256 not in known_contents:
+                    conn.execute("INSERT INTO digests VALUES (?, ?)", (sha256, digest))
+                    if digest:
+                        conn.executemany("INSERT INTO bands VALUES (?, ?, ?)",
+                                         [(band, bucket, sha256) for band, bucket in tlsh_bands(digest)])
+                    known_contents.add(sha256)
+                record_binary(conn, firmware, device, version, rel_path, size, mtime_ns, sha256)
+                added += 1
+            conn.commit()
+            print(f"{firmware}: {added} binaries indexed, {failed} failed, {removed} removed, "
+                  f"{unchanged} unchanged files skipped")
+    conn.close()
+
+def nearest(conn, digest, firmware=None, k=5, max_distance=None):
+    """
+    Returns up to k (distance, firmware, path, sha256) closest to a TLSH digest, optionally only
+    within one firmware. Only binaries sharing an LSH band with the digest are compared.
+    """
+    bands = tlsh_bands(digest)
+    clause = " OR ".join("(band = ? AND bucket = ?)" for _ in bands)
+    candidates = conn.execute(
+        f"SELECT DISTINCT d.sha256, d.tlsh FROM bands b JOIN digests d ON d.sha256 = b.sha256 WHERE {clause}",
+        [value for pair in bands for value in pair]).fetchall()
+
+    scored = sorted((tlsh.diff(digest, other), sha256) for sha256, other in candidates)
+    if max_distance is not None:
+        scored = [item for item in scored if item[0] <= max_distance]
+    matches = []
+    for distance, sha256 in scored:
+        query = "SELECT firmware, path FROM binaries WHERE sha256 = ?"
+        params = [sha256]
+        if firmware:
+            query += " AND firmware = ?"
+            params.append(firmware)
+        for match_firmware, path in conn.execute(query + " ORDER BY firmware, path", params):
+            matches.append((distance, match_firmware, path, sha256))
+            if len(matches) == k:
+                return matches
+    return matches
+
+def previous_firmware(conn, firmware):
+    """
+    The indexed firmware of the same device with the highest version below this one.
+    """
+    row = conn.execute("SELECT device, version FROM binaries WHERE firmware = ? LIMIT 1", (firmware,)).fetchone()
+    if row is None:
+        return None
+    previous = conn.execute(
+        "SELECT firmware FROM binaries WHERE device = ? AND version < ? ORDER BY version DESC LIMIT 1", row).fetchone()
+    return previous[0] if previous else None
+
+def compare_firmwares(conn, firmware, previous, threshold=CHANGED_DISTANCE):
+    """
+    Classifies every binary of firmware against previous: "unchanged" (same content), "similar"
+    (TLSH distance <= threshold), "changed", "renamed" (new path, near match elsewhere) or "new".
+    Returns [(status, path, distance, matched previous path)].
+    """
+    digests = dict(conn.execute("SELECT sha256, tlsh FROM digests"))
+    old = {path: sha256 for path, sha256 in conn.execute("SELECT path, sha256 FROM binaries WHERE firmware = ?", (previous,))}
+    report = []
+    for path, sha256 in conn.execute("SELECT path, sha256 FROM binaries WHERE firmware = ? ORDER BY path", (firmware,)):
+        digest = digests.get(sha256)
+        if path in old:
+            if old[path] == sha256:
+                report.append(("unchanged", path, 0, path))
+                continue
+            old_digest = digests.get(old[path])
+            distance = tlsh.diff(digest, old_digest) if digest and old_digest else None
+            status = "similar" if distance is not None and distance <= threshold else "changed"
+            report.append((status, path, distance, path))
+            continue
+        match = nearest(conn, digest, previous, k=1, max_distance=threshold) if digest else []
+        if match:
+            report.append(("renamed", path, match[0][0], match[0][2]))
+        else:
+            report.append(("new", path, None, None))
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="TLSH similarity index of firmware binaries")
+    parser.add_argument("--index", default=SIMILARITY_PATH, help="SQLite index path")
+    commands = parser.add_subparsers(dest="command", required=True)
+    update = commands.add_parser("update", help="Index new or changed binaries")
+    update.add_argument("folders", nargs="*", help="Firmware folders (default: every folder under ROOT_DIR)")
+    changes = commands.add_parser("changes", help="Binaries that changed since the previous version")
+    changes.add_argument("firmware")
+    changes.add_argument("--previous", help="Firmware to compare with (default: previous version of the device)")
+    changes.add_argument("--threshold", type=int, default=CHANGED_DISTANCE, help="Max TLSH distance of similar binaries")
+    changes.add_argument("--output", help="Write the paths of changed, renamed and new binaries to this file")
+    near = commands.add_parser("nearest", help="Closest indexed binaries to a file")
+    near.add_argument("file")
+    near.add_argument("--firmware", help="Only search this firmware")
+    near.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.command == "update":
+        update_index(args.folders or find_firmware_folders(ROOT_DIR), args.index)
+        return
+
+    conn = open_index(args.index)
+    if args.command == "nearest":
+        digested = digest_file(args.file)
+        if not digested or not digested[2]:
+            print(f"No TLSH digest for {args.file} (not an ELF file or too small)")
+            return
+        for distance, firmware, path, _ in nearest(conn, digested[2], args.firmware, args.k):
+            print(f"{distance}\t{firmware}\t{path}")
+        return
+
+    previous = args.previous or previous_firmware(conn, args.firmware)
+    if previous is None:
+        print(f"No previous firmware indexed for {args.firmware}")
+        return
+    report = compare_firmwares(conn, args.firmware, previous, args.threshold)
+    print(f"{args.firmware} vs {previous}:")
+    for status in ("unchanged", "similar", "changed", "renamed", "new"):
+        print(f"  {status}: {sum(1 for row in report if row[0] == status)}")
+    for status, path, distance, previous_path in report:
+        if status in ("changed", "renamed", "new"):
+            detail = f" ({distance} from {previous_path})" if previous_path else ""
+            print(f"{status}\t{path}{detail}")
+    if args.output:
+        folder = firmware_folder(conn, args.firmware)
+        if folder is None:
+            print(f"No folder recorded for {args.firmware}, run update on it again to write {args.output}")
+            return
+        with open(args.output, "w") as f:
+            for status, path, _, _ in report:
+                if status in ("changed", "renamed", "new"):
+                    f.write(os.path.join(folder, path) + "\n")
+
+if __name__ == "__main__":
+    main()
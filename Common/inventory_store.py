@@ -0,0 +1,486 @@
+import argparse
+import csv
+import glob
+import json
+import os
+import re
+import sqlite3
+import time
+
+# One indexed SQLite inventory of every analyzed firmware, written by the analyzers themselves
+# (binary_scanner.py, dependency_index.py, perms_analysis.py, dex_api_scanner.py, boot_image.py,
+# kernel_analyze.py, kernel_image_analyze.py) and queried across the whole history with
+# `python Common/inventory_store.py apps|binaries|firmware|sql`. Each table is owned by one analyzer,
+# which replaces the rows of a firmware whenever it analyzes it again. `ingest` backfills the store
+# from the outputs already on disk.
+
+STORE_PATH = os.environ.get("FIRMWARE_STORE", "firmware_inventory.db")
+CONFIG_SUFFIX = "_configuration"
+CHECKSEC_SUFFIX = "_checksec_report.csv"
+DEX_REPORT = "dex_api_usage.json"
+PERMISSION_TABLE = "permission_table.json"
+APPS_BINARIES = "apps_binaries"
+
+SCHEMA = """
+PRAGMA journal_mode = WAL;
+CREATE TABLE IF NOT EXISTS firmware (
+    firmware TEXT PRIMARY KEY,
+    device TEXT NOT NULL,
+    version INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS firmware_device ON firmware (device, version);
+CREATE TABLE IF NOT EXISTS binaries (
+    firmware TEXT NOT NULL,
+    path TEXT NOT NULL,
+    name TEXT NOT NULL,  -- File name, what DT_NEEDED entries refer to
+    app TEXT,            -- <app> of apps_binaries/<app>/..., NULL for partition binaries
+    sha256 TEXT,
+    relro TEXT, canary INTEGER, nx INTEGER, pie TEXT, cfi INTEGER, safestack INTEGER, scs INTEGER,
+    fortify INTEGER, rpath INTEGER, runpath INTEGER,
+    PRIMARY KEY (firmware, path)
+);
+CREATE INDEX IF NOT EXISTS binaries_name ON binaries (firmware, name);
+CREATE INDEX IF NOT EXISTS binaries_app ON binaries (firmware, app) WHERE app IS NOT NULL;
+CREATE INDEX IF NOT EXISTS binaries_sha256 ON binaries (sha256);
+CREATE TABLE IF NOT EXISTS needed (
+    sha256 TEXT NOT NULL,
+    library TEXT NOT NULL,
+    PRIMARY KEY (sha256, library)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS needed_library ON needed (library);
+CREATE TABLE IF NOT EXISTS app_permissions (
+    firmware TEXT NOT NULL,
+    app TEXT NOT NULL,
+    package TEXT,
+    permission TEXT NOT NULL,
+    bucket TEXT,  -- dangerous, normal, signature, signatureOrSystem, others
+    PRIMARY KEY (firmware, app, permission)
+);
+CREATE INDEX IF NOT EXISTS app_permissions_bucket ON app_permissions (bucket, firmware);
+CREATE INDEX IF NOT EXISTS app_permissions_permission ON app_permissions (permission);
+CREATE TABLE IF NOT EXISTS api_usage (
+    firmware TEXT NOT NULL,
+    app TEXT NOT NULL,
+    permission TEXT NOT NULL,
+    status TEXT NOT NULL,  -- used, unused or undeclared, from the DEX API scan
+    PRIMARY KEY (firmware, app, permission)
+);
+CREATE INDEX IF NOT EXISTS api_usage_status ON api_usage (status, permission);
+CREATE TABLE IF NOT EXISTS kernel_config (
+    firmware TEXT NOT NULL,
+    option TEXT NOT NULL,
+    value TEXT NOT NULL,   -- y, m, n (not set) or the option's value
+    source TEXT NOT NULL,  -- ikconfig or kallsyms (inferred by kernel_image_analyze.py)
+    PRIMARY KEY (firmware, option, source)
+);
+CREATE INDEX IF NOT EXISTS kernel_config_option ON kernel_config (option, value);
+"""
+
+HARDENING_COLUMNS = ["relro", "canary", "nx", "pie", "cfi", "safestack", "scs", "fortify", "rpath", "runpath"]
+
+# SQL condition of a binary (alias {b}) lacking each mitigation
+MISSING = {
+    "relro": "{b}.relro != 'full'",
+    "canary": "{b}.canary = 0",
+    "nx": "{b}.nx = 0",
+    "pie": "{b}.pie = 'no'",
+    "cfi": "{b}.cfi = 0",
+    "scs": "{b}.scs = 0",
+    "fortify": "{b}.fortify = 0",
+    "safestack": "{b}.safestack = 0",
+}
+UNHARDENED = ["relro", "canary", "nx"]  # What makes a library "unhardened" unless --missing says otherwise
+
+FIRMWARE_NAME = re.compile(r"^([A-Za-z0-9]+?)_v(\d+)")
+CONFIG_LINE = re.compile(r"^(CONFIG_\w+)=(.*)$|^# (CONFIG_\w+) is not set$")
+
+def parse_firmware_name(name):
+    """
+    (device, version) of q1_v12_01-31-2020, QPro_v50_..., like binary_scanner.py.
+    """
+    match = FIRMWARE_NAME.match(name)
+    if not match:
+        return name.lower(), -1
+    return match.group(1).lower(), int(match.group(2))
+
+def parse_kernel_config(text):
+    """
+    {option: value} of a kernel .config, "n" for the options that are not set.
+    """
+    options = {}
+    for line in text.splitlines():
+        match = CONFIG_LINE.match(line.strip())
+        if match:
+            if match.group(3):
+                options[match.group(3)] = "n"
+            else:
+                options[match.group(1)] = match.group(2).strip('"')
+    return options
+
+def binary_location(path):
+    """
+    (file name, app) of a firmware-relative binary path.
+    """
+    parts = path.replace(os.sep, "/").split("/")
+    app = parts[1] if len(parts) > 2 and parts[0] == APPS_BINARIES else None
+    return parts[-1], app
+
+def app_name(name):
+    return name[:-len(".apk")] if name.endswith(".apk") else name
+
+class InventoryStore:
+    def __init__(self, path=STORE_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add_firmware(self, firmware):
+        self.conn.execute("INSERT OR IGNORE INTO firmware VALUES (?, ?, ?)", (firmware, *parse_firmware_name(firmware)))
+
+    def replace_binaries(self, firmware, rows):
+        """
+        rows: (path relative to the firmware folder, sha256, {column: value} of HARDENING_COLUMNS).
+        """
+        self.add_firmware(firmware)
+        self.conn.execute("DELETE FROM binaries WHERE firmware = ?", (firmware,))
+        self.conn.executemany(
+            f"INSERT OR REPLACE INTO binaries VALUES ({', '.join('?' * (5 + len(HARDENING_COLUMNS)))})",
+            ((firmware, path, *binary_location(path), sha256, *(result.get(c) for c in HARDENING_COLUMNS))
+             for path, sha256, result in rows))
+        self.conn.commit()
+
+    def import_hardening(self, db_path, firmwares=None):
+        """
+        Copies the hardening rows of binary_scanner.py's database, for the given firmwares or all.
+        """
+        source = sqlite3.connect(db_path)
+        try:
+            if firmwares is None:
+                firmwares = [row[0] for row in source.execute("SELECT DISTINCT firmware FROM hardening")]
+            for firmware in firmwares:
+                rows = source.execute(f"SELECT path, sha256, {', '.join(HARDENING_COLUMNS)} FROM hardening "
+                                      "WHERE firmware = ?", (firmware,))
+                self.replace_binaries(firmware, ((path, sha256, dict(zip(HARDENING_COLUMNS, values)))
+                                                 for path, sha256, *values in rows))
+        finally:
+            source.close()
+        return len(firmwares)
+
+    def import_checksec_csv(self, firmware, csv_path):
+        """
+        Hardening rows from a binary_analyzer.py / checksec CSV, for firmwares never scanned by
+        binary_scanner.py. The CSV has no hash or SCS column.
+        """
+        folder = os.path.dirname(os.path.dirname(os.path.abspath(csv_path)))
+        rows = []
+        with open(csv_path, newline="") as f:
+            for row in csv.reader(f):
+                if len(row) < 12 or row[1] == "RELRO":
+                    continue
+                rows.append((os.path.relpath(row[0], folder) if os.path.isabs(row[0]) else row[0], None, {
+                    "relro": {"Full RELRO": "full", "Partial RELRO": "partial"}.get(row[1], "no"),
+                    "canary": int(row[2] == "Canary found"), "nx": int(row[3] == "NX enabled"),
+                    "pie": {"PIE enabled": "yes", "DSO": "dso", "REL": "rel"}.get(row[4], "no"),
+                    "cfi": int(row[6] == "Clang CFI found"), "safestack": int(row[7] == "SafeStack found"),
+                    "rpath": int(row[8] == "RPATH"), "runpath": int(row[9] == "RUNPATH"),
+                    "fortify": int(row[11] == "Yes")}))
+        self.replace_binaries(firmware, rows)
+        return len(rows)
+
+    def import_needed(self, index_path):
+        """
+        Copies the DT_NEEDED entries of dependency_index.py's index (stored per content hash).
+        """
+        self.conn.execute("ATTACH DATABASE ? AS dependency_index", (index_path,))
+        try:
+            self.conn.execute("INSERT OR IGNORE INTO needed SELECT sha256, library FROM dependency_index.needed")
+            self.conn.commit()
+        finally:
+            self.conn.execute("DETACH DATABASE dependency_index")
+
+    def replace_app_permissions(self, firmware, rows):
+        """
+        rows: (app, package, permission, bucket) for every requested permission.
+        """
+        self.add_firmware(firmware)
+        self.conn.execute("DELETE FROM app_permissions WHERE firmware = ?", (firmware,))
+        self.conn.executemany("INSERT OR REPLACE INTO app_permissions VALUES (?, ?, ?, ?, ?)",
+                              ((firmware, app_name(app), package, permission, bucket)
+                               for app, package, permission, bucket in rows))
+        self.conn.commit()
+
+    def replace_api_usage(self, firmware, apps):
+        """
+        apps: dex_api_scanner.py results, {app: {"used", "unused", "undeclared", ...}}.
+        """
+        self.add_firmware(firmware)
+        self.conn.execute("DELETE FROM api_usage WHERE firmware = ?", (firmware,))
+        rows = []
+        for app, info in apps.items():
+            statuses = {permission: "used" for permission in info.get("used", {})}
+            statuses.update((permission, status) for status in ("unused", "undeclared")
+                            for permission in info.get(status, []))
+            rows += [(firmware, app_name(app), permission, status) for permission, status in statuses.items()]
+        self.conn.executemany("INSERT OR REPLACE INTO api_usage VALUES (?, ?, ?, ?)", rows)
+        self.conn.commit()
+
+    def replace_kernel_config(self, firmware, options, source):
+        """
+        options: {CONFIG_*: value}, from parse_kernel_config or inferred mitigations.
+        """
+        self.add_firmware(firmware)
+        self.conn.execute("DELETE FROM kernel_config WHERE firmware = ? AND source = ?", (firmware, source))
+        self.conn.executemany("INSERT OR REPLACE INTO kernel_config VALUES (?, ?, ?, ?)",
+                              ((firmware, option, value, source) for option, value in options.items()))
+        self.conn.commit()
+
+    def replace_kernel_mitigations(self, firmware, mitigations):
+        """
+        kernel_image_analyze.py results: {CONFIG_*: present} inferred from kallsyms.
+        """
+        self.replace_kernel_config(firmware, {option: "y" if present else "n"
+                                              for option, present in (mitigations or {}).items()}, "kallsyms")
+
+def ingest_folder(store, folder):
+    """
+    Backfills one firmware folder from the files the analyzers left in it. Returns what was loaded.
+    """
+    firmware = os.path.basename(os.path.normpath(folder))
+    loaded = []
+    has_binaries = store.conn.execute("SELECT 1 FROM binaries WHERE firmware = ? LIMIT 1", (firmware,)).fetchone()
+    checksec = os.path.join(folder, "binary", firmware + CHECKSEC_SUFFIX)
+    if not has_binaries and os.path.isfile(checksec):
+        loaded.append(f"{store.import_checksec_csv(firmware, checksec)} binaries")
+
+    for config in glob.glob(os.path.join(folder, "**", firmware + CONFIG_SUFFIX), recursive=True)[:1]:
+        with open(config, errors="ignore") as f:
+            store.replace_kernel_config(firmware, parse_kernel_config(f.read()), "ikconfig")
+        loaded.append("kernel config")
+
+    report = os.path.join(folder, DEX_REPORT)
+    if os.path.isfile(report):
+        with open(report) as f:
+            apps = json.load(f)
+        store.replace_api_usage(firmware, apps)
+        # The scan also lists each app's requested permissions; the permission table classifies them
+        buckets = {}
+        table = os.path.join(folder, PERMISSION_TABLE)
+        if os.path.isfile(table):
+            with open(table) as f:
+                buckets = {name: entry["bucket"] for name, entry in json.load(f)["permissions"].items()}
+        has_permissions = store.conn.execute("SELECT 1 FROM app_permissions WHERE firmware = ? LIMIT 1",
+                                             (firmware,)).fetchone()
+        if not has_permissions:
+            store.replace_app_permissions(firmware, [(app, info.get("package_name"), permission, buckets.get(permission))
+                                                     for app, info in apps.items()
+                                                     for permission in info.get("declared", [])])
+        loaded.append(f"{len(apps)} apps")
+    return loaded
+
+def ingest(store, folders, hardening_db=None, index_path=None, kernel_cache=None, config_dir=None):
+    """
+    Backfills the store from existing outputs: binary_scanner.py and dependency_index.py databases,
+    kernel_image_analyze.py's cache, a folder of <firmware>_configuration files and the firmware
+    folders themselves (checksec CSVs, configurations, DEX scan reports, permission tables).
+    """
+    if hardening_db and os.path.isfile(hardening_db):
+        print(f"{store.import_hardening(hardening_db)} firmwares from {hardening_db}")
+    if index_path and os.path.isfile(index_path):
+        store.import_needed(index_path)
+        print(f"DT_NEEDED entries from {index_path}")
+    if kernel_cache and os.path.isfile(kernel_cache):
+        with open(kernel_cache) as f:
+            cache = json.load(f)
+        for path, (_, _, sha256) in cache.get("files", {}).items():
+            result = cache.get("results", {}).get(sha256)
+            if result and result.get("mitigations"):
+                # Kernels are <firmware>/extracted/kernel
+                store.replace_kernel_mitigations(os.path.basename(os.path.dirname(os.path.dirname(path))),
+                                                 result["mitigations"])
+        print(f"Kernel mitigations from {kernel_cache}")
+    if config_dir:
+        for config in sorted(glob.glob(os.path.join(config_dir, "*" + CONFIG_SUFFIX))):
+            with open(config, errors="ignore") as f:
+                store.replace_kernel_config(os.path.basename(config)[:-len(CONFIG_SUFFIX)],
+                                            parse_kernel_config(f.read()), "ikconfig")
+    for folder in folders:
+        loaded = ingest_folder(store, folder)
+        print(f"{os.path.basename(os.path.normpath(folder))}: {', '.join(loaded) or 'nothing to ingest'}")
+
+def firmware_filters(args, alias="f"):
+    """
+    WHERE clauses and parameters selecting firmwares by device, version, name and kernel options.
+    """
+    clauses, params = [], []
+    if args.device:
+        clauses.append(f"{alias}.device = ?")
+        params.append(args.device.lower())
+    if args.version is not None:
+        clauses.append(f"{alias}.version = ?")
+        params.append(args.version)
+    if args.firmware:
+        clauses.append(f"{alias}.firmware = ?")
+        params.append(args.firmware)
+    enabled = ("EXISTS (SELECT 1 FROM kernel_config k WHERE k.firmware = {a}.firmware AND k.option = ? "
+               "AND k.value IN ('y', 'm'))").format(a=alias)
+    for option in args.kernel_enabled or []:
+        clauses.append(enabled)
+        params.append(option)
+    for option in args.kernel_missing or []:
+        # Only firmwares whose kernel was analyzed at all
+        clauses.append(f"EXISTS (SELECT 1 FROM kernel_config k WHERE k.firmware = {alias}.firmware) AND NOT {enabled}")
+        params.append(option)
+    return clauses, params
+
+def missing_condition(mitigations, alias):
+    unknown = [m for m in mitigations if m not in MISSING]
+    if unknown:
+        raise ValueError(f"Unknown mitigations {unknown}, use {sorted(MISSING)}")
+    return "(" + " OR ".join(MISSING[m].format(b=alias) for m in mitigations) + ")"
+
+def apps_query(args):
+    """
+    Apps (per firmware) matching permission, usage, native library and kernel filters, with the
+    matching permissions and unhardened libraries.
+    """
+    clauses, params = firmware_filters(args)
+    if args.bucket:
+        clauses.append("p.bucket = ?")
+        params.append(args.bucket)
+    if args.permission:
+        clauses.append("p.permission = ?")
+        params.append(args.permission)
+    if args.usage:
+        clauses.append("EXISTS (SELECT 1 FROM api_usage u WHERE u.firmware = p.firmware AND u.app = p.app "
+                       "AND u.permission = p.permission AND u.status = ?)")
+        params.append(args.usage)
+
+    libraries, library_join = "''", ""
+    if args.unhardened_lib:
+        bundled = missing_condition(args.missing, "b")
+        linked = missing_condition(args.missing, "d")
+        # Native libraries an app bundles, and the firmware libraries they link against. CROSS JOIN
+        # keeps SQLite from scanning every binary of the firmware before looking at needed.
+        library_join = f"""JOIN (
+            SELECT b.firmware, b.app, b.path AS library FROM binaries b
+            WHERE b.app IS NOT NULL AND {bundled}
+            UNION
+            SELECT b.firmware, b.app, d.path FROM binaries b
+            CROSS JOIN needed n ON n.sha256 = b.sha256
+            CROSS JOIN binaries d ON d.firmware = b.firmware AND d.name = n.library AND d.app IS NULL
+            WHERE b.app IS NOT NULL AND {linked}
+        ) l ON l.firmware = p.firmware AND l.app = p.app"""
+        libraries = "group_concat(DISTINCT l.library)"
+
+    where = " AND ".join(clauses) or "1"
+    return (f"SELECT p.firmware, p.app, group_concat(DISTINCT p.permission), {libraries} "
+            f"FROM app_permissions p JOIN firmware f ON f.firmware = p.firmware {library_join} "
+            f"WHERE {where} GROUP BY p.firmware, p.app ORDER BY f.device, f.version, p.app",
+            params, ["firmware", "app", "permissions", "unhardened libraries"])
+
+def binaries_query(args):
+    clauses, params = firmware_filters(args)
+    if args.missing:
+        clauses.append(missing_condition(args.missing, "b"))
+    if args.app:
+        clauses.append("b.app = ?")
+        params.append(args.app)
+    if args.needs:
+        clauses.append("EXISTS (SELECT 1 FROM needed n WHERE n.sha256 = b.sha256 AND n.library = ?)")
+        params.append(args.needs)
+    where = " AND ".join(clauses) or "1"
+    return (f"SELECT b.firmware, b.path, {', '.join('b.' + c for c in HARDENING_COLUMNS)} "
+            f"FROM binaries b JOIN firmware f ON f.firmware = b.firmware WHERE {where} "
+            "ORDER BY f.device, f.version, b.path", params, ["firmware", "path"] + HARDENING_COLUMNS)
+
+def firmware_query(args):
+    clauses, params = firmware_filters(args)
+    where = " AND ".join(clauses) or "1"
+    return (f"""SELECT f.firmware, f.device, f.version,
+               (SELECT count(*) FROM binaries b WHERE b.firmware = f.firmware),
+               (SELECT count(DISTINCT p.app) FROM app_permissions p WHERE p.firmware = f.firmware),
+               (SELECT count(DISTINCT k.option) FROM kernel_config k WHERE k.firmware = f.firmware
+                AND k.value IN ('y', 'm'))
+            FROM firmware f WHERE {where} ORDER BY f.device, f.version""",
+            params, ["firmware", "device", "version", "binaries", "apps", "kernel options on"])
+
+def print_rows(columns, rows, elapsed):
+    print("\t".join(columns))
+    for row in rows:
+        print("\t".join("" if value is None else str(value) for value in row))
+    print(f"{len(rows)} rows in {elapsed * 1000:.0f} ms")
+
+def add_firmware_arguments(parser):
+    parser.add_argument("--device")
+    parser.add_argument("--version", type=int)
+    parser.add_argument("--firmware", help="Firmware folder name")
+    parser.add_argument("--kernel-missing", action="append", metavar="CONFIG",
+                        help="Only builds whose kernel lacks this option (repeatable)")
+    parser.add_argument("--kernel-enabled", action="append", metavar="CONFIG",
+                        help="Only builds whose kernel has this option (repeatable)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the firmware inventory store")
+    parser.add_argument("--store", default=STORE_PATH, help="SQLite store path")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingest_parser = commands.add_parser("ingest", help="Backfill from existing analyzer outputs")
+    ingest_parser.add_argument("folders", nargs="*", help="Firmware folders")
+    ingest_parser.add_argument("--hardening-db", default="binary_hardening.db", help="binary_scanner.py database")
+    ingest_parser.add_argument("--index", default="binary_index.db", help="dependency_index.py index")
+    ingest_parser.add_argument("--kernel-cache", default="kernel_image_cache.json", help="kernel_image_analyze.py cache")
+    ingest_parser.add_argument("--configs", help="Folder of <firmware>_configuration files")
+
+    apps = commands.add_parser("apps", help="Apps by permissions, API usage and native libraries")
+    add_firmware_arguments(apps)
+    apps.add_argument("--bucket", choices=["dangerous", "normal", "signature", "signatureOrSystem", "others"],
+                      help="Only permissions of this protection level")
+    apps.add_argument("--permission", help="Only this permission")
+    apps.add_argument("--usage", choices=["used", "unused", "undeclared"],
+                      help="Only permissions with this DEX API scan status")
+    apps.add_argument("--unhardened-lib", action="store_true",
+                      help="Only apps bundling or linking a native library that misses --missing")
+    apps.add_argument("--missing", nargs="+", default=UNHARDENED, choices=sorted(MISSING),
+                      help="Mitigations whose absence makes a library unhardened (any of them)")
+
+    binaries = commands.add_parser("binaries", help="Binaries by missing mitigations and dependencies")
+    add_firmware_arguments(binaries)
+    binaries.add_argument("--missing", nargs="+", choices=sorted(MISSING), help="Lacking any of these mitigations")
+    binaries.add_argument("--app", help="Only the native libraries of this app")
+    binaries.add_argument("--needs", metavar="LIBRARY", help="Only binaries with this DT_NEEDED entry")
+
+    firmware = commands.add_parser("firmware", help="Firmwares with their binary, app and kernel option counts")
+    add_firmware_arguments(firmware)
+
+    sql = commands.add_parser("sql", help="Run a read-only SQL query")
+    sql.add_argument("query")
+    args = parser.parse_args()
+
+    if args.command == "ingest":
+        with InventoryStore(args.store) as store:
+            ingest(store, args.folders, args.hardening_db, args.index, args.kernel_cache, args.configs)
+        return
+
+    conn = sqlite3.connect(f"file:{args.store}?mode=ro", uri=True)
+    if args.command == "sql":
+        query, params, columns = args.query, [], None
+    else:
+        query, params, columns = {"apps": apps_query, "binaries": binaries_query,
+                                  "firmware": firmware_query}[args.command](args)
+    start = time.perf_counter()
+    cursor = conn.execute(query, params)
+    rows = cursor.fetchall()
+    print_rows(columns or [d[0] for d in cursor.description], rows, time.perf_counter() - start)
+
+if __name__ == "__main__":
+    main()
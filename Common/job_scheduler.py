@@ -0,0 +1,210 @@
+import json
+import os
+import resource
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+# Memory-aware process pool for jobs whose memory use grows with the input size (androguard on
+# large APKs, whole partition images). Each job's peak RSS is estimated from its input size and
+# the history of earlier runs, and jobs are only started while the estimates fit a global budget.
+
+HISTORY_PATH = os.environ.get("JOB_HISTORY", "job_history.json")
+DEFAULT_BASELINE = 200 * 1024 * 1024  # RSS of a worker before its first job
+LARGE_SHARE = 0.5  # Jobs estimated above this share of the budget run alone
+MAX_SAMPLES = 500  # (size, start RSS, peak RSS) samples kept per kind
+MAX_TASKS_PER_CHILD = 20
+
+def available_memory():
+    """
+    MemAvailable from /proc/meminfo in bytes, or None when unknown.
+    """
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+def read_status(field):
+    """
+    A memory field (VmRSS, VmHWM) of /proc/self/status in bytes, or None when unknown.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+def reset_peak_rss():
+    """
+    Resets the process' peak RSS (VmHWM) to its current RSS, Linux only. Returns True on success.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def run_job(fn, item):
+    """
+    Worker: runs fn(item) and returns (result, error, RSS at job start, peak RSS during the job,
+    duration). Workers run several jobs, so the peak is reset before each job. Where that is not
+    possible ru_maxrss only tells this job's peak if it grew during the job, otherwise the peak
+    is None (no sample).
+    """
+    start_rss = read_status("VmRSS")
+    hwm_reset = reset_peak_rss()
+    maxrss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    start = time.perf_counter()
+    try:
+        result, error = fn(item), None
+    except Exception as e:
+        result, error = None, str(e)
+    duration = time.perf_counter() - start
+    peak_rss = read_status("VmHWM") if hwm_reset else None
+    if peak_rss is None:
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        peak_rss = maxrss if maxrss > maxrss_before else None
+    return result, error, start_rss or DEFAULT_BASELINE, peak_rss, duration
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(int(len(values) * share), len(values) - 1)]
+
+class JobHistory:
+    """
+    Persisted (input size, RSS at job start, peak RSS) samples per job kind.
+    """
+    def __init__(self, path=HISTORY_PATH):
+        self.path = path
+        try:
+            with open(path) as f:
+                self.samples = json.load(f)
+        except (OSError, ValueError):
+            self.samples = {}
+
+    def add(self, kind, size, start_rss, peak_rss):
+        samples = self.samples.setdefault(kind, [])
+        samples.append([size, start_rss, peak_rss])
+        del samples[:-MAX_SAMPLES]
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.samples, f)
+        os.replace(tmp_path, self.path)
+
+    def model(self, kind, default_factor, baseline=DEFAULT_BASELINE):
+        """
+        Returns (baseline, fixed cost, bytes of RSS per input byte) of a job: a worker starts at
+        baseline and a job adds its fixed cost plus factor * size. The factor is the Theil-Sen
+        slope (median of the pairwise slopes) of the per-job RSS growth over the input size, so a
+        few tiny inputs with a large fixed cost can't inflate it. The fixed cost is the 90th
+        percentile of the residuals, so estimates err on the high side.
+        """
+        # Samples of older versions ([size, peak]) hold the lifetime peak of the worker, not the job's
+        samples = [sample for sample in self.samples.get(kind, []) if len(sample) == 3]
+        if not samples:
+            return baseline, 0, default_factor
+        baseline = percentile([start_rss for _, start_rss, _ in samples], 0.5)
+        growth = [(size, max(peak_rss - start_rss, 0)) for size, start_rss, peak_rss in samples]
+        slopes = [(g2 - g1) / (s2 - s1) for i, (s1, g1) in enumerate(growth) for s2, g2 in growth[i + 1:] if s2 != s1]
+        factor = max(percentile(slopes, 0.5), 0) if slopes else default_factor
+        fixed = max(percentile([g - factor * s for s, g in growth], 0.9), 0)
+        return baseline, fixed, factor
+
+class JobScheduler:
+    """
+    Runs fn over items in a process pool under a global RSS budget. Items are started largest
+    first; an item estimated above LARGE_SHARE of the budget runs alone, smaller ones are packed
+    while their estimates fit. Workers are replaced after max_tasks_per_child jobs.
+    """
+    def __init__(self, fn, kind, default_factor, budget=None, max_workers=None,
+                 max_tasks_per_child=MAX_TASKS_PER_CHILD, history_path=HISTORY_PATH, size_of=os.path.getsize):
+        self.fn = fn
+        self.kind = kind
+        self.default_factor = default_factor
+        self.budget = budget or int((available_memory() or 4 * 1024 ** 3) * 0.7)
+        self.max_workers = max_workers or os.cpu_count() or 4
+        self.max_tasks_per_child = max_tasks_per_child
+        self.history = JobHistory(history_path)
+        self.size_of = size_of
+
+    def estimate(self, size, model=None):
+        baseline, fixed, factor = model or self.history.model(self.kind, self.default_factor)
+        return int(baseline + fixed + factor * size)
+
+    def make_pool(self):
+        try:
+            return ProcessPoolExecutor(max_workers=self.max_workers, max_tasks_per_child=self.max_tasks_per_child)
+        except TypeError:
+            # Python < 3.11 can't recycle workers
+            return ProcessPoolExecutor(max_workers=self.max_workers)
+
+    def run(self, items):
+        """
+        Yields (item, result, error, duration) as jobs finish.
+        """
+        model = self.history.model(self.kind, self.default_factor)
+        jobs = []
+        for index, item in enumerate(items):
+            size = self.size_of(item)
+            jobs.append((self.estimate(size, model), size, index, item))
+        jobs.sort(key=lambda job: job[0], reverse=True)
+        pending = deque(jobs)
+        large = self.budget * LARGE_SHARE
+        print(f"Scheduling {len(jobs)} {self.kind} jobs under a {self.budget / 1024 ** 3:.1f} GiB budget "
+              f"({sum(job[0] > large for job in jobs)} run alone)")
+
+        running = {}
+        suspects = set()  # Jobs running when a worker died, retried alone
+        used = 0
+        pool = self.make_pool()
+        broken = False
+        try:
+            while pending or running:
+                if broken and not running:
+                    # A worker died (e.g. OOM-killed), which breaks the whole pool
+                    pool.shutdown()
+                    pool = self.make_pool()
+                    broken = False
+                while pending and not broken and len(running) < self.max_workers:
+                    job = pending[0]
+                    alone = job[0] > large or job[2] in suspects
+                    if running and (alone or used + job[0] > self.budget
+                                    or any(other_alone for _, other_alone in running.values())):
+                        break
+                    pending.popleft()
+                    running[pool.submit(run_job, self.fn, job[3])] = (job, alone)
+                    used += job[0]
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job, _ = running.pop(future)
+                    estimate, size, index, item = job
+                    used -= estimate
+                    try:
+                        result, error, start_rss, peak_rss, duration = future.result()
+                    except BrokenProcessPool as e:
+                        broken = True
+                        if index not in suspects:
+                            # Any of the running jobs may have killed the worker, try each again alone
+                            suspects.add(index)
+                            pending.appendleft(job)
+                            continue
+                        result, error, duration = None, f"worker died: {e}", 0.0
+                    else:
+                        if peak_rss is not None:
+                            self.history.add(self.kind, size, start_rss, peak_rss)
+                    yield item, result, error, duration
+        finally:
+            pool.shutdown()
+            self.history.save()
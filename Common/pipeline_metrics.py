@@ -0,0 +1,224 @@
+import argparse
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Shared instrumentation for the pipeline scripts. Stage and item events are appended as JSON lines
+# to one file (PIPELINE_METRICS, default pipeline_metrics.jsonl) that every script and every run
+# shares, and `python pipeline_metrics.py report` summarizes where the wall time goes per firmware.
+#
+# Event fields: ts, script, pid, event ("stage" or "item"), stage, firmware, name, duration (s),
+# items, failures, bytes_read, bytes_written, error. Shell scripts write the same format with printf.
+
+METRICS_PATH = os.environ.get("PIPELINE_METRICS", "pipeline_metrics.jsonl")
+CONSOLE_INTERVAL = 5.0  # Seconds between two progress lines
+FLUSH_SIZE = 64 * 1024  # Buffered bytes written at once; whole lines only, so appends don't interleave
+
+class StageStats:
+    def __init__(self, stage, firmware):
+        self.stage = stage
+        self.firmware = firmware
+        self.start = time.perf_counter()
+        self.items = 0
+        self.failures = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+class PipelineMetrics:
+    """
+    Records per-stage and per-item durations, bytes and failures as JSON-lines events and prints
+    a throttled progress line instead of one line per item.
+    """
+    def __init__(self, script, path=None, console_interval=CONSOLE_INTERVAL):
+        self.script = script
+        self.path = path or METRICS_PATH
+        self.console_interval = console_interval
+        self.lock = threading.Lock()
+        self.buffer = []
+        self.buffered = 0
+        self.stages = {}
+        self.last_print = 0.0
+        self.fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        atexit.register(self.close)
+
+    def event(self, event, **fields):
+        line = json.dumps({"ts": round(time.time(), 3), "script": self.script, "pid": os.getpid(),
+                           "event": event, **fields}) + "\n"
+        with self.lock:
+            self.buffer.append(line)
+            self.buffered += len(line)
+            if self.buffered >= FLUSH_SIZE:
+                self._flush()
+
+    def _flush(self):
+        if self.buffer and self.fd is not None:
+            os.write(self.fd, "".join(self.buffer).encode())
+        self.buffer = []
+        self.buffered = 0
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def close(self):
+        with self.lock:
+            self._flush()
+            if self.fd is not None:
+                os.close(self.fd)
+                self.fd = None
+
+    @contextmanager
+    def stage(self, stage, firmware=None):
+        """
+        Times a stage. Items recorded for the same (stage, firmware) while it is open are added
+        to its totals.
+        """
+        stats = StageStats(stage, firmware)
+        self.stages[(stage, firmware)] = stats
+        error = None
+        try:
+            yield stats
+        except BaseException as e:
+            error = repr(e)
+            raise
+        finally:
+            del self.stages[(stage, firmware)]
+            duration = time.perf_counter() - stats.start
+            self.event("stage", stage=stage, firmware=firmware, duration=round(duration, 3), items=stats.items,
+                       failures=stats.failures, bytes_read=stats.bytes_read, bytes_written=stats.bytes_written,
+                       error=error)
+            self.flush()
+            print(f"[{stage}]{' ' + firmware if firmware else ''} done in {duration:.1f}s: {stats.items} items, "
+                  f"{stats.failures} failed, {stats.bytes_read / 1e6:.1f} MB read, "
+                  f"{stats.bytes_written / 1e6:.1f} MB written")
+
+    def item(self, stage, name, duration, firmware=None, bytes_read=0, bytes_written=0, error=None):
+        """
+        Records one processed item (file, APK, download...).
+        """
+        self.event("item", stage=stage, firmware=firmware, name=name, duration=round(duration, 4),
+                   bytes_read=bytes_read, bytes_written=bytes_written, error=error)
+        # Items of a firmware also count towards an open stage that spans all firmwares
+        stats = self.stages.get((stage, firmware)) or self.stages.get((stage, None))
+        if stats is not None:
+            with self.lock:
+                stats.items += 1
+                stats.failures += error is not None
+                stats.bytes_read += bytes_read
+                stats.bytes_written += bytes_written
+        if error is not None:
+            print(f"[{stage}] {name} failed: {error}")
+        self.progress()
+
+    @contextmanager
+    def timed_item(self, stage, name, firmware=None, bytes_read=0):
+        """
+        Times the enclosed block as one item. The yielded dict can update bytes_read/bytes_written.
+        Exceptions are recorded as failures and re-raised.
+        """
+        counters = {"bytes_read": bytes_read, "bytes_written": 0}
+        start = time.perf_counter()
+        error = None
+        try:
+            yield counters
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            self.item(stage, name, time.perf_counter() - start, firmware, counters["bytes_read"],
+                      counters["bytes_written"], error)
+
+    def progress(self, force=False):
+        """
+        Prints one line per open stage, at most every console_interval seconds.
+        """
+        now = time.monotonic()
+        if not force and now - self.last_print < self.console_interval:
+            return
+        self.last_print = now
+        for stats in list(self.stages.values()):
+            print(f"[{stats.stage}]{' ' + stats.firmware if stats.firmware else ''} {stats.items} items, "
+                  f"{stats.failures} failed, "
+                  f"{stats.bytes_read / 1e6:.1f} MB read, {stats.bytes_written / 1e6:.1f} MB written, "
+                  f"{time.perf_counter() - stats.start:.0f}s")
+
+def load_events(path=METRICS_PATH):
+    events = []
+    with open(path) as f:
+        for line in f:
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                continue  # Partial line of a run that was killed
+    return events
+
+def summarize(events, top=3):
+    """
+    Returns {firmware: {"total": seconds, "stages": [(stage, script, seconds, items, failures,
+    bytes_read, bytes_written, slowest items)]}}, stages sorted by time spent.
+    """
+    stages = defaultdict(lambda: {"duration": 0.0, "items": 0, "failures": 0, "bytes_read": 0, "bytes_written": 0})
+    item_totals = defaultdict(lambda: {"duration": 0.0, "items": 0, "failures": 0, "bytes_read": 0, "bytes_written": 0})
+    slowest = defaultdict(list)
+    for event in events:
+        key = (event.get("firmware") or "-", event.get("stage"), event.get("script"))
+        totals = stages[key] if event.get("event") == "stage" else item_totals[key]
+        totals["duration"] += event.get("duration") or 0.0
+        totals["items"] += event.get("items", 1) or 0
+        totals["failures"] += event.get("failures", event.get("error") is not None) or 0
+        totals["bytes_read"] += event.get("bytes_read") or 0
+        totals["bytes_written"] += event.get("bytes_written") or 0
+        if event.get("event") == "item":
+            slowest[key].append((event.get("duration") or 0.0, event.get("name")))
+
+    # Items recorded outside a stage of their own firmware (e.g. parallel downloads) add up their durations
+    for key, totals in item_totals.items():
+        if key not in stages:
+            stages[key] = totals
+
+    report = defaultdict(lambda: {"total": 0.0, "stages": []})
+    for (firmware, stage, script), totals in stages.items():
+        items = sorted(slowest[(firmware, stage, script)], key=lambda item: item[0], reverse=True)[:top]
+        report[firmware]["total"] += totals["duration"]
+        report[firmware]["stages"].append((stage, script, totals["duration"], totals["items"], totals["failures"],
+                                           totals["bytes_read"], totals["bytes_written"], items))
+    for firmware in report:
+        report[firmware]["stages"].sort(key=lambda row: row[2], reverse=True)
+    return dict(report)
+
+def print_report(report):
+    print("\nWALL TIME PER FIRMWARE AND STAGE:")
+    print("=" * 50)
+    for firmware in sorted(report, key=lambda name: report[name]["total"], reverse=True):
+        total = report[firmware]["total"]
+        print(f"\n{firmware}: {total:.1f}s")
+        for stage, script, duration, items, failures, bytes_read, bytes_written, slowest in report[firmware]["stages"]:
+            share = duration / total * 100 if total else 0.0
+            print(f"  {stage:<20} {duration:>9.1f}s {share:5.1f}%  {items} items, {failures} failed, "
+                  f"{bytes_read / 1e6:.1f} MB read, {bytes_written / 1e6:.1f} MB written ({script})")
+            for item_duration, name in slowest:
+                print(f"      {item_duration:>8.2f}s  {name}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Pipeline metrics report")
+    parser.add_argument("command", choices=["report"])
+    parser.add_argument("--file", default=METRICS_PATH, help="JSON-lines metrics file")
+    parser.add_argument("--firmware", help="Only this firmware")
+    parser.add_argument("--top", type=int, default=3, help="Slowest items listed per stage")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.file):
+        print(f"No metrics file at {args.file}")
+        sys.exit(1)
+    report = summarize(load_events(args.file), args.top)
+    if args.firmware:
+        report = {name: value for name, value in report.items() if name == args.firmware}
+    print_report(report)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import io
+import mmap
+import os
+import struct
+import sys
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from fs_image import open_buffer
+
+# Base directory containing all firmware folders
+BASE_DIR = " "
+
+ELF_MAGIC = b"\x7fELF"
+APEX_PAYLOAD = "apex_payload.img"
+CAPEX_ORIGINAL = "original_apex"
+MAX_WORKERS = os.cpu_count() or 4
+
+def stored_member_offset(zf, info):
+    """
+    Returns the absolute offset of an uncompressed zip member's data, read from its local header.
+    """
+    zf.fp.seek(info.header_offset)
+    header = zf.fp.read(30)
+    name_len, extra_len = struct.unpack_from("<HH", header, 26)
+    return info.header_offset + 30 + name_len + extra_len
+
+def open_payload(apex_file, view):
+    """
+    Returns the apex_payload.img bytes of an APEX or CAPEX as a buffer, without extracting anything
+    to disk. Stored payloads of plain APEXes are served as a slice of view, the mmapped file.
+    """
+    zf = zipfile.ZipFile(apex_file)
+    if CAPEX_ORIGINAL in zf.namelist():
+        # CAPEX: the real APEX is a deflated member, decompress it in memory
+        inner = zf.read(CAPEX_ORIGINAL)
+        zf.close()
+        zf = zipfile.ZipFile(io.BytesIO(inner))
+        info = zf.getinfo(APEX_PAYLOAD)
+        if info.compress_type == zipfile.ZIP_STORED:
+            start = stored_member_offset(zf, info)
+            return memoryview(inner)[start:start + info.file_size]
+        return zf.read(info)
+    with zf:
+        info = zf.getinfo(APEX_PAYLOAD)
+        if info.compress_type == zipfile.ZIP_STORED:
+            start = stored_member_offset(zf, info)
+            return view[start:start + info.file_size]
+        return zf.read(info)
+
+def output_folder(apex_file):
+    """
+    Same folder naming as apex_extractor.sh (foo.apex -> fooa), except that a CAPEX keeps its
+    extension in the name so that foo.apex and foo.capex don't extract into the same folder.
+    """
+    root, ext = os.path.splitext(apex_file)
+    return root + "a" if ext == ".apex" else f"{root}_{ext.lstrip('.')}a"
+
+def extract_apex(apex_file, output_dir=None):
+    """
+    Writes only the ELF files of an APEX payload (ext4 or EROFS) below output_dir.
+    Returns the number of ELF files written.
+    """
+    output_dir = output_dir or output_folder(apex_file)
+    count = 0
+    with open(apex_file, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    payload = None
+    try:
+        with memoryview(mapped) as view:
+            payload = open_payload(apex_file, view)
+            image = open_buffer(payload)
+            for path, ino in image.walk():
+                if image.read_head(ino, 4) != ELF_MAGIC:
+                    continue
+                dest = os.path.join(output_dir, path.lstrip("/"))
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                image.extract(ino, dest)
+                count += 1
+    finally:
+        if isinstance(payload, memoryview):
+            payload.release()
+        try:
+            mapped.close()
+        except BufferError:
+            # A failed copy's traceback still references chunk views of the payload, the mapping
+            # is then unmapped once they are freed; don't hide the original error behind this one
+            pass
+    return count
+
+def find_apex_files(apex_dir):
+    apex_files = []
+    for root, _, files in os.walk(apex_dir):
+        apex_files.extend(os.path.join(root, f) for f in files if f.endswith((".apex", ".capex")))
+    return sorted(apex_files)
+
+def extract_apex_files(apex_files, max_workers=MAX_WORKERS):
+    """
+    Extracts many APEXes concurrently, one worker process per APEX.
+    """
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(extract_apex, apex_file): apex_file for apex_file in apex_files}
+        for future in as_completed(futures):
+            apex_file = futures[future]
+            try:
+                print(f">> Extracted {future.result()} ELF files from {apex_file}")
+            except (OSError, KeyError, ValueError, NotImplementedError, BufferError, zipfile.BadZipFile) as e:
+                print(f">> ERROR: Failed to extract {apex_file}: {e}")
+
+def main():
+    firmware_dirs = sys.argv[1:] or [os.path.join(BASE_DIR, f) for f in sorted(os.listdir(BASE_DIR))]
+    apex_files = []
+    for firmware_dir in firmware_dirs:
+        apex_dir = os.path.join(firmware_dir, "binary", "binary_system", "apex")
+        if os.path.isdir(apex_dir):
+            apex_files.extend(find_apex_files(apex_dir))
+        elif os.path.isdir(firmware_dir):
+            print(f">> ERROR: No 'apex' directory found in {firmware_dir}")
+    print(f"===== Extracting {len(apex_files)} APEX files =====")
+    extract_apex_files(apex_files)
+
+if __name__ == "__main__":
+    main()
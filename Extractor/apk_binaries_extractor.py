@@ -0,0 +1,98 @@
+import glob
+import os
+import shutil
+import sys
+import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Base directory containing all the firmware folders
+BASE_DIR = " "
+
+ELF_MAGIC = b"\x7fELF"
+DEX_MAGIC = b"dex\n"
+MANIFEST = "AndroidManifest.xml"
+COPY_CHUNK = 1024 * 1024
+MAX_WORKERS = os.cpu_count() or 4
+
+def safe_member_path(output_dir, name):
+    """
+    Maps a zip member name below output_dir, refusing absolute or parent-relative names.
+    """
+    rel_path = os.path.normpath(name)
+    if os.path.isabs(rel_path) or rel_path.startswith(".."):
+        return None
+    return os.path.join(output_dir, rel_path)
+
+def extract_apk_binaries(apk_file, output_dir):
+    """
+    Walks the APK central directory once and streams out only entries whose first bytes are an
+    ELF or DEX magic, plus AndroidManifest.xml for reference. Returns (elf_count, dex_count).
+    """
+    elf_count = dex_count = 0
+    with zipfile.ZipFile(apk_file) as zf:
+        for info in zf.infolist():
+            if info.is_dir() or info.file_size < 4:
+                continue
+            dest = safe_member_path(output_dir, info.filename)
+            if dest is None:
+                print(f"    Skipping unsafe entry: {info.filename}")
+                continue
+            with zf.open(info) as src:
+                head = src.read(4)
+                if head == ELF_MAGIC:
+                    elf_count += 1
+                elif head == DEX_MAGIC:
+                    dex_count += 1
+                elif info.filename != MANIFEST:
+                    continue
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                with open(dest, "wb") as out:
+                    out.write(head)
+                    shutil.copyfileobj(src, out, COPY_CHUNK)
+    return elf_count, dex_count
+
+def extract_firmware_apks(firmware_dir, max_workers=MAX_WORKERS):
+    """
+    Extracts the binaries of every APK in firmware_dir/apps with one worker process per APK.
+    """
+    apps_dir = os.path.join(firmware_dir, "apps")
+    output_dir = os.path.join(firmware_dir, "apps_binaries")
+
+    print(f"Processing firmware: {firmware_dir}")
+    if not os.path.isdir(apps_dir):
+        print(f"  Apps directory not found: {apps_dir}")
+        return
+
+    apk_files = sorted(glob.glob(os.path.join(apps_dir, "**", "*.apk"), recursive=True))
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {}
+        for apk_file in apk_files:
+            apk_name = os.path.splitext(os.path.basename(apk_file))[0]
+            futures[pool.submit(extract_apk_binaries, apk_file, os.path.join(output_dir, apk_name))] = apk_name
+
+        for future in as_completed(futures):
+            apk_name = futures[future]
+            try:
+                elf_count, dex_count = future.result()
+            # RuntimeError: encrypted entry, NotImplementedError: unsupported compression method,
+            # zlib.error/EOFError: corrupt or truncated deflate data
+            except (OSError, RuntimeError, NotImplementedError, EOFError, zlib.error, zipfile.BadZipFile,
+                    zipfile.LargeZipFile) as e:
+                print(f"  Failed to extract APK {apk_name}: {e}")
+                continue
+            print(f"  {apk_name}: {elf_count} ELF, {dex_count} DEX files")
+
+    print(f"  Processed {len(apk_files)} APK files in {firmware_dir}")
+
+def main():
+    print("Starting APK binary extraction...")
+    firmware_dirs = sys.argv[1:] or sorted(glob.glob(os.path.join(BASE_DIR, "q*_v*")))
+    for firmware_dir in firmware_dirs:
+        if os.path.isdir(firmware_dir):
+            extract_firmware_apks(firmware_dir)
+            print("----------------------------------------")
+    print("APK binary extraction complete!")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import csv
+import os
+import sys
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from fs_image import open_image, image_partition
+
+# Base directory containing the extracted firmware folders
+BASE_DIR = " "
+
+IMG_FILES = ["system.img", "vendor.img", "product.img", "odm.img", "vendor_dlkm.img", "odm_dlkm.img", "system_ext.img"]
+MANIFEST_NAME = "apk_manifest.csv"
+# APKs the reader can't extract (compressed EROFS), copied from a mount by firmware_extractor.sh:
+# partition, path in the image (empty for the whole image) and output name, tab separated
+UNSUPPORTED_NAME = "unsupported_apks.tsv"
+MAX_WORKERS = os.cpu_count() or 4
+
+def list_apks(image_file):
+    """
+    Lists (path, ino, size) of every APK in a partition image straight from filesystem metadata.
+    """
+    with open_image(image_file) as image:
+        return [(path, ino, image.file_size(ino)) for path, ino in image.walk() if path.endswith(".apk")]
+
+def assign_output_names(entries):
+    """
+    Keeps the plain APK file name where it is unique across all partitions, and prefixes
+    colliding names with their partition and directory so nothing gets overwritten.
+    """
+    counts = Counter(os.path.basename(path) for _, path, _, _ in entries)
+    names = []
+    for partition, path, _, _ in entries:
+        name = os.path.basename(path)
+        if counts[name] > 1:
+            name = f"{partition}{os.path.dirname(path)}/{name}".replace("/", "_")
+        names.append(name)
+    return names
+
+def extract_apk(image, ino, dest):
+    image.extract(ino, dest)
+    return dest
+
+def harvest_apks(folder, apps_dir=None, max_workers=MAX_WORKERS):
+    """
+    Extracts every APK of the partition images in folder into apps_dir in parallel,
+    writes a provenance manifest and yields each APK path as soon as it is on disk.
+    APKs stored in layouts the reader does not support are listed in UNSUPPORTED_NAME.
+    """
+    apps_dir = apps_dir or os.path.join(folder, "apps")
+    os.makedirs(apps_dir, exist_ok=True)
+
+    entries = []
+    unsupported = []
+    for img in IMG_FILES:
+        image_file = os.path.join(folder, img)
+        if not os.path.isfile(image_file):
+            print(f"{img} not found in {folder}")
+            continue
+        try:
+            apks = list_apks(image_file)
+        except (ValueError, NotImplementedError) as e:
+            print(f"Cannot list APKs in {image_file}: {e}")
+            if isinstance(e, NotImplementedError):
+                unsupported.append((image_partition(image_file), "", ""))
+            continue
+        print(f"Found {len(apks)} APKs in {img}")
+        entries.extend((image_partition(image_file), path, ino, size) for path, ino, size in apks)
+
+    names = assign_output_names(entries)
+    with open(os.path.join(apps_dir, MANIFEST_NAME), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["apk", "partition", "path", "size"])
+        for name, (partition, path, _, size) in zip(names, entries):
+            writer.writerow([name, partition, path, size])
+
+    images = {}
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {}
+            for name, (partition, path, ino, _) in zip(names, entries):
+                if partition not in images:
+                    images[partition] = open_image(os.path.join(folder, f"{partition}.img"))
+                dest = os.path.join(apps_dir, name)
+                futures[pool.submit(extract_apk, images[partition], ino, dest)] = (partition, path, name)
+
+            for future in as_completed(futures):
+                partition, path, name = futures[future]
+                try:
+                    dest = future.result()
+                except (OSError, ValueError, NotImplementedError) as e:
+                    print(f"Failed to extract {partition}:{path}: {e}")
+                    # Don't leave a partial APK behind for the analysis
+                    partial = os.path.join(apps_dir, name)
+                    if os.path.exists(partial):
+                        os.remove(partial)
+                    if isinstance(e, NotImplementedError):
+                        unsupported.append((partition, path, name))
+                    continue
+                print(f"Extracted: {partition}:{path}")
+                yield dest
+    finally:
+        for image in images.values():
+            image.close()
+
+    unsupported_file = os.path.join(apps_dir, UNSUPPORTED_NAME)
+    if unsupported:
+        with open(unsupported_file, "w", newline="") as f:
+            csv.writer(f, delimiter="\t", lineterminator="\n").writerows(sorted(unsupported))
+        print(f"{len(unsupported)} APKs in unsupported layouts listed in {unsupported_file}")
+    elif os.path.exists(unsupported_file):
+        os.remove(unsupported_file)
+
+def main():
+    folders = sys.argv[1:] or [os.path.join(BASE_DIR, f) for f in sorted(os.listdir(BASE_DIR))]
+    for folder in folders:
+        if not os.path.isdir(folder):
+            continue
+        print(f"Harvesting APKs from {folder}")
+        count = sum(1 for _ in harvest_apks(folder))
+        print(f"Finished APK extraction for {folder}: {count} APKs")
+
+if __name__ == "__main__":
+    main()
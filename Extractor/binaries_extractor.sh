@@ -1,10 +1,37 @@
 import os
 import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Common"))
+from pipeline_metrics import PipelineMetrics
+from job_scheduler import JobScheduler
+from sparse_image import is_sparse, unsparse
 
 # Define the base directory and the mount base path
 firmware_dir = " "
 mount_base = " "
 
+IMAGE_TYPES = ("system", "vendor", "odm")
+# Folders to copy from each image type, and their name under binary/binary_<image type>/
+FOLDERS_TO_COPY = {
+    "system": {
+        "/system/bin": "bin",
+        "/system/lib": "lib",
+        "/system/lib64": "lib64",
+        "/system/vendor/bin": "vendor_bin",
+        "/system/vendor/lib": "vendor_lib",
+        "/system/vendor/lib64": "vendor_lib64",
+        "/system/apex": "apex"
+    },
+    "vendor": {"/bin": "bin", "/lib": "lib", "/lib64": "lib64"},
+    "odm": {"/bin": "bin", "/lib": "lib", "/lib64": "lib64"},
+}
+# Rough peak RSS per byte of image until job_history.json has real samples
+IMAGE_RSS_FACTOR = 0.05
+
+metrics = PipelineMetrics("binaries_extractor.sh")
+
 # Function to check and unmount if already mounted
 def unmount_if_mounted(mount_point):
     try:
@@ -39,33 +66,25 @@ def detect_filesystem(image_file):
 def process_image(image_type, folder):
     firmware_path = os.path.join(firmware_dir, folder)
     image_file = os.path.join(firmware_path, f"{image_type}.img")
-    mount_point = mount_base
+    # One mount point per job, so images can be processed concurrently
+    mount_point = os.path.join(mount_base, f"{folder}_{image_type}")
     binary_folder = os.path.join(firmware_path, "binary")
     binary_subfolder = os.path.join(binary_folder, f"binary_{image_type}")
-
-    # Define the folders to copy based on the image type
-    if image_type == "system":
-        folders_to_copy = {
-            "/system/bin": "bin",
-            "/system/lib": "lib",
-            "/system/lib64": "lib64",
-            "/system/vendor/bin": "vendor_bin",
-            "/system/vendor/lib": "vendor_lib",
-            "/system/vendor/lib64": "vendor_lib64",
-            "/system/apex": "apex"
-        }
-    else:  # vendor or odm
-        folders_to_copy = {
-            "/bin": "bin",
-            "/lib": "lib",
-            "/lib64": "lib64"
-        }
+    stage = f"binaries_{image_type}"
 
     # Check if the image file exists
     if not os.path.exists(image_file):
         print(f"{image_type}.img not found in {folder}. Skipping...")
         return
 
+    # Android sparse images can't be mounted; expand them once into a raw image that keeps
+    # the unused blocks as holes
+    if is_sparse(image_file):
+        raw_image = os.path.join(firmware_path, f"{image_type}.raw.img")
+        if not os.path.exists(raw_image):
+            unsparse(image_file, raw_image)
+        image_file = raw_image
+
     # Detect file system type
     fs_type = detect_filesystem(image_file)
     if not fs_type:
@@ -73,6 +92,7 @@ def process_image(image_type, folder):
         return
 
     # Unmount if already mounted
+    os.makedirs(mount_point, exist_ok=True)
     unmount_if_mounted(mount_point)
 
     # Mount the image file
@@ -87,7 +107,7 @@ def process_image(image_type, folder):
     os.makedirs(binary_subfolder, exist_ok=True)
 
     # Copy only the specified folders
-    for src_folder, dest_folder_name in folders_to_copy.items():
+    for src_folder, dest_folder_name in FOLDERS_TO_COPY[image_type].items():
         source_folder = os.path.join(mount_point, src_folder.lstrip("/"))  # Remove leading /
         dest_folder = os.path.join(binary_subfolder, dest_folder_name)  # Keep vendor files separate
 
@@ -105,17 +125,19 @@ def process_image(image_type, folder):
                     dest_parent = os.path.dirname(dest_file)
                     os.makedirs(dest_parent, exist_ok=True)  # Create parent directories if missing
 
-                    # Debugging output
+                    # One metrics event per file, the console only gets a periodic progress line
+                    start = time.perf_counter()
                     if not os.path.exists(src_file):
-                        print(f"ERROR: Source file missing -> {src_file}")
+                        metrics.item(stage, src_file, 0.0, folder, error="Source file missing")
                     elif not os.access(src_file, os.R_OK):
-                        print(f"ERROR: No read permission -> {src_file}")
+                        metrics.item(stage, src_file, 0.0, folder, error="No read permission")
                     else:
                         try:
                             subprocess.run(["cp", "-a", src_file, dest_file], check=True)
-                            print(f"Copied: {src_file} -> {dest_file}")
-                        except subprocess.CalledProcessError:
-                            print(f"Warning: Failed to copy {src_file}")
+                            metrics.item(stage, src_file, time.perf_counter() - start, folder,
+                                         bytes_written=os.lstat(dest_file).st_size)
+                        except subprocess.CalledProcessError as e:
+                            metrics.item(stage, src_file, time.perf_counter() - start, folder, error=str(e))
 
             print(f"Copied {source_folder} to {dest_folder}")
         else:
@@ -128,11 +150,31 @@ def process_image(image_type, folder):
     except subprocess.CalledProcessError as e:
         print(f"Failed to unmount {mount_point}: {e}")
 
-# Process all firmware folders for system, vendor, and odm images
-for folder in os.listdir(firmware_dir):
-    folder_path = os.path.join(firmware_dir, folder)
-    if os.path.isdir(folder_path):
-        process_image("system", folder)
-        process_image("vendor", folder)
-        process_image("odm", folder)
+# JobScheduler worker: one partition image
+def process_image_job(image_file):
+    image_type = os.path.splitext(os.path.basename(image_file))[0]
+    folder = os.path.basename(os.path.dirname(image_file))
+    process_image(image_type, folder)
+    metrics.flush()
+
+if __name__ == "__main__":
+    # Process the system, vendor, and odm images of all firmware folders, packed under a memory budget
+    image_files = []
+    for folder in os.listdir(firmware_dir):
+        folder_path = os.path.join(firmware_dir, folder)
+        if os.path.isdir(folder_path):
+            for image_type in IMAGE_TYPES:
+                image_file = os.path.join(folder_path, f"{image_type}.img")
+                if os.path.exists(image_file):
+                    image_files.append(image_file)
+                else:
+                    print(f"{image_type}.img not found in {folder}. Skipping...")
+
+    scheduler = JobScheduler(process_image_job, "partition_image", IMAGE_RSS_FACTOR)
+    with metrics.stage("binaries"):
+        for image_file, _, error, duration in scheduler.run(image_files):
+            if error:
+                print(f"Failed to process {image_file}: {error}")
+            else:
+                print(f"Processed {image_file} in {duration:.1f}s")
 
@@ -0,0 +1,163 @@
+import argparse
+import mmap
+import os
+import struct
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import nullcontext
+from kernel_config import extract_ikconfig
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Common"))
+from inventory_store import STORE_PATH, InventoryStore, parse_kernel_config
+
+# Base directory containing the firmware folders
+BASE_DIR = " "
+
+BOOT_MAGIC = b"ANDROID!"
+VENDOR_BOOT_MAGIC = b"VNDRBOOT"
+BOOT_V3_PAGE_SIZE = 4096
+COPY_CHUNK = 4 * 1024 * 1024
+MAX_WORKERS = os.cpu_count() or 4
+
+def align(offset, page_size):
+    return (offset + page_size - 1) // page_size * page_size
+
+def parse_boot_header(data):
+    """
+    Returns (header_version, [(section, offset, size), ...]) for a boot.img with header v0-v4.
+    """
+    if data[:8] != BOOT_MAGIC:
+        raise ValueError("Not an Android boot image")
+    header_version = struct.unpack_from("<I", data, 40)[0]
+
+    if header_version >= 3:
+        kernel_size, ramdisk_size = struct.unpack_from("<II", data, 8)
+        page_size = BOOT_V3_PAGE_SIZE
+        sections = [("kernel", kernel_size), ("ramdisk", ramdisk_size)]
+        if header_version >= 4:
+            sections.append(("boot_signature", struct.unpack_from("<I", data, 1580)[0]))
+    else:
+        kernel_size, _, ramdisk_size, _, second_size = struct.unpack_from("<5I", data, 8)
+        page_size = struct.unpack_from("<I", data, 36)[0]
+        sections = [("kernel", kernel_size), ("ramdisk", ramdisk_size), ("second", second_size)]
+        if header_version >= 1:
+            sections.append(("recovery_dtbo", struct.unpack_from("<I", data, 1632)[0]))
+        if header_version >= 2:
+            sections.append(("dtb", struct.unpack_from("<I", data, 1648)[0]))
+
+    return header_version, layout_sections(sections, page_size, page_size)
+
+def parse_vendor_boot_header(data):
+    """
+    Returns (header_version, [(section, offset, size), ...]) for a vendor_boot.img (v3/v4).
+    """
+    if data[:8] != VENDOR_BOOT_MAGIC:
+        raise ValueError("Not an Android vendor_boot image")
+    header_version, page_size = struct.unpack_from("<II", data, 8)
+    vendor_ramdisk_size = struct.unpack_from("<I", data, 24)[0]
+    header_size, dtb_size = struct.unpack_from("<II", data, 2096)
+    sections = [("vendor_ramdisk", vendor_ramdisk_size), ("dtb", dtb_size)]
+    if header_version >= 4:
+        table_size = struct.unpack_from("<I", data, 2112)[0]
+        bootconfig_size = struct.unpack_from("<I", data, 2124)[0]
+        sections += [("vendor_ramdisk_table", table_size), ("bootconfig", bootconfig_size)]
+    return header_version, layout_sections(sections, align(header_size, page_size), page_size)
+
+def layout_sections(sections, start, page_size):
+    """
+    Turns (name, size) pairs stored back to back on page boundaries into (name, offset, size).
+    """
+    layout = []
+    offset = start
+    for name, size in sections:
+        if size:
+            layout.append((name, offset, size))
+        offset += align(size, page_size)
+    return layout
+
+def write_section(data, offset, size, dest):
+    with open(dest, "wb") as f:
+        for start in range(offset, offset + size, COPY_CHUNK):
+            f.write(data[start:min(start + COPY_CHUNK, offset + size)])
+
+def extract_boot_image(image_file, output_dir, config_name=None):
+    """
+    Memory-maps a boot or vendor_boot image and writes each section to output_dir by offset.
+    For boot images the kernel buffer is handed straight to the IKCONFIG extraction and the
+    configuration is written to output_dir/config_name. Returns the list of written sections.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    with open(image_file, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(data)
+    try:
+        if data[:8] == VENDOR_BOOT_MAGIC:
+            header_version, sections = parse_vendor_boot_header(data)
+            prefix = "vendor_"
+        else:
+            header_version, sections = parse_boot_header(data)
+            prefix = ""
+
+        written = []
+        for name, offset, size in sections:
+            if offset + size > len(data):
+                print(f"Truncated {name} section in {image_file}")
+                continue
+            name = name if name.startswith(prefix) else prefix + name
+            write_section(data, offset, size, os.path.join(output_dir, name))
+            written.append(name)
+
+            if name == "kernel" and config_name:
+                config = extract_ikconfig(view[offset:offset + size])
+                if config is None:
+                    print(f"No IKCONFIG found in the kernel of {image_file}")
+                else:
+                    with open(os.path.join(output_dir, config_name), "w") as f:
+                        f.write(config)
+                    written.append(config_name)
+        print(f"{image_file}: header v{header_version}, extracted {', '.join(written)}")
+        return written
+    finally:
+        view.release()
+        data.close()
+
+def process_firmware(folder):
+    """
+    Extracts boot.img and vendor_boot.img of a firmware folder into folder/extracted.
+    """
+    folder_name = os.path.basename(os.path.normpath(folder))
+    output_dir = os.path.join(folder, "extracted")
+    written = []
+    for image, config_name in (("boot.img", f"{folder_name}_configuration"), ("vendor_boot.img", None)):
+        image_file = os.path.join(folder, image)
+        if os.path.isfile(image_file):
+            written += extract_boot_image(image_file, output_dir, config_name)
+    if not written:
+        print(f"No boot.img found in {folder}. Skipping.")
+    return written
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract boot.img/vendor_boot.img sections and the kernel config")
+    parser.add_argument("folders", nargs="*", help="Firmware folders (default: every folder under BASE_DIR)")
+    parser.add_argument("--store", default=STORE_PATH, help="Inventory store path ('' to skip)")
+    args = parser.parse_args()
+
+    folders = args.folders or [os.path.join(BASE_DIR, f) for f in sorted(os.listdir(BASE_DIR))]
+    folders = [f for f in folders if os.path.isdir(f)]
+    with ProcessPoolExecutor(max_workers=MAX_WORKERS) as pool, \
+            (InventoryStore(args.store) if args.store else nullcontext()) as store:
+        futures = {pool.submit(process_firmware, folder): folder for folder in folders}
+        for future in as_completed(futures):
+            try:
+                written = future.result()
+            except (OSError, ValueError, struct.error) as e:
+                print(f"Error processing {futures[future]}: {e}")
+                continue
+            folder_name = os.path.basename(os.path.normpath(futures[future]))
+            config_name = f"{folder_name}_configuration"
+            if store is not None and config_name in written:
+                with open(os.path.join(futures[future], "extracted", config_name)) as f:
+                    store.replace_kernel_config(folder_name, parse_kernel_config(f.read()), "ikconfig")
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,25 @@ BASE_DIR=""
 SDAT2IMG=""
 EXTRACTOR=""
 MOUNT_BASE=""
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+SDAT2IMG_STREAM="$SCRIPT_DIR/sdat2img_stream.py"
+APK_HARVESTER="$SCRIPT_DIR/apk_harvester.py"
+SPARSE_IMAGE="$SCRIPT_DIR/sparse_image.py"
+METRICS_FILE="${PIPELINE_METRICS:-pipeline_metrics.jsonl}"
+EXTRACTED_MARKER=".extracted"  # Same as stream_pipeline.py
+[[ "$METRICS_FILE" = /* ]] || METRICS_FILE="$PWD/$METRICS_FILE"
+
+# Appends a stage event in the Common/pipeline_metrics.py JSON-lines format
+# Usage: metric_stage <stage> <firmware> <start seconds> <exit status> [bytes written]
+metric_stage() {
+    local end duration error="null"
+    end=$(date +%s.%N)
+    duration=$(awk -v a="$end" -v b="$3" 'BEGIN { printf "%.3f", a - b }')
+    [[ "$4" -eq 0 ]] || error="\"exit status $4\""
+    printf '{"ts": %.3f, "script": "firmware_extractor.sh", "pid": %d, "event": "stage", "stage": "%s", "firmware": "%s", "duration": %s, "items": 1, "failures": %d, "bytes_read": 0, "bytes_written": %d, "error": %s}\n' \
+        "$end" $$ "$1" "$2" "$duration" "$(( $4 != 0 ))" "${5:-0}" "$error" >> "$METRICS_FILE"
+    echo "[$1] $2 done in ${duration}s"
+}
 
 # Check required tools
 [[ -f "$SDAT2IMG" ]] || { echo "Missing: $SDAT2IMG"; exit 1; }
@@ -15,8 +34,20 @@ for ZIP_FILE in "$BASE_DIR"/*.zip; do
     ZIP_NAME=$(basename "$ZIP_FILE" .zip)
     EXTRACT_DIR="$BASE_DIR/$ZIP_NAME"
 
+    # Complete extractions (while downloading with scraper.py --extract, or an earlier unzip) leave
+    # a marker; a folder without it is from an interrupted run and is unzipped again
+    if [[ -f "$EXTRACT_DIR/$EXTRACTED_MARKER" ]]; then
+        echo "Skipping $ZIP_FILE, already extracted to $EXTRACT_DIR"
+        continue
+    fi
+
     echo "Unzipping $ZIP_FILE → $EXTRACT_DIR"
-    unzip -q "$ZIP_FILE" -d "$EXTRACT_DIR" || continue
+    START=$(date +%s.%N)
+    unzip -o -q "$ZIP_FILE" -d "$EXTRACT_DIR"
+    STATUS=$?
+    metric_stage unzip "$ZIP_NAME" "$START" "$STATUS" "$(du -sb "$EXTRACT_DIR" 2>/dev/null | cut -f1)"
+    [[ $STATUS -eq 0 ]] || continue
+    touch "$EXTRACT_DIR/$EXTRACTED_MARKER"
 done
 
 # === Step 2: Process each extracted folder ===
@@ -25,11 +56,14 @@ for FOLDER in "$BASE_DIR"/*; do
     echo "Processing $FOLDER"
 
     cd "$FOLDER" || continue
+    FIRMWARE=$(basename "$FOLDER")
 
     # --- Step 2.1: Extract payload.bin using OTA extractor ---
     if [[ -f "payload.bin" ]]; then
         echo "Extracting payload.bin using ota-extractor"
+        START=$(date +%s.%N)
         "$EXTRACTOR" "payload.bin"
+        metric_stage payload "$FIRMWARE" "$START" $?
     fi
 
     # --- Step 2.2: Convert .dat.br to .img if needed ---
@@ -40,48 +74,66 @@ for FOLDER in "$BASE_DIR"/*; do
         TRANSFER_LIST="${PART}.transfer.list"
         IMG_FILE="${PART}.img"
 
-        if [[ -f "$BR_FILE" ]]; then
-            echo "Decompressing $BR_FILE"
-            brotli --decompress --output="$DAT_FILE" "$BR_FILE"
-        fi
-
-        if [[ -f "$DAT_FILE" && -f "$TRANSFER_LIST" ]]; then
+        # Stream the brotli data straight into the image, no intermediate .new.dat. Both converters
+        # write $IMG_FILE.tmp first, so an existing $IMG_FILE is always complete
+        if [[ -f "$IMG_FILE" ]]; then
+            echo "$IMG_FILE already generated"
+        elif [[ -f "$BR_FILE" && -f "$TRANSFER_LIST" ]]; then
+            echo "Generating $IMG_FILE from $BR_FILE"
+            START=$(date +%s.%N)
+            python3 "$SDAT2IMG_STREAM" "$TRANSFER_LIST" "$BR_FILE" "$IMG_FILE"
+            metric_stage "sdat2img_$PART" "$FIRMWARE" "$START" $? "$(du -B1 "$IMG_FILE" 2>/dev/null | cut -f1)"
+        elif [[ -f "$DAT_FILE" && -f "$TRANSFER_LIST" ]]; then
             echo "Generating $IMG_FILE"
-            python3 "$SDAT2IMG" "$TRANSFER_LIST" "$DAT_FILE" "$IMG_FILE"
+            START=$(date +%s.%N)
+            python3 "$SDAT2IMG" "$TRANSFER_LIST" "$DAT_FILE" "$IMG_FILE.tmp" && mv "$IMG_FILE.tmp" "$IMG_FILE"
+            STATUS=$?
+            [[ $STATUS -eq 0 ]] || rm -f "$IMG_FILE.tmp"
+            metric_stage "sdat2img_$PART" "$FIRMWARE" "$START" $STATUS "$(du -B1 "$IMG_FILE" 2>/dev/null | cut -f1)"
         fi
     done
 
-    # === Step 3: Mount and extract APKs ===
-    IMG_FILES=("system.img" "vendor.img" "product.img" "odm.img" "vendor_dlkm.img" "odm_dlkm.img" "system_ext.img")
-    APPS_DIR="$FOLDER/apps"
-    mkdir -p "$APPS_DIR"
-
-    for i in "${!IMG_FILES[@]}"; do
-        IMG="${IMG_FILES[$i]}"
-        MOUNT_POINT="$MOUNT_BASE/point$((i+1))"
-        mkdir -p "$MOUNT_POINT"
-
-        if [[ -f "$FOLDER/$IMG" ]]; then
+    # === Step 3: Extract APKs straight from the partition images ===
+    # Reads filesystem metadata directly (no mount/sudo) from raw or Android sparse images, sparse
+    # ones through their chunk map without expanding them; apps/apk_manifest.csv keeps the provenance
+    START=$(date +%s.%N)
+    python3 "$APK_HARVESTER" "$FOLDER"
+    metric_stage apk_harvest "$FIRMWARE" "$START" $? "$(du -sb apps 2>/dev/null | cut -f1)"
+
+    # --- Step 3.1: Copy APKs the harvester can't read (compressed EROFS) from a read-only mount ---
+    UNSUPPORTED="$FOLDER/apps/unsupported_apks.tsv"
+    if [[ -s "$UNSUPPORTED" ]]; then
+        START=$(date +%s.%N)
+        for PART in $(cut -f1 "$UNSUPPORTED" | sort -u); do
+            IMG="$FOLDER/$PART.img"
+            # Sparse images can't be loop-mounted, expand them first (holes stay holes). sparse_image.py
+            # renames the raw image into place once complete, so an existing one can be reused
+            if [[ "$(head -c 4 "$IMG" | od -An -tx1 | tr -d ' \n')" == "3aff26ed" ]]; then
+                [[ -f "$FOLDER/$PART.raw.img" ]] || python3 "$SPARSE_IMAGE" "$IMG" "$FOLDER/$PART.raw.img" || continue
+                IMG="$FOLDER/$PART.raw.img"
+            fi
+            MOUNT_POINT="$MOUNT_BASE/${FIRMWARE}_$PART"
+            mkdir -p "$MOUNT_POINT"
             echo "Mounting $IMG → $MOUNT_POINT"
-            sudo mount -o ro,loop "$FOLDER/$IMG" "$MOUNT_POINT" || continue
+            sudo mount -o ro,loop "$IMG" "$MOUNT_POINT" || continue
+
+            while IFS=$'\t' read -r APK_PART APK_PATH APK_NAME; do
+                [[ "$APK_PART" == "$PART" ]] || continue
+                if [[ -z "$APK_PATH" ]]; then
+                    # The image could not even be listed, copy all of its APKs
+                    while IFS= read -r -d '' APK; do
+                        sudo cp "$APK" "$FOLDER/apps/" && echo "Copied: $APK"
+                    done < <(sudo find "$MOUNT_POINT" -type f -name "*.apk" -print0)
+                else
+                    sudo cp "$MOUNT_POINT$APK_PATH" "$FOLDER/apps/$APK_NAME" && echo "Copied: $PART:$APK_PATH"
+                fi
+            done < "$UNSUPPORTED"
 
-            echo "Searching for APKs in $IMG"
-            APK_LIST=$(sudo find "$MOUNT_POINT" -type f -name "*.apk")
-            for APK_PATH in $APK_LIST; do
-                sudo cp "$APK_PATH" "$APPS_DIR/"
-                echo "Copied: $APK_PATH"
-            done
-
-            echo "Unmounting $MOUNT_POINT"
             sudo umount "$MOUNT_POINT"
-        else
-            echo "$IMG not found in $FOLDER"
-        fi
-    done
-
-    # === Fix Permissions ===
-    sudo chmod 777 "$APPS_DIR"/* 2>/dev/null
-    echo "Finished APK extraction for $FOLDER"
+        done
+        sudo chmod 644 "$FOLDER"/apps/*.apk 2>/dev/null
+        metric_stage apk_mount_fallback "$FIRMWARE" "$START" 0 "$(du -sb apps 2>/dev/null | cut -f1)"
+    fi
 
 done
 
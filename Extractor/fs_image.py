@@ -0,0 +1,351 @@
+import mmap
+import os
+import stat
+import struct
+from sparse_image import SparseImage, is_sparse
+
+# Read-only ext4 and EROFS readers working directly on partition images, no mount or root needed
+
+EXT4_MAGIC = 0xEF53
+EROFS_MAGIC = 0xE0F5E1E2
+SUPERBLOCK_OFFSET = 1024
+
+COPY_CHUNK = 4 * 1024 * 1024
+
+# Directory entry file types shared by ext4 and EROFS
+FT_REG_FILE = 1
+FT_DIR = 2
+
+def unpack_from(fmt, data, offset=0):
+    """
+    struct.unpack_from that also works on images that only support slicing (SparseImage).
+    """
+    if isinstance(data, SparseImage):
+        return data.unpack_from(fmt, offset)
+    return struct.unpack_from(fmt, data, offset)
+
+def detect_filesystem(data):
+    """
+    Returns "ext4", "erofs" or None based on the superblock magic of an image buffer.
+    """
+    if len(data) < SUPERBLOCK_OFFSET + 64:
+        return None
+    if unpack_from("<H", data, SUPERBLOCK_OFFSET + 56)[0] == EXT4_MAGIC:
+        return "ext4"
+    if unpack_from("<I", data, SUPERBLOCK_OFFSET)[0] == EROFS_MAGIC:
+        return "erofs"
+    return None
+
+class FilesystemImage:
+    """
+    Common directory walking and file reading on top of the per-filesystem inode parsers.
+    Subclasses implement root_inode, list_dir(ino), inode_mode(ino), file_size(ino) and file_runs(ino).
+    """
+    def __init__(self, data):
+        self.data = data
+
+    def close(self):
+        if hasattr(self.data, "close"):
+            self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def walk(self, top="/"):
+        """
+        Yields (path, ino) for every regular file below top, using directory metadata only.
+        """
+        stack = [(top.rstrip("/"), self.lookup(top))]
+        while stack:
+            dir_path, dir_ino = stack.pop()
+            for name, ino, ftype in self.list_dir(dir_ino):
+                if name in (".", ".."):
+                    continue
+                path = f"{dir_path}/{name}"
+                if ftype == FT_DIR:
+                    stack.append((path, ino))
+                elif ftype == FT_REG_FILE:
+                    yield path, ino
+
+    def lookup(self, path):
+        """
+        Resolves an absolute path to an inode number, or None if it does not exist.
+        """
+        ino = self.root_inode
+        for part in [p for p in path.split("/") if p]:
+            for name, child, _ in self.list_dir(ino):
+                if name == part:
+                    ino = child
+                    break
+            else:
+                return None
+        return ino
+
+    def is_dir(self, ino):
+        return stat.S_ISDIR(self.inode_mode(ino))
+
+    def iter_file(self, ino, chunk_size=COPY_CHUNK):
+        """
+        Yields the contents of a file in chunks, filling holes with zeros.
+        """
+        remaining = self.file_size(ino)
+        position = 0
+        for file_offset, disk_offset, length in self.file_runs(ino):
+            if file_offset > position:
+                hole = min(file_offset - position, remaining)
+                yield bytes(hole)
+                remaining -= hole
+                position += hole
+            length = min(length, remaining)
+            for start in range(0, length, chunk_size):
+                size = min(chunk_size, length - start)
+                yield self.data[disk_offset + start:disk_offset + start + size] if disk_offset is not None else bytes(size)
+            remaining -= length
+            position += length
+            if not remaining:
+                return
+        if remaining:
+            yield bytes(remaining)
+
+    def read_file(self, ino):
+        return b"".join(self.iter_file(ino))
+
+    def read_head(self, ino, size):
+        """
+        Reads only the first bytes of a file, e.g. for magic number sniffing.
+        """
+        head = b""
+        for chunk in self.iter_file(ino, chunk_size=size):
+            head += chunk
+            if len(head) >= size:
+                break
+        return head[:size]
+
+    def extract(self, ino, dest):
+        """
+        Copies a file out of the image to dest and returns the number of bytes written.
+        """
+        written = 0
+        with open(dest, "wb") as f:
+            for chunk in self.iter_file(ino):
+                f.write(chunk)
+                written += len(chunk)
+        return written
+
+class Ext4Image(FilesystemImage):
+    EXTENTS_FL = 0x80000
+    INLINE_DATA_FL = 0x10000000
+    EXTENT_MAGIC = 0xF30A
+    INCOMPAT_FILETYPE = 0x2
+    INCOMPAT_64BIT = 0x80
+
+    root_inode = 2
+
+    def __init__(self, data):
+        super().__init__(data)
+        sb = SUPERBLOCK_OFFSET
+        self.block_size = 1024 << unpack_from("<I", data, sb + 24)[0]
+        self.first_data_block = unpack_from("<I", data, sb + 20)[0]
+        self.inodes_per_group = unpack_from("<I", data, sb + 40)[0]
+        rev_level = unpack_from("<I", data, sb + 76)[0]
+        self.inode_size = unpack_from("<H", data, sb + 88)[0] if rev_level else 128
+        self.feature_incompat = unpack_from("<I", data, sb + 96)[0]
+        self.desc_size = 32
+        if self.feature_incompat & self.INCOMPAT_64BIT:
+            self.desc_size = unpack_from("<H", data, sb + 254)[0] or 64
+        self.gdt_offset = (self.first_data_block + 1) * self.block_size
+
+    def inode_offset(self, ino):
+        group, index = divmod(ino - 1, self.inodes_per_group)
+        desc = self.gdt_offset + group * self.desc_size
+        table = unpack_from("<I", self.data, desc + 8)[0]
+        if self.desc_size >= 64:
+            table |= unpack_from("<I", self.data, desc + 0x28)[0] << 32
+        return table * self.block_size + index * self.inode_size
+
+    def inode_mode(self, ino):
+        return unpack_from("<H", self.data, self.inode_offset(ino))[0]
+
+    def file_size(self, ino):
+        offset = self.inode_offset(ino)
+        lo = unpack_from("<I", self.data, offset + 4)[0]
+        hi = unpack_from("<I", self.data, offset + 0x6C)[0]
+        return lo | (hi << 32)
+
+    def file_runs(self, ino):
+        """
+        Yields (file_offset, disk_offset, length) runs; disk_offset is None for unwritten extents.
+        """
+        offset = self.inode_offset(ino)
+        flags = unpack_from("<I", self.data, offset + 0x20)[0]
+        i_block = offset + 0x28
+        bs = self.block_size
+        if flags & self.INLINE_DATA_FL:
+            # Only the part stored in i_block is supported, the system.data xattr overflow is not
+            yield 0, i_block, 60
+        elif flags & self.EXTENTS_FL:
+            for logical, physical, count, initialized in self._extents(i_block):
+                yield logical * bs, physical * bs if initialized else None, count * bs
+        else:
+            for logical, physical in self._block_map(i_block):
+                yield logical * bs, physical * bs, bs
+
+    def _extents(self, node):
+        magic, entries, _, depth = unpack_from("<HHHH", self.data, node)
+        if magic != self.EXTENT_MAGIC:
+            raise ValueError(f"Bad extent header at {node:#x}")
+        for i in range(entries):
+            entry = node + 12 + i * 12
+            if depth == 0:
+                logical, length, start_hi, start_lo = unpack_from("<IHHI", self.data, entry)
+                initialized = length <= 32768
+                if not initialized:
+                    length -= 32768
+                yield logical, (start_hi << 32) | start_lo, length, initialized
+            else:
+                _, leaf_lo, leaf_hi = unpack_from("<IIH", self.data, entry)
+                yield from self._extents(((leaf_hi << 32) | leaf_lo) * self.block_size)
+
+    def _block_map(self, i_block):
+        pointers = self.block_size // 4
+        direct = unpack_from("<15I", self.data, i_block)
+        logical = 0
+        for block in direct[:12]:
+            if block:
+                yield logical, block
+            logical += 1
+        for level, block in enumerate(direct[12:], start=1):
+            span = pointers ** level
+            if block:
+                yield from self._indirect(block, level, logical)
+            logical += span
+
+    def _indirect(self, block, level, logical):
+        pointers = self.block_size // 4
+        span = pointers ** (level - 1)
+        for i, child in enumerate(unpack_from(f"<{pointers}I", self.data, block * self.block_size)):
+            if not child:
+                continue
+            if level == 1:
+                yield logical + i, child
+            else:
+                yield from self._indirect(child, level - 1, logical + i * span)
+
+    def list_dir(self, ino):
+        """
+        Returns (name, ino, file_type) entries of a directory. Hash-tree (dx) directories are
+        read linearly, their index blocks show up as empty entries and are skipped.
+        """
+        data = self.read_file(ino)
+        has_filetype = self.feature_incompat & self.INCOMPAT_FILETYPE
+        entries = []
+        pos = 0
+        while pos + 8 <= len(data):
+            child, rec_len, name_len, file_type = unpack_from("<IHBB", data, pos)
+            if rec_len < 8:
+                break
+            if child:
+                name = data[pos + 8:pos + 8 + name_len].decode("utf-8", errors="replace")
+                if not has_filetype:
+                    file_type = FT_DIR if stat.S_ISDIR(self.inode_mode(child)) else FT_REG_FILE
+                entries.append((name, child, file_type))
+            pos += rec_len
+        return entries
+
+class ErofsImage(FilesystemImage):
+    LAYOUT_FLAT_PLAIN = 0
+    LAYOUT_FLAT_INLINE = 2
+    DIRENT_SIZE = 12
+
+    def __init__(self, data):
+        super().__init__(data)
+        sb = SUPERBLOCK_OFFSET
+        self.block_size = 1 << data[sb + 12]
+        self.root_inode = unpack_from("<H", data, sb + 14)[0]
+        self.meta_offset = unpack_from("<I", data, sb + 40)[0] * self.block_size
+
+    def _inode(self, nid):
+        """
+        Returns (offset, inode_size, layout, mode, size, raw_blkaddr, xattr_size) of an inode.
+        """
+        offset = self.meta_offset + nid * 32
+        i_format, xattr_icount, mode = unpack_from("<HHH", self.data, offset)
+        extended = i_format & 1
+        layout = (i_format >> 1) & 0x7
+        if extended:
+            size = unpack_from("<Q", self.data, offset + 8)[0]
+            inode_size = 64
+        else:
+            size = unpack_from("<I", self.data, offset + 8)[0]
+            inode_size = 32
+        raw_blkaddr = unpack_from("<I", self.data, offset + 16)[0]
+        xattr_size = 12 + (xattr_icount - 1) * 4 if xattr_icount else 0
+        return offset, inode_size, layout, mode, size, raw_blkaddr, xattr_size
+
+    def inode_mode(self, nid):
+        return self._inode(nid)[3]
+
+    def file_size(self, nid):
+        return self._inode(nid)[4]
+
+    def file_runs(self, nid):
+        offset, inode_size, layout, _, size, raw_blkaddr, xattr_size = self._inode(nid)
+        if layout == self.LAYOUT_FLAT_PLAIN:
+            yield 0, raw_blkaddr * self.block_size, size
+        elif layout == self.LAYOUT_FLAT_INLINE:
+            # The last block is always the inline tail, even when the size is a block multiple
+            full = max((size + self.block_size - 1) // self.block_size - 1, 0) * self.block_size
+            if full:
+                yield 0, raw_blkaddr * self.block_size, full
+            if size > full:
+                yield full, offset + inode_size + xattr_size, size - full
+        else:
+            raise NotImplementedError(f"EROFS data layout {layout} (compressed/chunked) is not supported")
+
+    def list_dir(self, nid):
+        data = self.read_file(nid)
+        entries = []
+        for block_start in range(0, len(data), self.block_size):
+            block = data[block_start:block_start + self.block_size]
+            count = unpack_from("<H", block, 8)[0] // self.DIRENT_SIZE
+            dirents = [unpack_from("<QHB", block, i * self.DIRENT_SIZE) for i in range(count)]
+            for i, (child, name_off, file_type) in enumerate(dirents):
+                name_end = dirents[i + 1][1] if i + 1 < count else len(block)
+                name = block[name_off:name_end].split(b"\0", 1)[0].decode("utf-8", errors="replace")
+                entries.append((name, child, file_type))
+        return entries
+
+def open_buffer(data):
+    """
+    Wraps an image buffer (bytes, mmap, ...) in the matching filesystem reader.
+    """
+    fs_type = detect_filesystem(data)
+    if fs_type == "ext4":
+        return Ext4Image(data)
+    if fs_type == "erofs":
+        return ErofsImage(data)
+    raise ValueError("Unsupported or undetected filesystem")
+
+def open_image(image_file):
+    """
+    Memory-maps a raw or Android sparse partition image and returns a filesystem reader for it.
+    Sparse images are read through their chunk map, without expanding them.
+    """
+    with open(image_file, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        if is_sparse(data):
+            data = SparseImage(data)
+        return open_buffer(data)
+    except ValueError:
+        data.close()
+        raise ValueError(f"Unsupported or undetected filesystem in {image_file}")
+
+def image_partition(image_file):
+    """
+    Returns the partition name of an image path, e.g. "system_ext" for ".../system_ext.img".
+    """
+    return os.path.basename(image_file).split(".", 1)[0]
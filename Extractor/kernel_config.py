@@ -0,0 +1,154 @@
+import bz2
+import lzma
+import os
+import re
+import struct
+import sys
+import zlib
+
+try:
+    import lz4.block as lz4_block
+except ImportError:
+    lz4_block = None  # lz4_block_decompress below, much slower
+
+# In-process equivalent of the kernel's scripts/extract-ikconfig
+
+IKCONFIG_START = b"IKCFG_ST"
+IKCONFIG_PATTERN = re.compile(re.escape(IKCONFIG_START))  # re also searches memoryviews, without a copy
+GZIP_MAGIC = b"\x1f\x8b\x08"
+LZ4_LEGACY_MAGIC = b"\x02\x21\x4c\x18"
+LZ4_LEGACY_BLOCK_SIZE = 8 * 1024 * 1024  # Uncompressed size of a legacy frame block, the last one is shorter
+XZ_MAGIC = b"\xfd7zXZ\x00"
+BZIP2_MAGIC = b"BZh"
+
+def gunzip(data):
+    """
+    Decompresses a gzip stream, ignoring any trailing data after it.
+    """
+    return zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(data)
+
+def lz4_block_decompress(src):
+    """
+    Decompresses a single raw LZ4 block.
+    """
+    dst = bytearray()
+    pos = 0
+    end = len(src)
+    while pos < end:
+        token = src[pos]
+        pos += 1
+        literal_len = token >> 4
+        if literal_len == 15:
+            while True:
+                extra = src[pos]
+                pos += 1
+                literal_len += extra
+                if extra != 255:
+                    break
+        dst += src[pos:pos + literal_len]
+        pos += literal_len
+        if pos >= end:
+            break
+        offset = src[pos] | (src[pos + 1] << 8)
+        pos += 2
+        match_len = token & 0xF
+        if match_len == 15:
+            while True:
+                extra = src[pos]
+                pos += 1
+                match_len += extra
+                if extra != 255:
+                    break
+        match_len += 4
+        start = len(dst) - offset
+        if offset >= match_len:
+            dst += dst[start:start + match_len]
+        else:
+            # Overlapping match, copy byte by byte
+            for i in range(match_len):
+                dst.append(dst[start + i])
+    return bytes(dst)
+
+def lz4_legacy_decompress(data):
+    """
+    Decompresses the LZ4 legacy frame format used for Image.lz4 kernels.
+    """
+    out = []
+    pos = len(LZ4_LEGACY_MAGIC)
+    while pos + 4 <= len(data):
+        block_size = struct.unpack_from("<I", data, pos)[0]
+        if block_size == struct.unpack("<I", LZ4_LEGACY_MAGIC)[0]:
+            # Concatenated frames
+            pos += 4
+            continue
+        pos += 4
+        if block_size == 0 or pos + block_size > len(data):
+            break
+        block = data[pos:pos + block_size]
+        if lz4_block is None:
+            out.append(lz4_block_decompress(bytes(block)))
+        else:
+            try:
+                out.append(lz4_block.decompress(block, uncompressed_size=LZ4_LEGACY_BLOCK_SIZE))
+            except lz4_block.LZ4BlockError as e:
+                raise ValueError(f"Corrupt LZ4 block: {e}")
+        pos += block_size
+    return b"".join(out)
+
+def decompress_kernel(kernel):
+    """
+    Returns the uncompressed kernel image for gzip, LZ4, xz and bzip2 kernels.
+    Raw kernels (e.g. an arm64 Image) are returned unchanged.
+    """
+    head = bytes(kernel[:8])
+    try:
+        if head.startswith(GZIP_MAGIC):
+            return gunzip(kernel)
+        if head.startswith(LZ4_LEGACY_MAGIC):
+            return lz4_legacy_decompress(kernel)
+        if head.startswith(XZ_MAGIC):
+            return lzma.LZMADecompressor().decompress(kernel)
+        if head.startswith(BZIP2_MAGIC):
+            return bz2.BZ2Decompressor().decompress(kernel)
+    except (OSError, EOFError, lzma.LZMAError, zlib.error, IndexError, ValueError) as e:
+        print(f"Failed to decompress kernel: {e}")
+    return kernel
+
+def find_ikconfig(data):
+    """
+    Returns the configuration text embedded between the IKCFG markers of an uncompressed kernel.
+    """
+    match = IKCONFIG_PATTERN.search(data)
+    if match is None:
+        return None
+    try:
+        return gunzip(data[match.end():]).decode("utf-8", errors="replace")
+    except zlib.error:
+        return None
+
+def extract_ikconfig(kernel):
+    """
+    Extracts the IKCONFIG text from a kernel buffer (bytes, mmap or memoryview, searched in place),
+    decompressing the kernel first if needed. Returns None when the kernel was built without
+    CONFIG_IKCONFIG.
+    """
+    config = find_ikconfig(kernel)
+    if config is None:
+        decompressed = decompress_kernel(kernel)
+        if decompressed is not kernel:
+            config = find_ikconfig(decompressed)
+    return config
+
+def main():
+    if len(sys.argv) != 2:
+        print(f"Usage: {os.path.basename(sys.argv[0])} <kernel>")
+        sys.exit(1)
+    with open(sys.argv[1], "rb") as f:
+        config = extract_ikconfig(f.read())
+    if config is None:
+        print("Cannot find kernel config.", file=sys.stderr)
+        sys.exit(1)
+    sys.stdout.write(config)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import os
+import sys
+import brotli
+
+BLOCK_SIZE = 4096
+READ_CHUNK = 1024 * 1024  # Compressed bytes fed to the decompressor per step
+WRITE_CHUNK = 4 * 1024 * 1024  # Max bytes written to the image per write() call
+
+def parse_ranges(src):
+    """
+    Parses a transfer.list range string ("4,0,10,20,30") into (start, end) block pairs.
+    """
+    values = [int(v) for v in src.split(",")]
+    count, values = values[0], values[1:]
+    if count != len(values) or count % 2:
+        raise ValueError(f"Malformed range set: {src}")
+    return [(values[i], values[i + 1]) for i in range(0, count, 2)]
+
+def parse_transfer_list(path):
+    """
+    Parses a transfer.list file into (version, commands) where commands are (cmd, ranges).
+    Only the commands used by full OTAs (new, zero, erase) are kept.
+    """
+    with open(path, "r") as f:
+        lines = [line.rstrip("\n") for line in f]
+
+    version = int(lines[0])
+    # Versions >= 2 carry two extra header lines (stash entries and max stash blocks)
+    first_command = 2 if version == 1 else 4
+
+    commands = []
+    for line in lines[first_command:]:
+        if not line.strip():
+            continue
+        cmd, _, args = line.partition(" ")
+        if cmd in ("new", "zero", "erase"):
+            commands.append((cmd, parse_ranges(args)))
+        elif not cmd[0].isdigit():
+            print(f"Skipping unsupported transfer command: {cmd}")
+    return version, commands
+
+def iter_dat_chunks(dat_path):
+    """
+    Yields decompressed chunks of a .new.dat.br file, or raw chunks of a plain .new.dat file.
+    The full .dat is never materialized, neither in memory nor on disk.
+    """
+    decompressor = brotli.Decompressor() if dat_path.endswith(".br") else None
+    with open(dat_path, "rb") as f:
+        while True:
+            data = f.read(READ_CHUNK)
+            if not data:
+                break
+            if decompressor is not None:
+                data = decompressor.process(data)
+            if data:
+                yield data
+    if decompressor is not None and not decompressor.is_finished():
+        raise ValueError(f"Truncated brotli stream: {dat_path}")
+
+class ChunkReader:
+    """
+    Serves exact-size reads from an iterator of variable-size chunks.
+    """
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.buffer = memoryview(b"")
+
+    def read(self, size):
+        while not self.buffer:
+            self.buffer = memoryview(next(self.chunks, b""))
+            if not self.buffer:
+                return b""
+        data = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+        return data
+
+def convert(transfer_list, dat_path, img_path):
+    """
+    Applies the 'new' block ranges of transfer_list directly from the (compressed) dat stream
+    into img_path. 'zero' and 'erase' ranges are left as holes in the sparse output file. The image
+    is written to img_path.tmp and renamed once complete, so an interrupted run never leaves a
+    truncated img_path behind. Returns the number of bytes written.
+    """
+    version, commands = parse_transfer_list(transfer_list)
+    print(f"Transfer list version {version}: {len(commands)} commands")
+
+    max_block = max((end for _, ranges in commands for _, end in ranges), default=0)
+    reader = ChunkReader(iter_dat_chunks(dat_path))
+    written = 0
+
+    tmp_path = img_path + ".tmp"
+    try:
+        with open(tmp_path, "wb") as out:
+            # Reserve the full image size without allocating it; untouched blocks stay holes
+            out.truncate(max_block * BLOCK_SIZE)
+
+            for cmd, ranges in commands:
+                if cmd != "new":
+                    continue
+                for start, end in ranges:
+                    out.seek(start * BLOCK_SIZE)
+                    remaining = (end - start) * BLOCK_SIZE
+                    while remaining:
+                        data = reader.read(min(remaining, WRITE_CHUNK))
+                        if not data:
+                            raise ValueError(f"{dat_path} ended before block {end} of {img_path}")
+                        out.write(data)
+                        remaining -= len(data)
+                        written += len(data)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, img_path)
+
+    print(f"Generated {img_path} ({max_block * BLOCK_SIZE} bytes, {written} bytes written)")
+    return written
+
+def main():
+    if len(sys.argv) != 4:
+        print(f"Usage: {os.path.basename(sys.argv[0])} <transfer.list> <system.new.dat[.br]> <system.img>")
+        sys.exit(1)
+    convert(sys.argv[1], sys.argv[2], sys.argv[3])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import bisect
+import mmap
+import os
+import struct
+import sys
+
+# Android sparse image (simg) support: reads are served straight from the chunk map, and
+# unsparse() writes a raw image in which DONT_CARE and zero FILL chunks stay holes.
+
+SPARSE_MAGIC = 0xED26FF3A
+FILE_HEADER = struct.Struct("<IHHHHIIII")  # magic, major, minor, file_hdr_sz, chunk_hdr_sz, blk_sz, total_blks, total_chunks, checksum
+CHUNK_HEADER = struct.Struct("<HHII")  # type, reserved, chunk_sz (blocks), total_sz (bytes, header included)
+
+CHUNK_RAW = 0xCAC1
+CHUNK_FILL = 0xCAC2
+CHUNK_DONT_CARE = 0xCAC3
+CHUNK_CRC32 = 0xCAC4
+
+WRITE_CHUNK = 4 * 1024 * 1024
+
+def is_sparse(data):
+    """
+    True if a buffer (or the file at a path) starts with the sparse image magic.
+    """
+    if isinstance(data, str):
+        with open(data, "rb") as f:
+            data = f.read(4)
+    return len(data) >= 4 and struct.unpack_from("<I", data)[0] == SPARSE_MAGIC
+
+class SparseImage:
+    """
+    Read-only view of a sparse image buffer as the raw image it expands to. Supports len(),
+    integer indexing and slicing, so the fs_image readers can use it like a raw image mmap.
+    """
+    def __init__(self, data):
+        self.data = data
+        (magic, major, _, file_hdr_sz, chunk_hdr_sz, self.block_size, total_blocks, total_chunks,
+         _) = FILE_HEADER.unpack_from(data, 0)
+        if magic != SPARSE_MAGIC or major != 1:
+            raise ValueError("Not a version 1 Android sparse image")
+        self.size = total_blocks * self.block_size
+
+        # Output-ordered chunks: (output offset, length, type, source offset or fill pattern)
+        self.chunks = []
+        pos = file_hdr_sz
+        out = 0
+        for _ in range(total_chunks):
+            chunk_type, _, chunk_blocks, total_sz = CHUNK_HEADER.unpack_from(data, pos)
+            body = pos + chunk_hdr_sz
+            length = chunk_blocks * self.block_size
+            if chunk_type == CHUNK_RAW:
+                if total_sz - chunk_hdr_sz != length:
+                    raise ValueError(f"Bad RAW chunk at offset {pos}")
+                self.chunks.append((out, length, CHUNK_RAW, body))
+            elif chunk_type == CHUNK_FILL:
+                self.chunks.append((out, length, CHUNK_FILL, bytes(data[body:body + 4])))
+            elif chunk_type == CHUNK_DONT_CARE:
+                self.chunks.append((out, length, CHUNK_DONT_CARE, None))
+            elif chunk_type != CHUNK_CRC32:
+                raise ValueError(f"Unknown chunk type {chunk_type:#x} at offset {pos}")
+            out += length
+            pos += total_sz
+        if out != self.size:
+            raise ValueError(f"Chunks cover {out} of {self.size} bytes")
+        self.starts = [chunk[0] for chunk in self.chunks]
+
+    def close(self):
+        if hasattr(self.data, "close"):
+            self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.size)
+            if step != 1:
+                raise ValueError("Sparse images only support contiguous slices")
+            return self.read(start, max(stop - start, 0))
+        if key < 0:
+            key += self.size
+        if not 0 <= key < self.size:
+            raise IndexError("Sparse image index out of range")
+        return self.read(key, 1)[0]
+
+    def read(self, offset, size):
+        """
+        Returns size bytes of the expanded image starting at offset.
+        """
+        size = min(size, self.size - offset)
+        pieces = []
+        index = bisect.bisect_right(self.starts, offset) - 1
+        while size > 0:
+            out, length, chunk_type, source = self.chunks[index]
+            rel = offset - out
+            count = min(length - rel, size)
+            if chunk_type == CHUNK_RAW:
+                pieces.append(self.data[source + rel:source + rel + count])
+            elif chunk_type == CHUNK_FILL:
+                # The 4-byte pattern repeats from the start of the chunk
+                pieces.append((source * ((rel % 4 + count) // 4 + 2))[rel % 4:rel % 4 + count])
+            else:
+                pieces.append(bytes(count))
+            offset += count
+            size -= count
+            index += 1
+        return b"".join(pieces)
+
+    def unpack_from(self, fmt, offset=0):
+        return struct.unpack(fmt, self.read(offset, struct.calcsize(fmt)))
+
+def open_sparse(image_file):
+    """
+    Memory-maps a sparse image file and returns a SparseImage over it.
+    """
+    with open(image_file, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        return SparseImage(data)
+    except (ValueError, struct.error):
+        data.close()
+        raise
+
+def unsparse(sparse_file, raw_file):
+    """
+    Expands a sparse image into raw_file, writing only RAW and non-zero FILL chunks. The rest
+    stays holes, so the raw image only takes the disk space of the data it holds. The image is
+    written to raw_file.tmp and renamed once complete, so an existing raw_file is never a partial
+    expansion. Returns the number of bytes written.
+    """
+    written = 0
+    tmp_file = raw_file + ".tmp"
+    try:
+        with open_sparse(sparse_file) as image, open(tmp_file, "wb") as out:
+            out.truncate(image.size)
+            for offset, length, chunk_type, source in image.chunks:
+                if chunk_type == CHUNK_DONT_CARE or (chunk_type == CHUNK_FILL and source == b"\0\0\0\0"):
+                    continue
+                out.seek(offset)
+                for start in range(0, length, WRITE_CHUNK):
+                    count = min(WRITE_CHUNK, length - start)
+                    if chunk_type == CHUNK_RAW:
+                        out.write(image.data[source + start:source + start + count])
+                    else:
+                        out.write(image.read(offset + start, count))
+                    written += count
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+    os.replace(tmp_file, raw_file)
+    print(f"Expanded {sparse_file} to {raw_file} ({image.size} bytes, {written} bytes written)")
+    return written
+
+def main():
+    if len(sys.argv) != 3:
+        print(f"Usage: {os.path.basename(sys.argv[0])} <sparse.img> <raw.img>")
+        sys.exit(1)
+    unsparse(sys.argv[1], sys.argv[2])
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,16 @@
+import argparse
 import os
 import re
+import sys
+import time
 import matplotlib.pyplot as plt
+from contextlib import nullcontext
 from datetime import datetime
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Common"))
+from pipeline_metrics import PipelineMetrics
+from inventory_store import CONFIG_SUFFIX, STORE_PATH, InventoryStore, parse_kernel_config
+
 def expand_config_variant(entry):
     if "{" in entry and "}" in entry:
         base, variant = re.match(r"(.*?)\{(.*?)\}", entry).groups()
@@ -36,7 +44,7 @@ def analyze_config_file(filepath, config_flags):
             missing_flags.append(str(flag))
     return missing_flags
 
-def scan_q3_configs(directory="."):
+def scan_q3_configs(directory=".", metrics=None, store=None):
     config_flags = [
         ("CONFIG_HAVE_STACKPROTECTOR", "CONFIG_STACKPROTECTOR", "CONFIG_STACKPROTECTOR_STRONG", "CONFIG_CC_STACKPROTECTOR"),
         "CONFIG_RANDOMIZE_BASE",
@@ -65,7 +73,9 @@ def scan_q3_configs(directory="."):
     }
 
     for filename in sorted(os.listdir(directory)):
-        print(f"Processing file: {filename}")
+        if metrics is None:
+            print(f"Processing file: {filename}")
+        start = time.perf_counter()
         match_q1 = re.match(r"q1_v\d+_(\d{2}-\d{2}-\d{4})", filename)
         match_q2 = re.match(r"q2_v\d+_(\d{2}-\d{2}-\d{4})", filename)
         match_q3 = re.match(r"q3_v\d+_(\d{2}-\d{2}-\d{4})", filename)
@@ -91,6 +101,13 @@ def scan_q3_configs(directory="."):
             devices[device]['dates'].append(date_obj)
             devices[device]['mitigations'].append(applied)
             devices[device]['missing'].append((filename, missing))
+            firmware = filename[:-len(CONFIG_SUFFIX)] if filename.endswith(CONFIG_SUFFIX) else filename
+            if store is not None:
+                with open(path, errors="ignore") as f:
+                    store.replace_kernel_config(firmware, parse_kernel_config(f.read()), "ikconfig")
+            if metrics is not None:
+                metrics.item("kernel_config", filename, time.perf_counter() - start, firmware,
+                             bytes_read=os.path.getsize(path))
     
     return (
         devices['q1']['dates'], devices['q1']['mitigations'], devices['q1']['missing'],
@@ -138,12 +155,17 @@ def print_missing(missing, label):
         print(f"{fname}: {len(flags)} missing → {flags}")
 
 # Run analysis
-(
-    dates_q1, mitigations_q1, missing_q1,
-    dates_q2, mitigations_q2, missing_q2,
-    dates_q3, mitigations_q3, missing_q3,
-    dates_qpro, mitigations_qpro, missing_qpro
-) = scan_q3_configs(".")
+parser = argparse.ArgumentParser(description="Kernel hardening options of the *_configuration files in this folder")
+parser.add_argument("--store", default=STORE_PATH, help="Inventory store path ('' to skip)")
+args = parser.parse_args()
+metrics = PipelineMetrics("kernel_analyze.py")
+with metrics.stage("kernel_config"), (InventoryStore(args.store) if args.store else nullcontext()) as store:
+    (
+        dates_q1, mitigations_q1, missing_q1,
+        dates_q2, mitigations_q2, missing_q2,
+        dates_q3, mitigations_q3, missing_q3,
+        dates_qpro, mitigations_qpro, missing_qpro
+    ) = scan_q3_configs(".", metrics, store)
 
 # Sort for plotting
 sorted_dates_q1, sorted_mitigations_q1 = zip(*sorted(zip(dates_q1, mitigations_q1))) if dates_q1 else ([], [])
@@ -0,0 +1,401 @@
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Common"))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Extractor"))
+from pipeline_metrics import PipelineMetrics
+from inventory_store import STORE_PATH, InventoryStore
+from kernel_config import decompress_kernel
+
+# Hardening checks on the kernel binary itself (<firmware>/extracted/kernel), for builds without an
+# embedded IKCONFIG. The kallsyms table is recovered from the image and mitigations are inferred
+# from the symbols they add, plus the arm64 Image header and SCS prologues in the code.
+# Results are cached by kernel SHA-256 in kernel_image_cache.json.
+
+BASE_DIR = " "
+CACHE_PATH = "kernel_image_cache.json"
+ANALYZER_VERSION = 1
+MAX_WORKERS = os.cpu_count() or 4
+HASH_CHUNK = 8 * 1024 * 1024
+
+ARM64_MAGIC = b"ARM\x64"
+ARM64_HEADER = struct.Struct("<II6Q4sI")  # code0, code1, text_offset, image_size, flags, res2-4, magic, res5
+PAGE_SIZES = {1: "4K", 2: "16K", 3: "64K"}
+LINUX_BANNER = re.compile(rb"Linux version [^\0\n]+")
+
+# Digits are their own kallsyms tokens, stored in order in kallsyms_token_table
+TOKEN_DIGITS = b"\x00".join(bytes([c]) for c in b"0123456789") + b"\x00"
+KALLSYMS_ALIGN = 8
+MIN_SYMBOLS = 256
+
+SCS_PUSH = re.compile(re.escape(struct.pack("<I", 0xF800865E)))  # str x30, [x18], #8
+SCS_MIN_PUSHES = 100  # A few stray matches in data don't make an SCS kernel
+
+def has_any(*names):
+    return lambda symbols: any(name in symbols for name in names)
+
+# Config option -> test on the set of symbol names, named like the kernel_analyze.py flags
+MITIGATION_SYMBOLS = {
+    "CONFIG_STACKPROTECTOR": has_any("__stack_chk_fail", "__stack_chk_guard"),
+    "CONFIG_RANDOMIZE_BASE": has_any("kaslr_early_init", "kaslr_init"),
+    "CONFIG_RELOCATABLE": has_any("__rela_start", "__relr_start", "__rela_offset"),
+    "CONFIG_SLAB_FREELIST_RANDOM": has_any("cache_random_seq_create"),
+    "CONFIG_HARDENED_USERCOPY": has_any("__check_object_size", "usercopy_abort"),
+    "CONFIG_FORTIFY_SOURCE": has_any("fortify_panic", "__fortify_panic", "__fortify_report"),
+    "CONFIG_STRICT_KERNEL_RWX": has_any("mark_rodata_ro"),
+    "CONFIG_ARM64_PAN": has_any("cpu_enable_pan"),
+    "CONFIG_UNMAP_KERNEL_AT_EL0": has_any("tramp_vectors", "__entry_tramp_text_start", "arm64_kernel_unmapped_at_el0"),
+    "CONFIG_CFI_CLANG": lambda symbols: (has_any("__cfi_check", "__cfi_slowpath", "__cfi_slowpath_diag",
+                                                 "report_cfi_failure")(symbols)
+                                         or any(name.endswith((".cfi", ".cfi_jt")) for name in symbols)),
+    "CONFIG_SHADOW_CALL_STACK": has_any("scs_alloc", "scs_init", "scs_release"),
+    "CONFIG_DEBUG_LIST": has_any("__list_add_valid", "__list_add_valid_or_report"),
+    # With JIT always on the interpreter is compiled out
+    "CONFIG_BPF_JIT_ALWAYS_ON": lambda symbols: "bpf_int_jit_compile" in symbols and "___bpf_prog_run" not in symbols,
+    "CONFIG_VMAP_STACK": has_any("handle_bad_stack", "overflow_stack"),
+    "CONFIG_ARM64_UAO": has_any("cpu_enable_uao"),
+}
+
+def u32(data, offset):
+    return struct.unpack_from("<I", data, offset)[0]
+
+def u64(data, offset):
+    return struct.unpack_from("<Q", data, offset)[0]
+
+def align_up(value, alignment=KALLSYMS_ALIGN):
+    return (value + alignment - 1) & ~(alignment - 1)
+
+def parse_arm64_header(data):
+    """
+    Fields of the arm64 Image header, or None for other kernels.
+    """
+    if len(data) < ARM64_HEADER.size:
+        return None
+    _, _, text_offset, image_size, flags, _, _, _, magic, _ = ARM64_HEADER.unpack_from(data)
+    if magic != ARM64_MAGIC:
+        return None
+    return {
+        "text_offset": text_offset,
+        "image_size": image_size,
+        "big_endian": bool(flags & 1),
+        "page_size": PAGE_SIZES.get((flags >> 1) & 3, "unspecified"),
+        # Bit 3: the kernel can be placed anywhere in physical memory (needed for physical KASLR)
+        "phys_placement_anywhere": bool(flags & 8),
+    }
+
+def find_token_table(data):
+    """
+    Returns (token table offset, 256 tokens) of kallsyms_token_table, validated against the
+    kallsyms_token_index that follows it.
+    """
+    start = 0
+    while True:
+        digits = data.find(TOKEN_DIGITS, start)
+        if digits < 0:
+            return None, None
+        start = digits + 1
+        # Tokens are non-empty NUL-terminated strings; "0" is token 0x30
+        table = digits
+        for _ in range(ord("0")):
+            table = data.rfind(b"\0", 0, table - 1) + 1
+            if table <= 0:
+                break
+        if table <= 0:
+            continue
+        tokens, offsets, pos = [], [], table
+        for _ in range(256):
+            end = data.find(b"\0", pos)
+            if end <= pos:
+                break
+            offsets.append(pos - table)
+            tokens.append(bytes(data[pos:end]))
+            pos = end + 1
+        if len(tokens) != 256:
+            continue
+        index = align_up(pos)
+        if index + 512 <= len(data) and list(struct.unpack_from("<256H", data, index)) == offsets:
+            return table, tokens
+
+def find_markers(data, token_table):
+    """
+    Walks back from kallsyms_token_table over kallsyms_markers (names offset of every 256th symbol,
+    starting with 0). Returns [(markers start, markers)] candidates for 4 and 8 byte markers.
+    """
+    candidates = []
+    for width in (4, 8):
+        read = u32 if width == 4 else u64
+        for end in (token_table, token_table - 4):
+            markers = []
+            pos = end - width
+            while pos >= 0:
+                value = read(data, pos)
+                if markers and value >= markers[-1]:
+                    break
+                markers.append(value)
+                if value == 0:
+                    break
+                pos -= width
+            if markers and markers[-1] == 0:
+                markers.reverse()
+                candidates.append((pos, markers))
+    return candidates
+
+def walk_names(data, start, count, markers, limit):
+    """
+    Steps over count kallsyms_names entries from start, checking every 256th against markers.
+    Returns the offset after the last entry, or None when they don't line up.
+    """
+    pos = start
+    for index in range(count):
+        if index % 256 == 0 and pos - start != markers[index // 256]:
+            return None
+        if pos >= limit:
+            return None
+        length = data[pos]
+        if length & 0x80:
+            # Names longer than 127 tokens have a two-byte length (Linux 6.1+)
+            length = (length & 0x7F) | (data[pos + 1] << 7)
+            pos += 1
+        pos += 1 + length
+    return pos
+
+def find_kallsyms_names(data, markers_start, markers):
+    """
+    Finds kallsyms_num_syms and kallsyms_names before the markers. Returns (num_syms offset, count).
+    """
+    low = max(len(markers) - 1, 0) * 256 + 1
+    high = len(markers) * 256
+    lowest = max(markers_start - high * 128, 0)
+    pos = (markers_start - KALLSYMS_ALIGN) & ~(KALLSYMS_ALIGN - 1)
+    while pos >= lowest:
+        count = u32(data, pos)
+        if low <= count <= high and u32(data, pos + 4) == 0:
+            end = walk_names(data, pos + KALLSYMS_ALIGN, count, markers, markers_start)
+            if end is not None and markers_start - KALLSYMS_ALIGN < end <= markers_start:
+                return pos, count
+        pos -= KALLSYMS_ALIGN
+    return None, 0
+
+def read_addresses(data, num_syms_offset, count):
+    """
+    Symbol addresses from kallsyms_offsets + kallsyms_relative_base (Linux 4.6+) or the absolute
+    kallsyms_addresses table, both right before kallsyms_num_syms.
+    """
+    addresses_start = num_syms_offset - count * 8
+    if addresses_start >= 0:
+        addresses = struct.unpack_from(f"<{count}Q", data, addresses_start)
+        # Kernel addresses all the way, in ascending order
+        if addresses[0] >> 48 == 0xFFFF and addresses[-2] >> 48 == 0xFFFF and addresses[0] <= addresses[-1]:
+            return "absolute", list(addresses)
+    base_offset = num_syms_offset - 8
+    relative_base = u64(data, base_offset)
+    offsets_start = base_offset - align_up(count * 4)
+    if relative_base >> 48 == 0xFFFF and offsets_start >= 0:
+        return "relative", [relative_base + offset for offset in struct.unpack_from(f"<{count}I", data, offsets_start)]
+    return None, []
+
+def recover_kallsyms(data):
+    """
+    Returns {"layout", "symbols": [(address, type, name)]} from the kallsyms tables, or None.
+    Covers the num_syms/names/markers/token_table layout used up to Linux 6.1.
+    """
+    token_table, tokens = find_token_table(data)
+    if token_table is None:
+        return None
+    for markers_start, markers in find_markers(data, token_table):
+        num_syms_offset, count = find_kallsyms_names(data, markers_start, markers)
+        if num_syms_offset is None or count < MIN_SYMBOLS:
+            continue
+        layout, addresses = read_addresses(data, num_syms_offset, count)
+        symbols = []
+        pos = num_syms_offset + KALLSYMS_ALIGN
+        for index in range(count):
+            length = data[pos]
+            if length & 0x80:
+                length = (length & 0x7F) | (data[pos + 1] << 7)
+                pos += 1
+            name = b"".join(tokens[token] for token in data[pos + 1:pos + 1 + length]).decode("ascii", "replace")
+            pos += 1 + length
+            symbols.append((addresses[index] if addresses else None, name[:1], name[1:]))
+        return {"layout": layout or "unknown", "symbols": symbols}
+    return None
+
+def analyze_kernel(path):
+    """
+    Worker: analyzes one kernel image file. Returns a JSON-serializable result.
+    """
+    start = time.perf_counter()
+    with open(path, "rb") as f:
+        raw = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        data = decompress_kernel(raw)
+        compressed = data is not raw
+        image_size = len(data)
+        header = parse_arm64_header(data)
+        banner = LINUX_BANNER.search(data)
+        banner = bytes(banner.group()).decode("ascii", "replace") if banner else None
+        # Instructions are 4-byte aligned
+        scs_pushes = sum(1 for m in SCS_PUSH.finditer(data) if m.start() % 4 == 0) if header else 0
+        kallsyms = recover_kallsyms(data)
+    finally:
+        raw.close()
+
+    result = {
+        "compressed": compressed,
+        "image_size": image_size,
+        "arm64_header": header,
+        "banner": banner,
+        "scs_pushes": scs_pushes,
+        "kallsyms": None,
+        "mitigations": None,
+    }
+    if kallsyms:
+        names = {name for _, _, name in kallsyms["symbols"]}
+        text = [address for address, kind, _ in kallsyms["symbols"] if address and kind in "tT"]
+        result["kallsyms"] = {
+            "layout": kallsyms["layout"],
+            "symbols": len(kallsyms["symbols"]),
+            "text_start": hex(min(text)) if text else None,
+            "text_end": hex(max(text)) if text else None,
+        }
+        result["mitigations"] = {option: check(names) for option, check in MITIGATION_SYMBOLS.items()}
+        result["mitigations"]["CONFIG_SHADOW_CALL_STACK"] |= scs_pushes >= SCS_MIN_PUSHES
+    elif header:
+        # Without symbols, SCS prologues in the code are the only evidence left
+        result["mitigations"] = {"CONFIG_SHADOW_CALL_STACK": scs_pushes >= SCS_MIN_PUSHES}
+    result["duration"] = round(time.perf_counter() - start, 3)
+    return result
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class KernelCache:
+    """
+    JSON cache: results by kernel SHA-256 (stamped with ANALYZER_VERSION), plus path -> (size,
+    mtime, sha256) so unchanged kernels aren't even hashed.
+    """
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
+        try:
+            with open(path) as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            cache = {}
+        self.files = cache.get("files", {})
+        self.results = cache.get("results", {}) if cache.get("analyzer_version") == ANALYZER_VERSION else {}
+
+    def sha256(self, path):
+        st = os.stat(path)
+        known = self.files.get(path)
+        if known and known[:2] == [st.st_size, st.st_mtime_ns]:
+            return known[2]
+        sha256 = sha256_file(path)
+        self.files[path] = [st.st_size, st.st_mtime_ns, sha256]
+        return sha256
+
+    def save(self):
+        with open(self.path + ".tmp", "w") as f:
+            json.dump({"analyzer_version": ANALYZER_VERSION, "files": self.files, "results": self.results}, f)
+        os.replace(self.path + ".tmp", self.path)
+
+def find_kernels(folders):
+    kernels = {}
+    for folder in folders:
+        kernel = os.path.join(folder, "extracted", "kernel")
+        if os.path.isfile(kernel):
+            kernels[os.path.basename(os.path.normpath(folder))] = os.path.abspath(kernel)
+        else:
+            print(f"No 'kernel' file found in {folder}/extracted. Skipping.")
+    return kernels
+
+def analyze_kernels(folders, cache_path=CACHE_PATH, max_workers=MAX_WORKERS, metrics=None):
+    """
+    Returns {firmware: result}. Kernels with a cached result for their hash are not analyzed again,
+    and identical kernels shared by several firmwares are analyzed once.
+    """
+    cache = KernelCache(cache_path)
+    kernels = find_kernels(folders)
+    hashes = {firmware: cache.sha256(path) for firmware, path in kernels.items()}
+    missing = {}
+    for firmware, sha256 in hashes.items():
+        if sha256 not in cache.results:
+            missing.setdefault(sha256, kernels[firmware])
+    print(f"{len(kernels)} kernels, {len(set(hashes.values()))} distinct, {len(missing)} to analyze")
+
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(analyze_kernel, path): (sha256, path) for sha256, path in missing.items()}
+        for future in as_completed(futures):
+            sha256, path = futures[future]
+            try:
+                result = cache.results[sha256] = future.result()
+                duration, error = result["duration"], None
+            except (OSError, ValueError, struct.error) as e:
+                duration, error = 0.0, str(e)
+                print(f"Error analyzing {path}: {e}")
+            if metrics is not None:
+                metrics.item("kernel_image", path, duration, bytes_read=os.path.getsize(path), error=error)
+    cache.save()
+    return {firmware: dict(cache.results[sha256], sha256=sha256)
+            for firmware, sha256 in sorted(hashes.items()) if sha256 in cache.results}
+
+def print_results(results):
+    print("\nKERNEL IMAGE MITIGATIONS:")
+    print("=" * 50)
+    for firmware, result in results.items():
+        kallsyms = result["kallsyms"]
+        print(f"\n{firmware}: {result['banner'] or 'no version banner'}")
+        print(f"  {'compressed' if result['compressed'] else 'raw'} image, {result['image_size'] / 1e6:.1f} MB, "
+              f"{kallsyms['symbols'] if kallsyms else 'no'} kallsyms symbols, {result['scs_pushes']} SCS pushes")
+        mitigations = result["mitigations"]
+        if not mitigations:
+            print("  Mitigations unknown (no kallsyms)")
+            continue
+        missing = [option for option, present in mitigations.items() if not present]
+        print(f"  {len(mitigations) - len(missing)}/{len(mitigations)} mitigations, missing: {missing}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Hardening checks on kernel images via kallsyms")
+    parser.add_argument("folders", nargs="*", help="Firmware folders (default: every folder under BASE_DIR)")
+    parser.add_argument("--cache", default=CACHE_PATH, help="JSON cache path")
+    parser.add_argument("--output", help="Write all results to this JSON file")
+    parser.add_argument("--symbols", metavar="KERNEL", help="Print the recovered kallsyms of one kernel file")
+    parser.add_argument("--store", default=STORE_PATH, help="Inventory store path ('' to skip)")
+    args = parser.parse_args()
+
+    if args.symbols:
+        with open(args.symbols, "rb") as f:
+            kallsyms = recover_kallsyms(decompress_kernel(f.read()))
+        if kallsyms is None:
+            print("Cannot find kallsyms.", file=sys.stderr)
+            sys.exit(1)
+        for address, kind, name in kallsyms["symbols"]:
+            print(f"{address or 0:016x} {kind} {name}")
+        return
+
+    folders = args.folders or [os.path.join(BASE_DIR, f) for f in sorted(os.listdir(BASE_DIR))]
+    metrics = PipelineMetrics("kernel_image_analyze.py")
+    with metrics.stage("kernel_image"):
+        results = analyze_kernels([f for f in folders if os.path.isdir(f)], args.cache, metrics=metrics)
+    print_results(results)
+    if args.store:
+        with InventoryStore(args.store) as store:
+            for firmware, result in results.items():
+                store.replace_kernel_mitigations(firmware, result["mitigations"])
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import os
+import re
+import sqlite3
+import time
+from urllib.parse import unquote, urlparse
+
+# Persistent catalog of known firmware builds and of the listing page validators, so a sync only
+# refetches the listing when it changed and only reports builds that were not seen before.
+
+CATALOG_PATH = "firmware_catalog.db"
+
+# Build codenames used in Oculus/Meta OTA file names
+DEVICE_CODENAMES = {
+    "monterey": "q1",
+    "hollywood": "q2",
+    "eureka": "q3",
+    "panther": "q3s",
+    "seacliff": "qpro",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS listing (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    fetched_at REAL
+);
+CREATE TABLE IF NOT EXISTS firmware (
+    url TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    size INTEGER,
+    etag TEXT,
+    last_modified TEXT,
+    sha256 TEXT,
+    device TEXT,
+    version INTEGER,
+    first_seen REAL NOT NULL,
+    downloaded_at REAL
+);
+CREATE INDEX IF NOT EXISTS firmware_device_version ON firmware (device, version);
+"""
+
+def parse_firmware_filename(filename):
+    """
+    Best-effort (device, version) from a firmware file name, e.g. "q2_v50_..." -> ("q2", 50) or
+    "hollywood_..._51154110129000520.zip" -> ("q2", 51154110129000520). Unknown parts are None.
+    """
+    name = filename.lower()
+    match = re.match(r"([a-z0-9]+?)_v(\d+)", name)
+    if match:
+        return match.group(1), int(match.group(2))
+    device = next((short for codename, short in DEVICE_CODENAMES.items() if codename in name), None)
+    numbers = re.findall(r"\d{2,}", os.path.splitext(name)[0])
+    version = int(max(numbers, key=len)) if numbers else None
+    return device, version
+
+class FirmwareCatalog:
+    def __init__(self, path=CATALOG_PATH):
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def listing_validators(self, url):
+        """
+        Returns the conditional GET headers for a listing page fetched before.
+        """
+        row = self.conn.execute("SELECT etag, last_modified FROM listing WHERE url = ?", (url,)).fetchone()
+        headers = {}
+        if row and row[0]:
+            headers["If-None-Match"] = row[0]
+        if row and row[1]:
+            headers["If-Modified-Since"] = row[1]
+        return headers
+
+    def record_listing(self, url, response):
+        self.conn.execute("INSERT OR REPLACE INTO listing VALUES (?, ?, ?, ?)",
+                          (url, response.headers.get("ETag"), response.headers.get("Last-Modified"), time.time()))
+        self.conn.commit()
+
+    def known_urls(self):
+        return {row[0] for row in self.conn.execute("SELECT url FROM firmware")}
+
+    def add_new(self, urls):
+        """
+        Adds the urls that are not in the catalog yet and returns them (the delta), in page order.
+        """
+        known = self.known_urls()
+        delta = [url for url in urls if url not in known]
+        now = time.time()
+        for url in delta:
+            filename = unquote(os.path.basename(urlparse(url).path))
+            device, version = parse_firmware_filename(filename)
+            self.conn.execute(
+                "INSERT INTO firmware (url, filename, device, version, first_seen) VALUES (?, ?, ?, ?, ?)",
+                (url, filename, device, version, now))
+        self.conn.commit()
+        return delta
+
+    def pending(self):
+        """
+        Returns the urls of cataloged builds that have not been downloaded yet.
+        """
+        return [row[0] for row in self.conn.execute(
+            "SELECT url FROM firmware WHERE downloaded_at IS NULL ORDER BY first_seen, url")]
+
+    def record_download(self, url, size, etag=None, last_modified=None, sha256=None):
+        self.conn.execute(
+            "UPDATE firmware SET size = ?, etag = ?, last_modified = ?, sha256 = COALESCE(?, sha256), "
+            "downloaded_at = ? WHERE url = ?", (size, etag, last_modified, sha256, time.time(), url))
+        self.conn.commit()
+
+    def requeue(self, url):
+        """
+        Marks a build as not downloaded, e.g. after its local copy failed verification.
+        """
+        self.conn.execute("UPDATE firmware SET sha256 = NULL, downloaded_at = NULL WHERE url = ?", (url,))
+        self.conn.commit()
@@ -0,0 +1,237 @@
+import hashlib
+import json
+import os
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import unquote, urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from integrity import check_zip, hash_into, verify_files
+
+DEFAULT_WORKERS = 4
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+TIMEOUT = (10, 60)  # (connect, read) seconds
+MAX_ATTEMPTS = 3  # Downloads of a file that keeps failing verification
+
+class CorruptDownloadError(IOError):
+    pass
+
+def content_range_total(value):
+    """
+    Returns the complete length from a Content-Range header ("bytes 0-0/N" or "bytes */N"), or None.
+    """
+    total = (value or "").rpartition("/")[2]
+    return int(total) if total.isdigit() else None
+
+class DownloadManager:
+    """
+    Concurrent, resumable downloader. Each file is streamed to <name>.part, resumed with an HTTP
+    Range request when interrupted, and renamed once complete. A <name>.meta.json sidecar keeps the
+    ETag, Last-Modified, Content-Length and SHA-256 (hashed while downloading) so complete files
+    are skipped on the next sync. ZIP archives are checked before they are renamed.
+    """
+    def __init__(self, save_dir, max_workers=DEFAULT_WORKERS, chunk_size=DEFAULT_CHUNK_SIZE, session=None,
+                 metrics=None):
+        self.save_dir = save_dir
+        self.metrics = metrics
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        os.makedirs(save_dir, exist_ok=True)
+        self.session = session or self._make_session()
+
+    def _make_session(self):
+        session = requests.Session()
+        retries = Retry(total=5, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504],
+                        allowed_methods=["HEAD", "GET"])
+        adapter = HTTPAdapter(pool_connections=self.max_workers, pool_maxsize=self.max_workers, max_retries=retries)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def log(self, message):
+        # With metrics the console only gets their throttled progress line, not one line per file
+        if self.metrics is None:
+            print(message)
+
+    def local_path(self, url):
+        return os.path.join(self.save_dir, unquote(os.path.basename(urlparse(url).path)))
+
+    def read_meta(self, local_filename):
+        try:
+            with open(local_filename + ".meta.json") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def write_meta(self, local_filename, meta):
+        with open(local_filename + ".meta.json", "w") as f:
+            json.dump(meta, f, indent=2)
+
+    def remote_info(self, url):
+        """
+        Returns (content_length, etag, last_modified, accepts_ranges) from a HEAD request, or from a
+        one-byte ranged GET on servers that don't allow HEAD.
+        """
+        response = self.session.head(url, allow_redirects=True, timeout=TIMEOUT)
+        if response.status_code in (405, 501):
+            with self.session.get(url, headers={"Range": "bytes=0-0"}, stream=True, timeout=TIMEOUT) as response:
+                response.raise_for_status()
+                if response.status_code == 206:
+                    return (content_range_total(response.headers.get("Content-Range")), response.headers.get("ETag"),
+                            response.headers.get("Last-Modified"), True)
+                length = response.headers.get("Content-Length")
+                return (int(length) if length is not None else None, response.headers.get("ETag"),
+                        response.headers.get("Last-Modified"), False)
+        response.raise_for_status()
+        length = response.headers.get("Content-Length")
+        return (int(length) if length is not None else None, response.headers.get("ETag"),
+                response.headers.get("Last-Modified"), response.headers.get("Accept-Ranges", "").lower() == "bytes")
+
+    def is_complete(self, local_filename, meta, length, etag):
+        if not os.path.exists(local_filename) or not meta.get("complete"):
+            return False
+        if length is not None and os.path.getsize(local_filename) != length:
+            return False
+        return etag is None or meta.get("etag") == etag
+
+    def download(self, url, consumer=None):
+        """
+        Downloads one file. Returns "skipped", "resumed" or "downloaded". An optional consumer gets
+        consumer.start(part_file, offset) once the transfer starts, consumer.chunk(part_file, data)
+        after each chunk is written and consumer.finish(part_file) before the file is renamed, so it
+        can process the file while it is still downloading.
+        """
+        local_filename = self.local_path(url)
+        part_filename = local_filename + ".part"
+        length, etag, last_modified, accepts_ranges = self.remote_info(url)
+        meta = self.read_meta(local_filename)
+
+        if self.is_complete(local_filename, meta, length, etag):
+            self.log(f"Up to date: {local_filename}")
+            return "skipped"
+
+        offset = 0
+        headers = {}
+        # Resuming needs a validator for If-Range, otherwise a changed file would be spliced
+        validator = etag or last_modified
+        if (accepts_ranges and validator and os.path.exists(part_filename) and meta.get("etag") == etag
+                and meta.get("last_modified") == last_modified):
+            offset = os.path.getsize(part_filename)
+            headers["Range"] = f"bytes={offset}-"
+            headers["If-Range"] = validator
+        self.write_meta(local_filename, {"url": url, "etag": etag, "last_modified": last_modified,
+                                         "content_length": length, "complete": False})
+
+        self.log(f"Downloading {url}" + (f" from byte {offset}" if offset else "") + "...")
+        with self.session.get(url, stream=True, headers=headers, timeout=TIMEOUT) as response:
+            # 416: nothing left after our offset, the .part is complete if it has the remote size
+            complete = offset and response.status_code == 416
+            if complete:
+                total = content_range_total(response.headers.get("Content-Range"))
+                if offset != (total if total is not None else length):
+                    # Bigger than the remote file, which must have changed: start over
+                    os.remove(part_filename)
+                    return self.download(url, consumer)
+            else:
+                response.raise_for_status()
+                if offset and response.status_code != 206:
+                    # Server ignored the range (or the file changed), start over
+                    offset = 0
+            with open(part_filename, "ab" if offset else "wb") as f:
+                if consumer is not None:
+                    consumer.start(part_filename, offset)
+                # Resumed download: hash the bytes already on disk first
+                digest = hash_into(hashlib.sha256(), part_filename) if offset else hashlib.sha256()
+                for chunk in () if complete else response.iter_content(chunk_size=self.chunk_size):
+                    f.write(chunk)
+                    digest.update(chunk)
+                    if consumer is not None:
+                        f.flush()
+                        consumer.chunk(part_filename, chunk)
+
+        size = os.path.getsize(part_filename)
+        if length is not None and size != length:
+            raise IOError(f"Incomplete download of {url}: {size} of {length} bytes")
+        error = check_zip(part_filename) if local_filename.lower().endswith(".zip") else None
+        if error:
+            # Start over on the next attempt instead of resuming corrupt data
+            os.remove(part_filename)
+            raise CorruptDownloadError(f"Corrupt archive {url}: {error}")
+        if consumer is not None:
+            consumer.finish(part_filename)
+        os.replace(part_filename, local_filename)
+        self.write_meta(local_filename, {"url": url, "etag": etag, "last_modified": last_modified,
+                                         "content_length": size, "sha256": digest.hexdigest(), "complete": True})
+        self.log(f"Saved: {local_filename}")
+        return "resumed" if offset else "downloaded"
+
+    def download_verified(self, url):
+        """
+        Downloads url again from scratch while the result fails verification.
+        """
+        name = os.path.basename(self.local_path(url))
+        timer = (self.metrics.timed_item("download", name, firmware=os.path.splitext(name)[0])
+                 if self.metrics else nullcontext({}))
+        with timer as counters:
+            for attempt in range(1, MAX_ATTEMPTS + 1):
+                try:
+                    status = self.download(url)
+                except CorruptDownloadError as e:
+                    if attempt == MAX_ATTEMPTS:
+                        raise
+                    print(f"{e}, re-queued (attempt {attempt + 1} of {MAX_ATTEMPTS})")
+                    continue
+                if status != "skipped":
+                    counters["bytes_written"] = os.path.getsize(self.local_path(url))
+                return status
+
+    def verify(self, max_workers=None):
+        """
+        Re-hashes every complete download in parallel and checks its ZIP structure. Corrupt files
+        (hash differs from the one recorded at download time, or broken archive) are deleted so the
+        next sync downloads them again. Returns the urls of the corrupt files.
+        """
+        metas = {}
+        for name in os.listdir(self.save_dir):
+            if name.endswith(".meta.json"):
+                local_filename = os.path.join(self.save_dir, name[:-len(".meta.json")])
+                meta = self.read_meta(local_filename)
+                if meta.get("complete") and os.path.exists(local_filename):
+                    metas[local_filename] = meta
+
+        corrupt = []
+        for local_filename, (sha256, error) in verify_files(list(metas), max_workers).items():
+            meta = metas[local_filename]
+            if error is None and meta.get("sha256") not in (None, sha256):
+                error = "SHA-256 mismatch"
+            if error is None:
+                if meta.get("sha256") is None:
+                    meta["sha256"] = sha256
+                    self.write_meta(local_filename, meta)
+                continue
+            print(f"Corrupt: {local_filename} ({error})")
+            os.remove(local_filename)
+            os.remove(local_filename + ".meta.json")
+            corrupt.append(meta["url"])
+        print(f"Verified {len(metas)} files, {len(corrupt)} corrupt")
+        return corrupt
+
+    def download_all(self, urls, on_done=None):
+        """
+        Downloads urls over a bounded pool of connections. Returns {url: status or error message}.
+        on_done(url, status) is called as each download finishes, while the others go on.
+        """
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {pool.submit(self.download_verified, url): url for url in urls}
+            for future in as_completed(futures):
+                url = futures[future]
+                try:
+                    results[url] = future.result()
+                except (requests.RequestException, OSError) as e:
+                    print(f"Failed to download {url}: {e}")
+                    results[url] = f"failed: {e}"
+                if on_done is not None:
+                    on_done(url, results[url])
+        return results
@@ -0,0 +1,57 @@
+import hashlib
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+HASH_BUFFER = 8 * 1024 * 1024  # Multiple of the page size, reused for every read
+LOCAL_HEADER_MAGIC = b"PK\x03\x04"
+
+def hash_into(digest, path, buffer_size=HASH_BUFFER):
+    """
+    Feeds a file to digest, read sequentially into one preallocated buffer (no per-read allocation).
+    """
+    buffer = bytearray(buffer_size)
+    view = memoryview(buffer)
+    with open(path, "rb", buffering=0) as f:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            digest.update(view[:n])
+    return digest
+
+def sha256_file(path, buffer_size=HASH_BUFFER):
+    return hash_into(hashlib.sha256(), path, buffer_size).hexdigest()
+
+def check_zip(path):
+    """
+    Checks the ZIP end of central directory record, the central directory and that every member
+    starts with a local header inside the archive. Returns None if consistent, else the error.
+    """
+    try:
+        with zipfile.ZipFile(path) as zf, open(path, "rb") as f:
+            for info in zf.infolist():
+                if info.header_offset + info.compress_size > zf.start_dir:
+                    return f"{info.filename} overlaps the central directory"
+                f.seek(info.header_offset)
+                if f.read(4) != LOCAL_HEADER_MAGIC:
+                    return f"Bad local header for {info.filename}"
+    except (zipfile.BadZipFile, OSError, ValueError) as e:
+        return str(e)
+    return None
+
+def verify_file(path):
+    """
+    Worker: returns (path, sha256, zip error or None).
+    """
+    error = check_zip(path) if path.lower().endswith(".zip") else None
+    return path, sha256_file(path), error
+
+def verify_files(paths, max_workers=None):
+    """
+    Re-hashes and checks files in parallel, one file per worker. Returns {path: (sha256, error)}.
+    """
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        return {path: (sha256, error) for path, sha256, error in pool.map(verify_file, paths)}
@@ -1,6 +1,17 @@
+import argparse
 import os
+import shlex
+import subprocess
+import sys
 import requests
+from urllib.parse import urljoin, urlparse
 from bs4 import BeautifulSoup
+from catalog import CATALOG_PATH, FirmwareCatalog
+from downloader import DEFAULT_CHUNK_SIZE, DEFAULT_WORKERS, DownloadManager
+from stream_pipeline import StreamingExtractor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Common"))
+from pipeline_metrics import PipelineMetrics
 
 # URL of the page to scrape
 BASE_URL = "https://cocaine.trade/Quest_2_firmware"
@@ -8,56 +19,111 @@ BASE_URL = "https://cocaine.trade/Quest_2_firmware"
 # Directory to save the downloaded firmware files
 DOWNLOAD_DIR = "firmwares"
 
-# Create the download directory if it doesn't exist
-os.makedirs(DOWNLOAD_DIR, exist_ok=True)
+# Extensions of the firmware files linked from the page
+FIRMWARE_EXTENSIONS = (".zip",)
 
-def get_firmware_links(url):
+def fetch_listing(url, catalog):
     """
-    Parses the webpage to find firmware download links.
+    Conditional GET of the listing page. Returns the page content, or None when it is unchanged
+    since the last run (304) or could not be fetched.
     """
-    response = requests.get(url)
+    response = requests.get(url, headers=catalog.listing_validators(url))
+    if response.status_code == 304:
+        print("Listing page not modified since the last run.")
+        return None
     if response.status_code != 200:
         print(f"Failed to fetch the webpage. Status code: {response.status_code}")
-        return []
+        return None
+    catalog.record_listing(url, response)
+    return response.content
+
+def parse_firmware_links(content, url):
+    soup = BeautifulSoup(content, "html.parser")
 
-    soup = BeautifulSoup(response.content, "html.parser")
-    
     # Find all links on the page
     links = soup.find_all("a")
-    
-    # Filter links to get only firmware files (assuming they end with .zip or similar)
-    firmware_links = [link["href"] for link in links if link.get("href") and link["href"].startswith("http")]
-    return firmware_links
 
-def download_file(url, save_dir):
-    """
-    Downloads a file from the given URL and saves it in the specified directory.
-    """
-    local_filename = os.path.join(save_dir, url.split("/")[-1])
-    print(f"Downloading {url}...")
-    
-    with requests.get(url, stream=True) as response:
-        if response.status_code == 200:
-            with open(local_filename, "wb") as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-            print(f"Saved: {local_filename}")
-        else:
-            print(f"Failed to download {url}. Status code: {response.status_code}")
+    # Keep only firmware files, resolving relative links against the page URL
+    firmware_links = []
+    for link in links:
+        href = link.get("href")
+        if not href:
+            continue
+        absolute = urljoin(url, href)
+        parsed = urlparse(absolute)
+        if parsed.scheme in ("http", "https") and parsed.path.lower().endswith(FIRMWARE_EXTENSIONS):
+            if absolute not in firmware_links:
+                firmware_links.append(absolute)
+    return firmware_links
 
 def main():
-    # Step 1: Get all firmware links
-    firmware_links = get_firmware_links(BASE_URL)
-    if not firmware_links:
-        print("No firmware links found!")
+    parser = argparse.ArgumentParser(description="Download new firmware files linked from a listing page")
+    parser.add_argument("--url", default=BASE_URL, help="Listing page to scrape")
+    parser.add_argument("--dir", default=DOWNLOAD_DIR, help="Download directory")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Parallel downloads")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Bytes per read")
+    parser.add_argument("--catalog", default=CATALOG_PATH, help="SQLite catalog of known firmware")
+    parser.add_argument("--all", action="store_true", help="Sync every cataloged firmware, not only new ones")
+    parser.add_argument("--on-new", help="Command run with the path of each newly downloaded firmware")
+    parser.add_argument("--verify", action="store_true",
+                        help="Re-hash and check the downloaded archives first, corrupt ones are downloaded again")
+    parser.add_argument("--extract", action="store_true",
+                        help="Extract the OTA members (and build the partition images) while downloading")
+    parser.add_argument("--payload-extractor", help="With --extract, OTA extractor command run on payload.bin")
+    args = parser.parse_args()
+
+    catalog = FirmwareCatalog(args.catalog)
+    metrics = PipelineMetrics("scraper.py")
+
+    # Step 1: Get the firmware links if the listing changed and add the new ones to the catalog
+    with metrics.stage("listing"):
+        content = fetch_listing(args.url, catalog)
+        if content is not None:
+            firmware_links = parse_firmware_links(content, args.url)
+            new_links = catalog.add_new(firmware_links)
+            print(f"Found {len(firmware_links)} firmware links, {len(new_links)} new.")
+
+    if args.extract:
+        manager = StreamingExtractor(args.dir, max_workers=args.workers, chunk_size=args.chunk_size,
+                                     payload_extractor=args.payload_extractor, metrics=metrics)
+    else:
+        manager = DownloadManager(args.dir, max_workers=args.workers, chunk_size=args.chunk_size, metrics=metrics)
+    if args.verify:
+        with metrics.stage("verify"):
+            for url in manager.verify():
+                catalog.requeue(url)
+
+    # Step 2: Download new (and previously failed or corrupt) builds, skipping complete files and resuming partial ones
+    urls = sorted(catalog.known_urls()) if args.all else catalog.pending()
+    if not urls:
+        print("No new firmware.")
+        catalog.close()
         return
 
-    print(f"Found {len(firmware_links)} firmware links.")
+    pending = set(catalog.pending())
+
+    # Step 3: Record each download and hand a new build over to the extraction step as soon as it
+    # is complete, while the other downloads go on
+    def on_done(url, status):
+        if status not in ("downloaded", "resumed", "skipped"):
+            return
+        local_filename = manager.local_path(url)
+        meta = manager.read_meta(local_filename)
+        catalog.record_download(url, os.path.getsize(local_filename), meta.get("etag"), meta.get("last_modified"),
+                                meta.get("sha256"))
+        if url not in pending:
+            return
+        print(f"New firmware: {local_filename}")
+        if args.on_new:
+            subprocess.run(shlex.split(args.on_new) + [local_filename])
 
-    # Step 2: Download each firmware file
-    for link in firmware_links:
-        download_file(link, DOWNLOAD_DIR)
+    with metrics.stage("download"):
+        results = manager.download_all(urls, on_done)
+    for status in ("downloaded", "resumed", "skipped"):
+        print(f"{status.title()}: {sum(1 for r in results.values() if r == status)}")
+    failed = [url for url, r in results.items() if r.startswith("failed")]
+    print(f"Failed: {len(failed)}")
+    catalog.close()
 
 if __name__ == "__main__":
     main()
-
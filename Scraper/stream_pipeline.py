@@ -0,0 +1,315 @@
+import argparse
+import fnmatch
+import io
+import os
+import shlex
+import struct
+import subprocess
+import sys
+import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from downloader import DEFAULT_CHUNK_SIZE, DEFAULT_WORKERS, TIMEOUT, DownloadManager
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Extractor"))
+from sdat2img_stream import convert
+
+# Download-to-extract pipeline: the ZIP central directory is read from the tail of the remote file
+# first, so each needed member is extracted by a worker as soon as its bytes have been downloaded.
+
+# OTA members used by firmware_extractor.sh, boot_extractor.sh and boot_image.py
+NEEDED_MEMBERS = ("payload.bin", "payload_properties.txt", "*.new.dat.br", "*.new.dat", "*.transfer.list",
+                  "boot.img", "vendor_boot.img", "dtbo.img", "*.img")
+# Written to the firmware folder once every needed member is extracted and converted, so that
+# firmware_extractor.sh can tell a finished folder from an interrupted one
+EXTRACTED_MARKER = ".extracted"
+
+TAIL_SIZE = 256 * 1024  # First tail request, covers the EOCD record and its max-size comment
+LOCAL_HEADER = struct.Struct("<4s5H3I2H")
+LOCAL_HEADER_MAGIC = b"PK\x03\x04"
+EXTRACT_CHUNK = 4 * 1024 * 1024
+
+class MissingData(Exception):
+    def __init__(self, offset):
+        super().__init__(f"Byte {offset} not fetched yet")
+        self.offset = offset
+
+class TailBuffer(io.RawIOBase):
+    """
+    Seekable file of `size` bytes of which only the bytes from `start` on are known. Reading
+    before `start` raises MissingData, so the caller can fetch more of the tail and retry.
+    """
+    def __init__(self, size, start, data):
+        self.size = size
+        self.start = start
+        self.data = data
+        self.pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, pos, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.pos, io.SEEK_END: self.size}[whence]
+        self.pos = max(base + pos, 0)
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+    def readinto(self, buffer):
+        if self.pos >= self.size:
+            return 0
+        if self.pos < self.start:
+            raise MissingData(self.pos)
+        data = self.data[self.pos - self.start:self.pos - self.start + len(buffer)]
+        buffer[:len(data)] = data
+        self.pos += len(data)
+        return len(data)
+
+def fetch_range(session, url, start, end):
+    response = session.get(url, headers={"Range": f"bytes={start}-{end - 1}"}, timeout=TIMEOUT)
+    response.raise_for_status()
+    if response.status_code != 206:
+        raise IOError(f"Server ignored the range request for {url}")
+    return response.content
+
+def read_remote_directory(session, url, length):
+    """
+    Reads the central directory of a remote ZIP with Range requests on its tail.
+    Returns (infos, start_dir) where start_dir is the offset of the central directory.
+    """
+    start = max(length - TAIL_SIZE, 0)
+    data = fetch_range(session, url, start, length)
+    while True:
+        try:
+            with zipfile.ZipFile(TailBuffer(length, start, data)) as zf:
+                return zf.infolist(), zf.start_dir
+        except MissingData as e:
+            data = fetch_range(session, url, e.offset, start) + data
+            start = e.offset
+
+def is_needed(name):
+    return any(fnmatch.fnmatch(os.path.basename(name), pattern) for pattern in NEEDED_MEMBERS)
+
+def member_ends(infos, start_dir):
+    """
+    Returns {name: offset} of the first byte after each member (local header, data and data
+    descriptor), which is where the next member or the central directory begins.
+    """
+    ordered = sorted(infos, key=lambda info: info.header_offset)
+    bounds = [info.header_offset for info in ordered[1:]] + [start_dir]
+    return {info.filename: end for info, end in zip(ordered, bounds)}
+
+def extract_member(archive, header_offset, compress_type, compress_size, crc, dest):
+    """
+    Worker: extracts one stored or deflated member from a (possibly still downloading) archive.
+    """
+    with open(archive, "rb") as f:
+        f.seek(header_offset)
+        header = LOCAL_HEADER.unpack(f.read(LOCAL_HEADER.size))
+        if header[0] != LOCAL_HEADER_MAGIC:
+            raise ValueError(f"Bad local header at {header_offset} in {archive}")
+        f.seek(header[9] + header[10], io.SEEK_CUR)
+
+        if compress_type == zipfile.ZIP_DEFLATED:
+            decompressor = zlib.decompressobj(-15)
+        elif compress_type != zipfile.ZIP_STORED:
+            raise NotImplementedError(f"Compression method {compress_type} in {archive}")
+        else:
+            decompressor = None
+
+        checksum = 0
+        remaining = compress_size
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        with open(dest, "wb") as out:
+            while remaining:
+                data = f.read(min(remaining, EXTRACT_CHUNK))
+                if not data:
+                    raise ValueError(f"{archive} ended inside {os.path.basename(dest)}")
+                remaining -= len(data)
+                if decompressor is not None:
+                    data = decompressor.decompress(data)
+                checksum = zlib.crc32(data, checksum)
+                out.write(data)
+            if decompressor is not None:
+                data = decompressor.flush()
+                checksum = zlib.crc32(data, checksum)
+                out.write(data)
+    if checksum != crc:
+        raise ValueError(f"CRC mismatch for {dest}")
+    return dest
+
+def convert_partition(transfer_list, dat_path, img_path):
+    """
+    Worker: builds a partition image from its transfer list and (brotli) dat stream.
+    """
+    convert(transfer_list, dat_path, img_path)
+    return img_path
+
+def run_payload_extractor(command, folder):
+    """
+    Worker: runs the OTA payload extractor on the payload.bin of folder.
+    """
+    subprocess.run(shlex.split(command) + ["payload.bin"], cwd=folder, check=True)
+    return os.path.join(folder, "payload.bin")
+
+class ArchiveJob:
+    """
+    Download consumer for one firmware ZIP: submits each needed member to the pool once it is
+    complete on disk, then the partition conversions.
+    """
+    def __init__(self, pool, folder, infos=None, start_dir=None, payload_extractor=None, log=print):
+        self.pool = pool
+        self.folder = folder
+        self.payload_extractor = payload_extractor
+        self.log = log
+        self.written = 0
+        self.futures = {}
+        self.extracted = set()
+        self.errors = []
+        self.set_directory(infos, start_dir)
+
+    def set_directory(self, infos, start_dir):
+        self.directory = infos
+        self.pending = []
+        if infos is None:
+            return
+        ends = member_ends(infos, start_dir)
+        self.pending = sorted(((ends[info.filename], info) for info in infos if is_needed(info.filename)),
+                              key=lambda item: item[0])
+
+    def start(self, part_filename, offset):
+        # A new transfer makes an earlier extraction stale
+        marker = os.path.join(self.folder, EXTRACTED_MARKER)
+        if os.path.exists(marker):
+            os.remove(marker)
+        # Resumed download: members already on disk can start right away
+        self.written = offset
+        self.submit_ready(part_filename)
+
+    def chunk(self, part_filename, data):
+        self.written += len(data)
+        self.submit_ready(part_filename)
+        self.collect(block=False)
+
+    def finish(self, part_filename):
+        if self.directory is None:
+            # No range support, the directory is only known once the whole archive is here
+            try:
+                with zipfile.ZipFile(part_filename) as zf:
+                    self.set_directory(zf.infolist(), zf.start_dir)
+            except zipfile.BadZipFile as e:
+                raise IOError(f"{part_filename}: {e}")
+            self.submit_ready(part_filename)
+        self.collect(block=True)
+
+    def submit_ready(self, archive):
+        while self.pending and self.pending[0][0] <= self.written:
+            _, info = self.pending.pop(0)
+            dest = os.path.join(self.folder, os.path.basename(info.filename))
+            future = self.pool.submit(extract_member, archive, info.header_offset, info.compress_type,
+                                      info.compress_size, info.CRC, dest)
+            self.futures[future] = ("extraction of", os.path.basename(info.filename))
+
+    def collect(self, block):
+        """
+        Handles finished workers, starting the conversions whose inputs are now all extracted.
+        """
+        while self.futures:
+            done, _ = wait(self.futures, timeout=None if block else 0, return_when=FIRST_COMPLETED)
+            if not done:
+                return
+            for future in done:
+                kind, name = self.futures.pop(future)
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"{self.folder}: {kind} {name} failed: {e}")
+                    self.errors.append(name)
+                    continue
+                self.log(f"{self.folder}: {kind} {name} done")
+                if kind == "extraction of":
+                    self.extracted.add(name)
+                    self.submit_followups(name)
+            if not block:
+                return
+
+    def submit_followups(self, name):
+        if name == "payload.bin" and self.payload_extractor:
+            future = self.pool.submit(run_payload_extractor, self.payload_extractor, self.folder)
+            self.futures[future] = ("payload extraction of", name)
+            return
+        for suffix in (".new.dat.br", ".new.dat", ".transfer.list"):
+            if name.endswith(suffix):
+                partition = name[:-len(suffix)]
+                break
+        else:
+            return
+        transfer_list = f"{partition}.transfer.list"
+        dat = next((f"{partition}{suffix}" for suffix in (".new.dat.br", ".new.dat")
+                    if f"{partition}{suffix}" in self.extracted), None)
+        if transfer_list in self.extracted and dat:
+            future = self.pool.submit(convert_partition, os.path.join(self.folder, transfer_list),
+                                      os.path.join(self.folder, dat), os.path.join(self.folder, f"{partition}.img"))
+            self.futures[future] = ("conversion of", partition)
+
+class StreamingExtractor(DownloadManager):
+    """
+    DownloadManager that extracts the OTA members of each firmware ZIP into <dir>/<zip name>/
+    while the ZIP is still downloading. Extraction and conversions share one process pool.
+    """
+    def __init__(self, save_dir, max_workers=DEFAULT_WORKERS, chunk_size=DEFAULT_CHUNK_SIZE, session=None,
+                 extract_workers=None, payload_extractor=None, metrics=None):
+        super().__init__(save_dir, max_workers, chunk_size, session, metrics)
+        self.extract_workers = extract_workers or os.cpu_count()
+        self.payload_extractor = payload_extractor
+        self.pool = None
+
+    def download_all(self, urls, on_done=None):
+        with ProcessPoolExecutor(max_workers=self.extract_workers) as self.pool:
+            return super().download_all(urls, on_done)
+
+    def download(self, url, consumer=None):
+        local_filename = self.local_path(url)
+        folder = os.path.splitext(local_filename)[0]
+
+        length, _, _, accepts_ranges = self.remote_info(url)
+        infos = start_dir = None
+        if accepts_ranges and length:
+            try:
+                infos, start_dir = read_remote_directory(self.session, url, length)
+            except zipfile.BadZipFile as e:
+                raise IOError(f"{url}: {e}")
+            self.log(f"{os.path.basename(local_filename)}: {sum(map(is_needed, (i.filename for i in infos)))} "
+                     f"members to extract while downloading")
+        job = ArchiveJob(self.pool, folder, infos, start_dir, self.payload_extractor, self.log)
+
+        status = super().download(url, job)
+        if status == "skipped":
+            return status
+        if job.errors:
+            print(f"Extraction incomplete in {folder}: {', '.join(job.errors)} failed")
+        else:
+            os.makedirs(folder, exist_ok=True)
+            open(os.path.join(folder, EXTRACTED_MARKER), "w").close()
+        return status
+
+def main():
+    parser = argparse.ArgumentParser(description="Download firmware ZIPs and extract them while downloading")
+    parser.add_argument("urls", nargs="+")
+    parser.add_argument("--dir", default="firmwares", help="Download directory")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Parallel downloads")
+    parser.add_argument("--extract-workers", type=int, help="Extraction processes (default: CPU count)")
+    parser.add_argument("--payload-extractor", help="OTA extractor command run on payload.bin")
+    args = parser.parse_args()
+
+    manager = StreamingExtractor(args.dir, max_workers=args.workers, extract_workers=args.extract_workers,
+                                 payload_extractor=args.payload_extractor)
+    for url, status in manager.download_all(args.urls).items():
+        print(f"{status}: {url}")
+
+if __name__ == "__main__":
+    main()